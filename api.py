@@ -0,0 +1,334 @@
+import hmac
+from datetime import datetime, timezone
+from flask import Blueprint, Response, abort, current_app, request, url_for
+import scheduling
+from queries import search_entities, encode_cursor, decode_cursor, ShowFilters
+from serializers import Serializer, dumps
+from models import (
+  db,
+  VenueGenre,
+  Venue,
+  ArtistGenre,
+  Artist,
+  Show
+)
+
+#----------------------------------------------------------------------------#
+# JSON API, mounted at /api/v1.
+#
+# Venues and artists come out in the shape of their to_dictionary(), shows
+# in the shape of Show.to_dictionary() plus the names and images of both
+# sides. Every list takes ?limit= and a keyset ?after= (the "next" link
+# carries it), ?fields=a,b picks a sparse fieldset, and on venues/artists
+# ?embed=shows adds past_shows/upcoming_shows. Only the selected columns are
+# read, and a page needs at most three queries: the rows, their genres and
+# their shows.
+#
+# POST /shows schedules a batch of shows (see scheduling.py); it is the one
+# write, and needs the API_WRITE_TOKEN bearer token.
+#----------------------------------------------------------------------------#
+
+api = Blueprint('api', __name__, url_prefix='/api/v1')
+
+VENUE_FIELDS = Serializer((
+  ('id', Venue.id),
+  ('name', Venue.name),
+  ('genres', None),
+  ('address', Venue.address),
+  ('city', Venue.city),
+  ('state', Venue.state),
+  ('phone', Venue.phone),
+  ('website', Venue.website),
+  ('facebook_link', Venue.facebook_link),
+  ('seeking_talent', Venue.seeking_talent),
+  ('seeking_description', Venue.seeking_description),
+  ('image_link', Venue.image_link),
+  ('created_date', Venue.created_date),
+  ('past_shows_count', Venue.num_past_shows),
+  ('upcoming_shows_count', Venue.num_upcoming_shows)
+), key=Venue.id)
+
+ARTIST_FIELDS = Serializer((
+  ('id', Artist.id),
+  ('name', Artist.name),
+  ('genres', None),
+  ('city', Artist.city),
+  ('state', Artist.state),
+  ('phone', Artist.phone),
+  ('website', Artist.website),
+  ('facebook_link', Artist.facebook_link),
+  ('seeking_venue', Artist.seeking_venue),
+  ('seeking_description', Artist.seeking_description),
+  ('image_link', Artist.image_link),
+  ('created_date', Artist.created_date),
+  ('past_shows_count', Artist.num_past_shows),
+  ('upcoming_shows_count', Artist.num_upcoming_shows)
+), key=Artist.id)
+
+
+def _utc(value):
+  # SQLite gives back naive datetimes
+  if value is not None and value.tzinfo is None:
+    return value.replace(tzinfo=timezone.utc)
+  return value
+
+
+SHOW_FIELDS = Serializer((
+  ('id', Show.id),
+  ('venue_id', Show.venue_id),
+  ('artist_id', Show.artist_id),
+  ('start_time', Show.start_time),
+  ('end_time', Show.end_time),
+  ('venue_name', Venue.name),
+  ('venue_image_link', Venue.image_link),
+  ('artist_name', Artist.name),
+  ('artist_image_link', Artist.image_link)
+), key=Show.id, convert={'start_time': _utc, 'end_time': _utc})
+
+# shows embedded in a venue/artist describe the other side, as on the pages
+EMBEDDED_SHOWS = {
+  'venues': SHOW_FIELDS.only(('venue_id', 'artist_id', 'start_time',
+                              'artist_name', 'artist_image_link')),
+  'artists': SHOW_FIELDS.only(('venue_id', 'artist_id', 'start_time',
+                               'venue_name', 'venue_image_link'))
+}
+
+# resource -> (model, serializer, genre model, genre owner column, show owner column)
+RESOURCES = {
+  'venues': (Venue, VENUE_FIELDS, VenueGenre, VenueGenre.venue_id, Show.venue_id),
+  'artists': (Artist, ARTIST_FIELDS, ArtistGenre, ArtistGenre.artist_id, Show.artist_id)
+}
+
+EMBEDS = ('shows',)
+
+
+def json_response(data, status=200):
+  return Response(dumps(data), status=status, mimetype='application/json')
+
+
+def http_error(error):
+  return json_response({'error': {'status': error.code, 'message': error.description}},
+                       status=error.code)
+
+# by status code, since the app's HTML handlers for these codes would
+# otherwise win over a blueprint handler for HTTPException
+for code in (400, 401, 403, 404, 405, 409, 422, 500):
+  api.register_error_handler(code, http_error)
+
+
+def _fields(serializer):
+  fields = request.args.get('fields')
+  if not fields:
+    return serializer
+  try:
+    return serializer.only(name.strip() for name in fields.split(',') if name.strip())
+  except ValueError as e:
+    abort(400, description=str(e))
+
+
+def _embed():
+  embed = {name for name in request.args.get('embed', '').split(',') if name}
+  unknown = embed.difference(EMBEDS)
+  if unknown:
+    abort(400, description=f"cannot embed {', '.join(sorted(unknown))}")
+  return embed
+
+
+def _limit():
+  limit = request.args.get('limit', current_app.config['API_PAGE_SIZE'], type=int)
+  return min(max(limit, 1), current_app.config['API_MAX_PAGE_SIZE'])
+
+
+def _next_link(endpoint, after, **values):
+  # carries the request's own query parameters over to the next page
+  args = request.args.to_dict()
+  args.update(values, after=after)
+  return url_for(endpoint, **args)
+
+
+def _show_query(serializer, *extra):
+  query = db.session.query(*serializer.columns, *extra).select_from(Show)
+  models = {column.class_ for column in serializer.columns}
+  if Venue in models:
+    query = query.join(Venue, Venue.id == Show.venue_id)
+  if Artist in models:
+    query = query.join(Artist, Artist.id == Show.artist_id)
+  return query
+
+
+def _serialize_entities(resource, serializer, rows, embed):
+  _, _, genre_model, genre_owner, show_owner = RESOURCES[resource]
+  items = serializer.rows(rows)
+  by_id = {row[0]: item for row, item in zip(rows, items)}
+  if not by_id:
+    return items
+
+  if 'genres' in serializer:
+    for item in items:
+      item['genres'] = []
+    genres = db.session.query(genre_owner, genre_model.category).filter(
+      genre_owner.in_(by_id)
+    ).order_by(genre_model.id)
+    for owner_id, category in genres:
+      by_id[owner_id]['genres'].append(category)
+
+  if 'shows' in embed:
+    for item in items:
+      item['past_shows'] = []
+      item['upcoming_shows'] = []
+    shows_serializer = EMBEDDED_SHOWS[resource]
+    shows = _show_query(shows_serializer, show_owner).filter(
+      show_owner.in_(by_id)
+    ).order_by(Show.start_time, Show.id).all()
+    current_time = datetime.now(timezone.utc)
+    for row in shows:
+      show = shows_serializer.row(row)
+      item = by_id[row[-1]]
+      upcoming = show['start_time'] >= current_time
+      item['upcoming_shows' if upcoming else 'past_shows'].append(show)
+    for item in items:
+      item['past_shows_count'] = len(item['past_shows'])
+      item['upcoming_shows_count'] = len(item['upcoming_shows'])
+  return items
+
+
+def _resource(resource):
+  if resource not in RESOURCES:
+    abort(404)
+  return RESOURCES[resource]
+
+
+@api.route('/<resource>')
+def list_entities(resource):
+  model, serializer, _, _, _ = _resource(resource)
+  serializer = _fields(serializer)
+  embed = _embed()
+  limit = _limit()
+  after = request.args.get('after', type=int)
+  try:
+    query = db.session.query(*serializer.columns)
+    if after is not None:
+      query = query.filter(model.id > after)
+    # one extra row tells us whether there is a next page
+    rows = query.order_by(model.id).limit(limit + 1).all()
+    more = len(rows) > limit
+    rows = rows[:limit]
+    data = _serialize_entities(resource, serializer, rows, embed)
+  finally:
+    db.session.close()
+  next_link = None
+  if more:
+    next_link = _next_link('.list_entities', rows[-1][0], resource=resource)
+  return json_response({'data': data, 'next': next_link})
+
+
+@api.route('/<resource>/<int:item_id>')
+def get_entity(resource, item_id):
+  model, serializer, _, _, _ = _resource(resource)
+  serializer = _fields(serializer)
+  embed = _embed()
+  try:
+    rows = db.session.query(*serializer.columns).filter(model.id == item_id).all()
+    data = _serialize_entities(resource, serializer, rows, embed)
+  finally:
+    db.session.close()
+  if not data:
+    abort(404, description=f'no {resource[:-1]} {item_id}')
+  return json_response({'data': data[0]})
+
+
+@api.route('/shows')
+def list_shows():
+  serializer = _fields(SHOW_FIELDS)
+  limit = _limit()
+  after = request.args.get('after')
+  if after is not None:
+    try:
+      after = decode_cursor(after)
+    except ValueError as e:
+      abort(400, description=str(e))
+  try:
+    filters = ShowFilters.from_args(request.args)
+  except ValueError as e:
+    abort(400, description=str(e))
+  upcoming = request.args.get('scope', 'upcoming') != 'all' and filters.start is None
+  try:
+    query = filters.apply(_show_query(serializer, Show.start_time))
+    if upcoming:
+      query = query.filter(Show.start_time >= datetime.now(timezone.utc))
+    if after is not None:
+      query = query.filter(db.tuple_(Show.start_time, Show.id) > after)
+    rows = query.order_by(Show.start_time, Show.id).limit(limit + 1).all()
+    more = len(rows) > limit
+    rows = rows[:limit]
+    data = serializer.rows(rows)
+  finally:
+    db.session.close()
+  next_link = None
+  if more:
+    last = rows[-1]
+    next_link = _next_link('.list_shows', encode_cursor(last[-1], last[0]))
+  return json_response({'data': data, 'next': next_link})
+
+
+@api.route('/shows', methods=['POST'])
+def schedule_shows():
+  # disabled unless an API_WRITE_TOKEN is configured
+  token = current_app.config.get('API_WRITE_TOKEN')
+  if not token:
+    abort(404)
+  supplied = request.headers.get('Authorization', '')
+  if not hmac.compare_digest(supplied.encode(), f'Bearer {token}'.encode()):
+    abort(401)
+  payload = request.get_json(silent=True)
+  entries = payload.get('shows') if isinstance(payload, dict) else None
+  if not isinstance(entries, list):
+    abort(400, description='expected {"shows": [...]}')
+  limit = current_app.config['SCHEDULE_MAX_SHOWS']
+  if len(entries) > limit:
+    abort(400, description=f'at most {limit} shows at a time')
+  try:
+    records = scheduling.schedule(scheduling.parse_bookings(entries))
+    db.session.commit()
+  except scheduling.ScheduleError as e:
+    db.session.rollback()
+    # 409 when the shows are valid but overlap others, 422 otherwise
+    status = 409 if isinstance(e, scheduling.ScheduleConflict) else 422
+    return json_response({'error': {
+      'status': status,
+      'message': str(e),
+      'shows': [{'index': index, 'errors': errors} for index, errors in sorted(e.errors.items())]
+    }}, status=status)
+  finally:
+    db.session.close()
+  return json_response({'data': {'scheduled': len(records),
+                                  'ids': [record['id'] for record in records]}}, status=201)
+
+
+@api.route('/shows/<int:show_id>')
+def get_show(show_id):
+  serializer = _fields(SHOW_FIELDS)
+  try:
+    row = _show_query(serializer).filter(Show.id == show_id).first()
+  finally:
+    db.session.close()
+  if row is None:
+    abort(404, description=f'no show {show_id}')
+  return json_response({'data': serializer.row(row)})
+
+
+@api.route('/search/<resource>')
+def search(resource):
+  model = _resource(resource)[0]
+  per_page = request.args.get('per_page', current_app.config['SEARCH_PAGE_SIZE'], type=int)
+  per_page = min(max(per_page, 1), current_app.config['SEARCH_MAX_PAGE_SIZE'])
+  page = max(request.args.get('page', 1, type=int), 1)
+  try:
+    results = search_entities(model, request.args.get('q', ''), page=page, per_page=per_page)
+  finally:
+    db.session.close()
+  return json_response(results)
+
+
+def init_app(app):
+  app.register_blueprint(api)
@@ -2,19 +2,22 @@
 # Imports
 #----------------------------------------------------------------------------#
 
-import sys
 import json
-import dateutil.parser
-import babel
+import functools
+import hmac
 from flask import (
   Flask,
   render_template,
   request,
   Response,
+  make_response,
   flash,
   redirect,
   url_for,
-  abort
+  abort,
+  session,
+  stream_with_context,
+  g
 )
 from flask_moment import Moment
 from flask_sqlalchemy import SQLAlchemy
@@ -27,8 +30,33 @@ from models import (
   Artist,
   Show
 )
-import logging
-from logging import Formatter, FileHandler
+from queries import (
+  venue_areas,
+  recent_entities,
+  search_entities,
+  entity_detail,
+  decode_cursor,
+  counterpart_ids,
+  ShowFilters,
+  ShowPage
+)
+import api
+import commands
+import database
+import logs
+import metrics
+import profiler
+import search
+import templating
+import cache
+import counters
+import exporter
+import formatting
+import fragments
+import ids
+import scheduling
+from cache import page_cache, page_key
+from versions import touch, entity_version, listing_version, shows_version, template_digest
 from flask_wtf import FlaskForm as Form
 from forms import *
 from datetime import datetime, timezone
@@ -43,22 +71,121 @@ app.config.from_object('config')
 # app.config['SQLALCHEMY_DATABASE_URI'] = 'postgresql://postgres@localhost:5432/fyyur'
 # avoid warning message
 app.config['SQLALCHEMY_TRACK_MODIFICATIONS'] = False
+logs.init_app(app)
 db.init_app(app)
+database.init_app(app)
 migrate = Migrate(app, db, compare_type=True)
+commands.init_app(app)
+metrics.init_app(app)
+profiler.init_app(app)
+api.init_app(app)
+search.init_app(app)
+cache.init_app(app)
+fragments.init_app(app)
+ids.init_app(app)
+templating.init_app(app)
 
 #----------------------------------------------------------------------------#
 # Filters.
 #----------------------------------------------------------------------------#
 
-def format_datetime(value, format='medium'):
-  date = dateutil.parser.parse(value)
-  if format == 'full':
-      format="EEEE MMMM, d, y 'at' h:mma"
-  elif format == 'medium':
-      format="EE MM, dd, y h:mma"
-  return babel.dates.format_datetime(date, format, locale='en')
+# 'datetime', see formatting.py
+formatting.init_app(app)
+
+#----------------------------------------------------------------------------#
+# Page cache.
+#----------------------------------------------------------------------------#
+
+# part of every ETag and page cache key, so pages rendered by older
+# templates are not reused
+template_version = template_digest(app)
+
+def page_etag(current):
+  return f'{current.etag}-{template_version}'
+
+def cached_page(category, id_arg, version):
+  # serve an entity page from the page cache, keyed by its id and the ETag
+  # of its current version (version is called with the id and returns a
+  # versions.Version or None), so a write made in any worker makes every
+  # worker miss. Under conditional_page the version it read and sent as
+  # the ETag is used, so a body is never served under a newer ETag.
+  def decorator(view):
+    @functools.wraps(view)
+    def wrapper(**kwargs):
+      cache = page_cache()
+      # a page carrying flashed messages belongs to one visitor
+      if cache is None or session.get('_flashes'):
+        return view(**kwargs)
+      current = g.pop('page_version', None)
+      if current is None:
+        # read before rendering: if a write lands in between, the page is
+        # stored under the older version and the next request misses
+        try:
+          current = version(kwargs[id_arg])
+        finally:
+          db.session.close()
+      if current is None:
+        return view(**kwargs)
+      key = page_key(category, kwargs[id_arg], page_etag(current))
+      body = cache.get(key)
+      if body is None:
+        body = view(**kwargs)
+        if isinstance(body, str):
+          cache.set(key, body)
+      return body
+    return wrapper
+  return decorator
 
-app.jinja_env.filters['datetime'] = format_datetime
+#----------------------------------------------------------------------------#
+# Conditional GET.
+#----------------------------------------------------------------------------#
+
+def is_not_modified(etag, last_modified):
+  # If-None-Match wins over If-Modified-Since when both are sent
+  if request.if_none_match:
+    return request.if_none_match.contains_weak(etag)
+  since = request.if_modified_since
+  if since is None or last_modified is None:
+    return False
+  if since.tzinfo is None:
+    since = since.replace(tzinfo=timezone.utc)
+  # HTTP dates have whole seconds
+  return last_modified.replace(microsecond=0) <= since
+
+def conditional_page(version):
+  # send ETag/Last-Modified/Cache-Control, and answer a matching
+  # conditional request with a 304 before the view runs; version is called
+  # with the view's arguments and returns a versions.Version (or None)
+  def decorator(view):
+    @functools.wraps(view)
+    def wrapper(**kwargs):
+      # a page carrying flashed messages belongs to one visitor
+      if session.get('_flashes'):
+        return view(**kwargs)
+      # read before rendering: if a write lands in between, the page is
+      # newer than its ETag and the next request just gets a full response
+      try:
+        current = version(**kwargs)
+      finally:
+        db.session.close()
+      if current is None:
+        return view(**kwargs)
+      etag = page_etag(current)
+      if is_not_modified(etag, current.last_modified):
+        response = Response(status=304)
+      else:
+        # cached_page keys the body by this same version
+        g.page_version = current
+        response = make_response(view(**kwargs))
+        if response.status_code != 200:
+          return response
+      response.set_etag(etag)
+      response.last_modified = current.last_modified
+      response.cache_control.public = True
+      response.cache_control.max_age = app.config['HTTP_CACHE_MAX_AGE']
+      return response
+    return wrapper
+  return decorator
 
 #----------------------------------------------------------------------------#
 # Controllers.
@@ -66,9 +193,11 @@ app.jinja_env.filters['datetime'] = format_datetime
 
 @app.route('/')
 def index():
-  venues = Venue.query.order_by(db.desc(Venue.created_date)).limit(10).all()
-  artists = Artist.query.order_by(db.desc(Artist.created_date)).limit(10).all()
-  return render_template('pages/home.html', venues=venues, artists=artists)
+  # the lists are read inside the template's cached fragments, so a cache
+  # hit runs no query
+  return render_template('pages/home.html',
+                         recent_venues=functools.partial(recent_entities, Venue),
+                         recent_artists=functools.partial(recent_entities, Artist))
 
 
 #  Venues
@@ -79,129 +208,50 @@ def convert_str_to_datetime(datetime_str):
   return date_time_obj
 
 
-def search_future_shows(item_id, category=None):
-  current_time = datetime.now(timezone.utc)
-  shows = None
-  if category is None:
-    raise NotImplementedError
-    # shows = Show.query.filter(Show.id == item_id, Show.start_time > current_time).all()
-  else:
-    if category == 'venue':
-      shows = Show.query.filter(Show.venue_id==item_id, Show.start_time > current_time).all()
-    elif category == 'artist':
-      shows = Show.query.filter(Show.artist_id==item_id, Show.start_time > current_time).all()
-    else:
-      raise NotImplementedError
-  return shows
-
-
-def count_future_shows(item_id, category=None):
-  shows = search_future_shows(item_id, category=category)
-  count = 0
-  if shows is not None and hasattr(shows, '__len__'):
-    count = len(shows)
-  return count
-
-
-def search_past_shows(item_id, category=None):
-  current_time = datetime.now(timezone.utc)
-  shows = None
-  if category is None:
-    raise NotImplementedError
-    # shows = Show.query.filter(Show.id == item_id, Show.start_time < current_time).all()
-  else:
-    if category == 'venue':
-      shows = Show.query.filter(Show.venue_id==item_id, Show.start_time < current_time).all()
-    elif category == 'artist':
-      shows = Show.query.filter(Show.artist_id==item_id, Show.start_time < current_time).all()
-    else:
-      raise NotImplementedError
-  return shows
-
-
-def count_past_shows(item_id, category=None):
-  shows = search_past_shows(item_id, category=category)
-  count = 0
-  if shows is not None and hasattr(shows, '__len__'):
-    count = len(shows)
-  return count
-
-
 @app.route('/venues')
+@conditional_page(lambda: listing_version(Venue))
 def venues():
   error = False
-  data = []
+  page = None
   try:
-    venues = Venue.query.all()
-    locations = []
-    for venue in venues:
-      location = (venue.city, venue.state)
-      if location not in locations:
-        temp = {
-          "city": venue.city,
-          "state": venue.state,
-          "venues": []
-        }
-        data.append(temp)
-        locations.append(location)
-      idx = locations.index(location)
-      venue_info = {
-        "id": venue.id,
-        "name": venue.name,
-        "num_upcoming_shows": count_future_shows(venue.id, 'venue')
-      }
-      data[idx]['venues'].append(venue_info)
+    # the areas are read inside the template's cached fragment, so a cache
+    # hit runs no query
+    page = render_template('pages/venues.html', areas=venue_areas)
   except Exception as e:
+    error = True
     db.session.rollback()
-    print(f'[error] retrieving venues.')
-    print(sys.exc_info())
+    app.logger.exception('error retrieving venues')
   finally:
     db.session.close()
 
   # # TODO: replace with real venues data.
   # #       num_shows should be aggregated based on number of upcoming shows per venue.
   if not error:
-    return render_template('pages/venues.html', areas=data)
+    return page
   else:
     abort(500)
 
+def search_page_args():
+  # pagination fields posted alongside search_term
+  per_page = request.form.get('per_page', app.config['SEARCH_PAGE_SIZE'], type=int)
+  per_page = min(max(per_page, 1), app.config['SEARCH_MAX_PAGE_SIZE'])
+  page = max(request.form.get('page', 1, type=int), 1)
+  return page, per_page
+
+
 @app.route('/venues/search', methods=['POST'])
 def search_venues():
-  print('process post request for serach_venues...')
   error = False
   response = {}
   try:
     search_term = request.form.get('search_term', '')
-    print(f'search_term: {search_term}')
-    query = db.session.query(
-      Venue.id,
-      Venue.name,
-      Show.start_time
-    ).join(Show, Show.venue_id == Venue.id)
-    current_time = datetime.now(timezone.utc)
-    data = query.filter(Venue.name.ilike(f'%{search_term}%')).all()
-    if data is not None:
-      response["data"] = []
-      key_locations = {}
-      for item in data:
-        if item[0] in key_locations:
-          key_id = item[0]
-        else:
-          temp = {
-            'id': item[0],
-            'name': item[1],
-            'num_upcoming_shows': 0
-          }
-          key_locations[item[0]] = len(response["data"])
-          response['data'].append(temp)
-        if item[2] > current_time:
-          response["data"][key_locations[item[0]]]["num_upcoming_shows"] += 1
-      response["count"] = len(key_locations)
+    app.logger.debug('searching venues', extra={'search_term': search_term})
+    page, per_page = search_page_args()
+    response = search_entities(Venue, search_term, page=page, per_page=per_page)
   except Exception as e:
     db.session.rollback()
     error = True
-    print(f'error in search_venues(): {e}')
-    print(sys.exc_info())
+    app.logger.exception('error searching venues')
   finally:
     db.session.close()
   
@@ -222,8 +272,7 @@ def show_venue_by_name(venue_name):
   try:
     venue_id = db.session.query(Venue.id).filter(Venue.name == venue_name).scalar()
   except Exception as e:
-    print(e)
-    print(sys.exc_info())
+    app.logger.exception('error looking up venue %r', venue_name)
   finally:
     db.session.close()
   
@@ -233,29 +282,18 @@ def show_venue_by_name(venue_name):
     return redirect(url_for('show_venue', venue_id=venue_id))
 
 @app.route('/venues/<int:venue_id>')
+@conditional_page(lambda venue_id: entity_version(Venue, venue_id))
+@cached_page('venue', 'venue_id', lambda venue_id: entity_version(Venue, venue_id))
 def show_venue(venue_id):
   error = False
   data={}
   try:
-    venue = Venue.query.get(venue_id)
-    current_time = datetime.now(timezone.utc)
-    past_shows = list(filter(lambda x: x.start_time < current_time, venue.shows))
-    upcoming_shows = list(filter(lambda x: x.start_time >= current_time, venue.shows))
-    
-    past_shows = list(map(lambda x: x.to_dictionary('artist'), past_shows))
-    upcoming_shows = list(map(lambda x: x.to_dictionary('artist'), upcoming_shows))
-    
-    data = venue.to_dictionary()
-    data['past_shows'] = past_shows
-    data['past_shows_count'] = len(past_shows)
-
-    data['upcoming_shows'] = upcoming_shows
-    data['upcoming_shows_count'] = len(upcoming_shows)
+    data = entity_detail(Venue, venue_id)
+    if data is None:
+      error = True
   except Exception as e:
     error = True
-    print(f'error showing venue for {venue_id}.')
-    print(e)
-    print(sys.exc_info())
+    app.logger.exception('error showing venue %s', venue_id)
     db.session.rollback()
   finally:
     db.session.close()
@@ -268,6 +306,15 @@ def show_venue(venue_id):
   # shows the venue page with the given venue_id
   # DONE: replace with real venue data from the venues table, using venue_id
 
+#  Page cache
+#  ----------------------------------------------------------------
+
+@app.route('/cache/stats')
+def cache_stats():
+  cache = page_cache()
+  data = {'backend': None} if cache is None else dict(cache.stats(), backend=cache.name)
+  return json.dumps(data), 200, {'Content-Type': 'application/json'}
+
 #  Create Venue
 #  ----------------------------------------------------------------
 
@@ -293,14 +340,12 @@ def create_venue_submission():
       flash('Venue ' + request.form['name'] + ' was successfully listed!')
     else:
       error = True
-      print(f'form errors: {form.errors}')
+      app.logger.info('form errors', extra={'form_errors': form.errors})
       for key, value in form.errors.items():
         flash(f'[{key}] {value}')
   except Exception as e:
     error = True
-    print(f'error inserting venue for {request.form["name"]}.')
-    print(f'error message: \n{e}')
-    print(sys.exc_info())
+    app.logger.exception('error inserting venue %r', request.form.get('name'))
     db.session.rollback()
   finally:
     db.session.close()
@@ -320,13 +365,15 @@ def create_venue_submission():
 @app.route('/venues/<venue_id>', methods=['DELETE'])
 def delete_venue(venue_id):
   try:
+    artist_ids = counterpart_ids('venue', venue_id)
     Venue.query.filter_by(id=venue_id).delete()
+    # a bulk delete, which the ORM hooks do not see
+    fragments.mark_changed(db.session, 'venue')
+    touch(artist_ids=artist_ids)
     db.session.commit()
   except Exception as e:
     error = True
-    print(f'error deleting venue {venue_id}.')
-    print(f'error message: \n{e}')
-    print(sys.exc_info())
+    app.logger.exception('error deleting venue %s', venue_id)
     db.session.rollback()
   finally:
     db.session.close()
@@ -340,6 +387,7 @@ def delete_venue(venue_id):
 #  Artists
 #  ----------------------------------------------------------------
 @app.route('/artists')
+@conditional_page(lambda: listing_version(Artist))
 def artists():
   error = False
   data = []
@@ -354,8 +402,7 @@ def artists():
       data.append(temp)
   except Exception as e:
     db.session.rollback()
-    print(f'[error] retrieving venues.')
-    print(sys.exc_info())
+    app.logger.exception('error retrieving artists')
   finally:
     db.session.close()
   # TODO: replace with real data returned from querying the database
@@ -370,36 +417,13 @@ def search_artists():
   response = {}
   try:
     search_term = request.form.get('search_term', '')
-    print(f'search_term: {search_term}')
-    query = db.session.query(
-      Artist.id,
-      Artist.name,
-      Show.start_time
-    ).join(Show, Show.artist_id == Artist.id)
-    data = query.filter(Artist.name.ilike(f'%{search_term}%')).all()
-    if data is not None:
-      keys = []
-      response["data"] = []
-      current_time = datetime.now(timezone.utc)
-      for artist_id, artist_name, show_start_time in data:
-        idx = 0
-        if artist_id not in keys:
-          temp = {
-            'id': artist_id,
-            'name': artist_name,
-            'num_upcoming_shows': 0
-          }
-          response['data'].append(temp)
-          keys.append(artist_id)
-        idx = keys.index(artist_id)
-        if show_start_time > current_time:
-          response["data"][idx]["num_upcoming_shows"] += 1
-      response["count"] = len(keys)
+    app.logger.debug('searching artists', extra={'search_term': search_term})
+    page, per_page = search_page_args()
+    response = search_entities(Artist, search_term, page=page, per_page=per_page)
   except Exception as e:
     db.session.rollback()
     error = True
-    print(f'error in search_artists(): {e}')
-    print(sys.exc_info())
+    app.logger.exception('error searching artists')
   finally:
     db.session.close()
   
@@ -420,8 +444,7 @@ def show_artist_by_name(artist_name):
   try:
     artist_id = db.session.query(Artist.id).filter(Artist.name == artist_name).scalar()
   except Exception as e:
-    print(e)
-    print(sys.exc_info())
+    app.logger.exception('error looking up artist %r', artist_name)
   finally:
     db.session.close()
   
@@ -432,29 +455,18 @@ def show_artist_by_name(artist_name):
 
 
 @app.route('/artists/<int:artist_id>')
+@conditional_page(lambda artist_id: entity_version(Artist, artist_id))
+@cached_page('artist', 'artist_id', lambda artist_id: entity_version(Artist, artist_id))
 def show_artist(artist_id):
   error = False
   data={}
   try:
-    artist = Artist.query.get(artist_id)
-    current_time = datetime.now(timezone.utc)
-    past_shows = list(filter(lambda x: x.start_time < current_time, artist.shows))
-    upcoming_shows = list(filter(lambda x: x.start_time >= current_time, artist.shows))
-    
-    past_shows = list(map(lambda x: x.to_dictionary('venue'), past_shows))
-    upcoming_shows = list(map(lambda x: x.to_dictionary('venue'), upcoming_shows))
-    
-    data = artist.to_dictionary()
-    data['past_shows'] = past_shows
-    data['past_shows_count'] = len(past_shows)
-
-    data['upcoming_shows'] = upcoming_shows
-    data['upcoming_shows_count'] = len(upcoming_shows)
+    data = entity_detail(Artist, artist_id)
+    if data is None:
+      error = True
   except Exception as e:
     error = True
-    print(f'error showing artist for {artist_id}.')
-    print(e)
-    print(sys.exc_info())
+    app.logger.exception('error showing artist %s', artist_id)
     db.session.rollback()
   finally:
     db.session.close()
@@ -478,10 +490,7 @@ def edit_artist(artist_id):
     form = ArtistForm(obj=artist_db)
   except Exception as e:
     error = True
-    print(f'error editing artist {artist_id}.')
-    print(request.form)
-    print(e)
-    print(sys.exc_info())
+    app.logger.exception('error editing artist %s', artist_id)
     db.session.rollback()
   finally:
     db.session.close()
@@ -502,9 +511,13 @@ def edit_artist_submission(artist_id):
       ]
       artist = Artist.query.get(artist_id)
       form.populate_obj(artist)
+      # venue pages show the names and images of their artists; the artist
+      # is touched too, as a genre-only edit leaves its row unchanged
+      venue_ids = counterpart_ids('artist', artist_id)
+      touch(artist_ids=[artist_id], venue_ids=venue_ids)
       db.session.commit()
     else:
-      print(f'form errors: {form.errors}')
+      app.logger.info('form errors', extra={'form_errors': form.errors})
       for key, value in form.errors.items():
         flash(f'[{key}] {value}')
       error = True
@@ -512,10 +525,8 @@ def edit_artist_submission(artist_id):
       return redirect(url_for('edit_artist', artist_id=artist_id))
   except Exception as e:
     error = True
-    print(f'error submitting artist {artist_id}.')
-    print(request.form)
-    print(e)
-    print(sys.exc_info())
+    app.logger.exception('error submitting artist %s', artist_id,
+                         extra={'form': request.form.to_dict(flat=False)})
     db.session.rollback()
   finally:
     db.session.close()
@@ -537,9 +548,7 @@ def edit_venue(venue_id):
     venue_dict = venue.to_dictionary()
     form = VenueForm(obj=venue)
   except Exception as e:
-    print(f'error editing venue {venue_id}')
-    print(e)
-    print(sys.exc_info())
+    app.logger.exception('error editing venue %s', venue_id)
     db.session.rollback()
   finally:
     db.session.close()
@@ -559,20 +568,20 @@ def edit_venue_submission(venue_id):
         VenueGenre(category=item) for item in request.form.getlist('genres')
       ]
       form.populate_obj(venue)
+      artist_ids = counterpart_ids('venue', venue_id)
+      touch(venue_ids=[venue_id], artist_ids=artist_ids)
       db.session.commit()
     else:
       error = True
-      print(f'form errors: {form.errors}')
+      app.logger.info('form errors', extra={'form_errors': form.errors})
       for key, value in form.errors.items():
         flash(f'[{key}] {value}')
       db.session.rollback()
       return redirect(url_for('edit_venue', venue_id=venue_id))
   except Exception as e:
     error = True
-    print(f'error submitting venue {venue_id}.')
-    print(e)
-    print(sys.exc_info())
-    print(request.form)
+    app.logger.exception('error submitting venue %s', venue_id,
+                         extra={'form': request.form.to_dict(flat=False)})
     db.session.rollback()
   finally:
     db.session.close()
@@ -609,18 +618,18 @@ def create_artist_submission():
       flash('Artist ' + request.form['name'] + ' was successfully listed!')
     else:
       error = True
-      print(f'form errors: {form.errors}')
+      app.logger.info('form errors', extra={'form_errors': form.errors})
       for key, value in form.errors.items():
         flash(f'[{key}] {value}')
       return render_template('forms/new_artist.html', form=form)
   except ValueError as e:
     error = True
-    print(f'Error creating artist: {e}')
+    app.logger.exception('error creating artist')
     flash('Error creating artist.')
     db.session.rollback()
   except Exception as e:
     error = True
-    print(f'Error creating artist: {e}')
+    app.logger.exception('error creating artist')
     flash('Error creating artist.')
     db.session.rollback()
   finally:
@@ -644,39 +653,63 @@ def create_artist_submission():
 #  Shows
 #  ----------------------------------------------------------------
 
+def stream_template(template_name, **context):
+  # Flask 1.x has no stream_template(); render through Jinja's generator
+  app.update_template_context(context)
+  template = app.jinja_env.get_template(template_name)
+  return Response(stream_with_context(template.stream(context)))
+
+
+def shows_page_from_request():
+  # the ShowPage asked for by ?after=&limit=&scope= and the ShowFilters
+  # arguments; 400 on a bad cursor or filter
+  try:
+    after = request.args.get('after')
+    if after is not None:
+      after = decode_cursor(after)
+    filters = ShowFilters.from_args(request.args)
+  except ValueError as e:
+    app.logger.info('bad shows request: %s', e)
+    abort(400)
+  per_page = request.args.get('limit', app.config['SHOWS_PAGE_SIZE'], type=int)
+  per_page = min(max(per_page, 1), app.config['SHOWS_MAX_PAGE_SIZE'])
+  # an explicit window replaces the default of upcoming shows only
+  upcoming = request.args.get('scope', 'upcoming') != 'all' and filters.start is None
+  return ShowPage(after=after, per_page=per_page, upcoming=upcoming, filters=filters)
+
+
+@app.template_global()
+def url_with(**changes):
+  # the current page's URL with some query arguments changed; None drops one
+  args = request.args.to_dict()
+  args.update(changes)
+  args = {name: value for name, value in args.items() if value is not None}
+  return url_for(request.endpoint, **request.view_args, **args)
+
+
 @app.route('/shows')
+@conditional_page(shows_version)
 def shows():
-  data = []
   error = False
+  page = shows_page_from_request()
+  stream = request.args.get('stream')
+  if stream is None:
+    stream = app.config['SHOWS_STREAM']
+  else:
+    stream = stream.lower() in ('1', 'true', 'yes')
+  if stream:
+    # rows are fetched while the response is being sent
+    return stream_template('pages/shows.html', shows=page)
   try:
-    query = db.session.query(
-      Show.venue_id,
-      Show.artist_id,
-      Show.start_time,
-      Venue.name,
-      Artist.name,
-      Artist.image_link
-    ).join(Artist, Artist.id == Show.artist_id).join(Venue, Venue.id == Show.venue_id)
-    shows = query.all()
-    for show in shows:
-      temp = {
-        "venue_id": show[0],
-        "artist_id": show[1],
-        "start_time": show[2].strftime('%Y-%m-%dT%H:%M:%S.%f')[:-3] + 'Z',
-        "venue_name": show[3],
-        "artist_name": show[4],
-        "artist_image_link": show[5]
-      }
-      data.append(temp)
+    page.fetch()
   except Exception as e:
-    print(f'error showing shows: {e}')
-    print(sys.exc_info())
+    app.logger.exception('error showing shows')
     error = True
   finally:
     db.session.close()
 
   if not error:
-    return render_template('pages/shows.html', shows=data)
+    return render_template('pages/shows.html', shows=page)
   else:
     abort(500)
   # displays list of shows at /shows
@@ -688,31 +721,33 @@ def create_shows():
   form = ShowForm()
   return render_template('forms/new_show.html', form=form)
 
-show_id_val = 10
-def show_id():
-  global show_id_val
-  show_id_val += 1
-  return show_id_val
-
 @app.route('/shows/create', methods=['POST'])
 def create_show_submission():
   error = False
   form = ShowForm(request.form)
   try:
     if form.validate_on_submit():
-      show = Show()
-      form.populate_obj(show)
-      # pattern = r'%Y-%m-%d %H:%M:%S'
-      db.session.add(show)
+      booking = scheduling.booking(form.artist_id.data, form.venue_id.data,
+                                   form.start_time.data, form.duration.data)
+      # checked for overlaps like a scheduled tour
+      scheduling.schedule([booking])
       db.session.commit()
       flash('Show was successfully listed!')
     else:
       error = True
-      print(f'form errors: {form.errors}')
+      app.logger.info('form errors', extra={'form_errors': form.errors})
       for key, value in form.errors.items():
         flash(f'[{key}] {value}')
+  except scheduling.ScheduleError as e:
+    error = True
+    db.session.rollback()
+    for message in e.errors[0]:
+      flash(message)
+  except ValueError as e:
+    error = True
+    flash(str(e))
   except Exception as e:
-    print(f'create show error: {e}')
+    app.logger.exception('error creating show')
     error = True
   finally:
     db.session.close()
@@ -731,6 +766,83 @@ def create_show_submission():
   # see: http://flask.pocoo.org/docs/1.0/patterns/flashing/
   # return render_template('pages/home.html')
 
+# at most this many errors are flashed; the session cookie holds them
+MAX_FLASHED_ERRORS = 20
+
+@app.route('/shows/schedule')
+def schedule_shows():
+  form = ScheduleForm()
+  return render_template('forms/schedule_shows.html', form=form,
+                           default_duration=DEFAULT_DURATION_MINUTES)
+
+@app.route('/shows/schedule', methods=['POST'])
+def schedule_shows_submission():
+  error = False
+  form = ScheduleForm(request.form)
+  try:
+    if form.validate_on_submit():
+      lines = scheduling.parse_lines(form.shows.data)
+      if len(lines) > app.config['SCHEDULE_MAX_SHOWS']:
+        error = True
+        flash(f"At most {app.config['SCHEDULE_MAX_SHOWS']} shows can be scheduled at a time.")
+      else:
+        bookings = scheduling.parse_bookings([entry for _, entry in lines])
+        records = scheduling.schedule(bookings)
+        db.session.commit()
+        flash(f'{len(records)} shows were successfully scheduled!')
+    else:
+      error = True
+      app.logger.info('form errors', extra={'form_errors': form.errors})
+      for key, value in form.errors.items():
+        flash(f'[{key}] {value}')
+  except scheduling.ScheduleError as e:
+    error = True
+    db.session.rollback()
+    messages = [
+      f'[line {lines[index][0]}] {message}'
+      for index, errors in sorted(e.errors.items()) for message in errors
+    ]
+    for message in messages[:MAX_FLASHED_ERRORS]:
+      flash(message)
+    if len(messages) > MAX_FLASHED_ERRORS:
+      flash(f'... and {len(messages) - MAX_FLASHED_ERRORS} more')
+  except Exception as e:
+    app.logger.exception('error scheduling shows')
+    error = True
+  finally:
+    db.session.close()
+
+  if not error:
+    return redirect(url_for('shows'))
+  else:
+    return render_template('forms/schedule_shows.html', form=form,
+                             default_duration=DEFAULT_DURATION_MINUTES)
+
+#  Export
+#  ----------------------------------------------------------------
+
+EXPORT_MIMETYPES = {
+  'jsonl': 'application/x-ndjson',
+  'csv': 'text/csv'
+}
+
+@app.route('/export/<kind>.<fmt>')
+def export(kind, fmt):
+  # disabled unless an EXPORT_TOKEN is configured
+  token = app.config.get('EXPORT_TOKEN')
+  if not token:
+    abort(404)
+  supplied = request.headers.get('Authorization', '')
+  if not hmac.compare_digest(supplied.encode(), f'Bearer {token}'.encode()):
+    abort(401)
+  if kind not in exporter.KINDS or fmt not in EXPORT_MIMETYPES:
+    abort(404)
+  return Response(
+    stream_with_context(exporter.text_export(kind, fmt)),
+    mimetype=EXPORT_MIMETYPES[fmt],
+    headers={'Content-Disposition': f'attachment; filename={kind}.{fmt}'}
+  )
+
 @app.errorhandler(400)
 def not_found_error(error):
     return render_template('errors/400.html'), 400
@@ -764,20 +876,12 @@ def server_error(error):
     return render_template('errors/500.html'), 500
 
 
-if not app.debug:
-    file_handler = FileHandler('error.log')
-    file_handler.setFormatter(
-        Formatter('%(asctime)s %(levelname)s: %(message)s [in %(pathname)s:%(lineno)d]')
-    )
-    app.logger.setLevel(logging.INFO)
-    file_handler.setLevel(logging.INFO)
-    app.logger.addHandler(file_handler)
-    app.logger.info('errors')
-
 #----------------------------------------------------------------------------#
 # Launch.
 #----------------------------------------------------------------------------#
 
+# Development server; production runs wsgi.py under gunicorn (see
+# gunicorn.conf.py).
 # Default port:
 if __name__ == '__main__':
     app.run()
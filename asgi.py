@@ -0,0 +1,236 @@
+import asyncio
+import re
+from flask import render_template
+from sqlalchemy import event
+from sqlalchemy.engine import make_url
+from sqlalchemy.ext.asyncio import AsyncSession, create_async_engine
+from sqlalchemy.orm import sessionmaker
+from sqlalchemy.pool import NullPool
+from werkzeug.exceptions import HTTPException, MethodNotAllowed, NotFound
+from app import app as flask_app, shows_page_from_request
+from database import set_local_statement_timeout
+from templating import warm_up
+from models import Venue, Artist
+from queries import (
+  venue_areas_statement,
+  group_venue_areas,
+  entity_detail_statements,
+  shows_data,
+  entity_detail_data
+)
+
+#----------------------------------------------------------------------------#
+# Async read path.
+#
+# An ASGI app serving the read-heavy pages (/venues, /venues/<id>,
+# /artists/<id> and /shows) from an asyncio engine on asyncpg:
+#
+#   uvicorn asgi:application --workers 4
+#
+# The venue/artist pages run their three statements (the entity with its
+# genres, past shows, upcoming shows) concurrently, each on its own session
+# and connection, so a page costs one round-trip instead of three. The
+# statements and templates are the ones app.py uses (queries.py); pages are
+# rendered in a Flask request context, so they come out the same. Writes,
+# search, the API and the page cache stay with the WSGI app: route the
+# paths above to this server and everything else to gunicorn.
+#----------------------------------------------------------------------------#
+
+def async_database_uri(uri):
+  """uri with the asyncpg driver; the async path needs PostgreSQL."""
+  url = make_url(uri)
+  if url.get_backend_name() != 'postgresql':
+    raise ValueError(f'the async read path needs PostgreSQL, not {url.get_backend_name()}')
+  return url.set(drivername='postgresql+asyncpg')
+
+
+def engine_options(config):
+  """create_async_engine() options for the DB_* settings in config."""
+  options = {'pool_pre_ping': config['DB_POOL_PRE_PING']}
+  connect_args = {}
+  timeout = config['DB_STATEMENT_TIMEOUT_MS']
+  if config['DB_PGBOUNCER']:
+    options['poolclass'] = NullPool
+    # PgBouncer in transaction mode may run each statement on a different
+    # server connection, where a prepared statement does not exist
+    connect_args['statement_cache_size'] = 0
+    connect_args['prepared_statement_cache_size'] = 0
+  else:
+    options.update(
+      pool_size=config['DB_POOL_SIZE'],
+      max_overflow=config['DB_MAX_OVERFLOW'],
+      pool_timeout=config['DB_POOL_TIMEOUT'],
+      pool_recycle=config['DB_POOL_RECYCLE']
+    )
+    if timeout:
+      connect_args['server_settings'] = {'statement_timeout': str(int(timeout))}
+  options['connect_args'] = connect_args
+  return options
+
+
+class Database:
+  """The async engine and session factory, created on the server's loop."""
+
+  def __init__(self, config):
+    self.config = config
+    self.engine = None
+    self.sessions = None
+
+  def start(self):
+    config = self.config
+    self.engine = create_async_engine(
+      async_database_uri(config['SQLALCHEMY_DATABASE_URI']), **engine_options(config))
+    if config['DB_PGBOUNCER'] and config['DB_STATEMENT_TIMEOUT_MS']:
+      event.listen(self.engine.sync_engine, 'begin',
+                   set_local_statement_timeout(config['DB_STATEMENT_TIMEOUT_MS']))
+    self.sessions = sessionmaker(self.engine, class_=AsyncSession, expire_on_commit=False)
+
+  async def stop(self):
+    if self.engine is not None:
+      await self.engine.dispose()
+      self.engine = None
+
+  async def run(self, statement, read):
+    """read(result) for statement, on a session of its own so that
+    several run() calls can be awaited together."""
+    if self.engine is None:
+      self.start()
+    async with self.sessions() as session:
+      return read(await session.execute(statement))
+
+
+database = Database(flask_app.config)
+
+# writes go through the WSGI app, so generation bumps would never reach an
+# in-process fragment cache here; only a shared (redis) one is used
+if flask_app.config.get('FRAGMENT_CACHE_BACKEND') == 'memory':
+  flask_app.extensions['fragment_cache'] = None
+
+
+#----------------------------------------------------------------------------#
+# Pages.
+#----------------------------------------------------------------------------#
+
+class Request:
+  def __init__(self, scope):
+    self.path = scope['path']
+    self.query_string = scope.get('query_string', b'')
+    self.headers = [(name.decode('latin-1'), value.decode('latin-1'))
+                    for name, value in scope.get('headers', ())]
+
+  def context(self):
+    """A Flask request context for this request, to render templates in
+    (url_for, request.endpoint, ...). Push it only around code that does
+    not await: Flask's context locals are per thread, not per task."""
+    return flask_app.test_request_context(
+      self.path, query_string=self.query_string, headers=self.headers)
+
+
+def _render(request, template_name, **context):
+  with request.context():
+    return 200, render_template(template_name, **context)
+
+
+async def venues(request):
+  rows = await database.run(venue_areas_statement(), lambda result: result.all())
+  areas = group_venue_areas(rows)
+  return _render(request, 'pages/venues.html', areas=lambda: areas)
+
+
+async def _entity_page(request, model, item_id, template_name, name):
+  entity_statement, past_statement, upcoming_statement = entity_detail_statements(model, item_id)
+  entity, past_shows, upcoming_shows = await asyncio.gather(
+    database.run(entity_statement, lambda result: result.unique().scalars().first()),
+    database.run(past_statement, lambda result: shows_data(model, result.scalars())),
+    database.run(upcoming_statement, lambda result: shows_data(model, result.scalars()))
+  )
+  if entity is None:
+    raise NotFound()
+  data = entity_detail_data(entity, past_shows, upcoming_shows)
+  return _render(request, template_name, **{name: data})
+
+
+async def show_venue(request, venue_id):
+  return await _entity_page(request, Venue, venue_id, 'pages/show_venue.html', 'venue')
+
+
+async def show_artist(request, artist_id):
+  return await _entity_page(request, Artist, artist_id, 'pages/show_artist.html', 'artist')
+
+
+async def shows(request):
+  with request.context():
+    page = shows_page_from_request()
+  rows = await database.run(page.statement(), lambda result: result.all())
+  return _render(request, 'pages/shows.html', shows=page.load(rows))
+
+
+ROUTES = [
+  (re.compile(r'/venues'), venues),
+  (re.compile(r'/venues/(\d+)'), show_venue),
+  (re.compile(r'/artists/(\d+)'), show_artist),
+  (re.compile(r'/shows'), shows),
+]
+
+
+def _route(path):
+  for pattern, view in ROUTES:
+    match = pattern.fullmatch(path)
+    if match:
+      return view, [int(arg) for arg in match.groups()]
+  raise NotFound()
+
+
+def _error_page(request, code):
+  # the WSGI app's error pages, e.g. errors/404.html
+  with request.context():
+    return code, render_template(f'errors/{code}.html')
+
+
+async def _handle(scope):
+  request = Request(scope)
+  try:
+    if scope['method'] not in ('GET', 'HEAD'):
+      raise MethodNotAllowed(['GET', 'HEAD'])
+    view, args = _route(request.path)
+    return await view(request, *args)
+  except HTTPException as error:
+    return _error_page(request, error.code)
+  except Exception:
+    flask_app.logger.exception('error serving %s', request.path)
+    return _error_page(request, 500)
+
+
+async def _lifespan(receive, send):
+  while True:
+    message = await receive()
+    if message['type'] == 'lifespan.startup':
+      database.start()
+      if flask_app.config['TEMPLATE_WARM_UP']:
+        warm_up(flask_app)
+      await send({'type': 'lifespan.startup.complete'})
+    elif message['type'] == 'lifespan.shutdown':
+      await database.stop()
+      await send({'type': 'lifespan.shutdown.complete'})
+      return
+
+
+async def application(scope, receive, send):
+  if scope['type'] == 'lifespan':
+    return await _lifespan(receive, send)
+  if scope['type'] != 'http':
+    raise ValueError(f"unsupported ASGI scope type {scope['type']!r}")
+  status, body = await _handle(scope)
+  body = body.encode()
+  await send({
+    'type': 'http.response.start',
+    'status': status,
+    'headers': [
+      (b'content-type', b'text/html; charset=utf-8'),
+      (b'content-length', str(len(body)).encode())
+    ]
+  })
+  await send({
+    'type': 'http.response.body',
+    'body': b'' if scope['method'] == 'HEAD' else body
+  })
@@ -0,0 +1,248 @@
+import sys
+import click
+from benchmarks import results
+
+#----------------------------------------------------------------------------#
+# python -m benchmarks datagen|routes|search|servers|startup|schedule|export|ids|compare
+#
+# The commands use the app's database, so point DATABASE_URL at a scratch
+# database first. The app is imported inside each command, after any
+# options that change its configuration are applied.
+#----------------------------------------------------------------------------#
+
+@click.group()
+def cli():
+  """Fyyur benchmarks."""
+
+
+def _app():
+  from app import app
+  return app
+
+
+def _report(name, summary):
+  if summary is None:
+    click.echo(f'{name:40} skipped (not installed)')
+    return
+  if not summary['n']:
+    click.echo(f"{name:40} no successful requests ({summary['errors']} errors)")
+    return
+  rate = summary.get('requests_per_second')
+  rate = f'  {rate:>8} req/s' if rate is not None else ''
+  queries = summary.get('queries')
+  queries = f'  {queries:>3} queries' if queries is not None else ''
+  click.echo(f"{name:40} p50 {summary['p50_ms']:>9.3f} ms  p95 {summary['p95_ms']:>9.3f} ms"
+             f'{rate}{queries}')
+
+
+@cli.command()
+@click.argument('scale')
+@click.option('--seed', default=0, show_default=True)
+@click.option('--anchor', type=click.DateTime(), default=None,
+              help='Date show times are spread around (default: today, UTC).')
+@click.option('--reset', is_flag=True, help='Empty the tables first.')
+@click.option('--create-tables', is_flag=True,
+              help='Create missing tables (for scratch databases; otherwise run flask db upgrade).')
+def datagen(scale, seed, anchor, reset, create_tables):
+  """Fill the database with SCALE (xs, s, m, l, xl or a number of shows)
+  of synthetic data."""
+  from benchmarks.datagen import Scale, generate, reset as empty
+  from models import db
+  app = _app()
+  scale = Scale.parse(scale)
+  click.echo(f'{scale.venues} venues, {scale.artists} artists, {scale.shows} shows (seed {seed})')
+  with app.app_context():
+    if create_tables:
+      db.create_all()
+    if reset:
+      with db.engine.begin() as connection:
+        empty(connection)
+    try:
+      generate(scale, seed=seed, anchor=anchor, progress=click.echo)
+    except ValueError as e:
+      click.echo(str(e))
+      sys.exit(1)
+
+
+@cli.command()
+@click.option('-n', '--iterations', default=200, show_default=True)
+@click.option('--warmup', default=20, show_default=True)
+@click.option('--case', 'only', multiple=True, help='Run only this case (repeatable).')
+@click.option('-o', '--output', default=None, help='Results file (default: benchmarks/results/).')
+def routes(iterations, warmup, only, output):
+  """Time each route through the Flask test client."""
+  from benchmarks import routes as route_benchmarks
+  app = _app()
+  cases = route_benchmarks.run(app, iterations=iterations, warmup=warmup, only=only,
+                               progress=_report)
+  with app.app_context():
+    size = route_benchmarks.data_size()
+  path = results.save('routes', cases, output, data=size,
+                      database=app.config['SQLALCHEMY_DATABASE_URI'].split('://')[0])
+  click.echo(f'saved {path}')
+
+
+@cli.command()
+@click.option('--rows', 'sizes', multiple=True, type=int,
+              help='Venues and artists to search (repeatable; default 10k, 100k and 1M).')
+@click.option('-n', '--iterations', default=200, show_default=True)
+@click.option('--warmup', default=20, show_default=True)
+@click.option('--reset', is_flag=True,
+              help='Required: the venue, artist and show tables are emptied and refilled.')
+@click.option('-o', '--output', default=None, help='Results file (default: benchmarks/results/).')
+def search(sizes, iterations, warmup, reset, output):
+  """Time name search at several table sizes."""
+  if not reset:
+    click.echo('search empties and refills the tables; pass --reset to go ahead')
+    sys.exit(1)
+  from benchmarks import search as search_benchmarks
+  app = _app()
+  sizes = sizes or search_benchmarks.ROWS
+  cases = search_benchmarks.run(app, sizes, iterations=iterations, warmup=warmup,
+                                progress=_report_percentiles)
+  path = results.save('search', cases, output, rows=list(sizes),
+                      database=app.config['SQLALCHEMY_DATABASE_URI'].split('://')[0],
+                      search_backend=app.extensions['search'].name)
+  click.echo(f'saved {path}')
+
+
+def _report_percentiles(name, summary):
+  click.echo(f"{name:40} p50 {summary['p50_ms']:>9.3f} ms  p99 {summary['p99_ms']:>9.3f} ms"
+             f"  {summary['queries']:>3} queries")
+
+
+@cli.command()
+@click.option('--model', 'models', multiple=True, type=click.Choice(['sync', 'gthread', 'gevent', 'asgi']),
+              help='Server to run (repeatable; default all installed).')
+@click.option('--workers', default=2, show_default=True)
+@click.option('--threads', default=4, show_default=True, help='Threads per gthread worker.')
+@click.option('-c', '--concurrency', default=16, show_default=True)
+@click.option('-d', '--duration', default=10, show_default=True, help='Seconds per route.')
+@click.option('-o', '--output', default=None, help='Results file (default: benchmarks/results/).')
+def servers(models, workers, threads, concurrency, duration, output):
+  """Compare req/s and latency across worker models."""
+  from benchmarks import servers as server_benchmarks
+  cases = server_benchmarks.run(models or server_benchmarks.MODELS, workers=workers,
+                                threads=threads, concurrency=concurrency,
+                                duration=duration, progress=_report)
+  path = results.save('servers', cases, output, workers=workers, threads=threads,
+                      concurrency=concurrency, duration=duration)
+  click.echo(f'saved {path}')
+
+
+@cli.command()
+@click.option('--mode', 'modes', multiple=True, type=click.Choice(['cold', 'bytecode', 'warm']),
+              help='Startup mode (repeatable; default all).')
+@click.option('--route', 'routes', multiple=True, help='Route name (repeatable; default all).')
+@click.option('-r', '--repeat', default=5, show_default=True, help='Processes per mode and route.')
+@click.option('-o', '--output', default=None, help='Results file (default: benchmarks/results/).')
+def startup(modes, routes, repeat, output):
+  """Time the first request per route in fresh processes."""
+  from benchmarks import startup as startup_benchmarks
+  cases = startup_benchmarks.run(modes or startup_benchmarks.MODES, routes or None,
+                                 repeat=repeat, progress=_report_startup)
+  path = results.save('startup', cases, output, repeat=repeat)
+  click.echo(f'saved {path}')
+
+
+def _report_startup(name, summary):
+  click.echo(f"{name:40} first p50 {summary['p50_ms']:>9.3f} ms  "
+             f"then {summary['steady_p50_ms']:>8.3f} ms  ready in {summary['ready_ms']:>8.1f} ms")
+
+
+@cli.command()
+@click.option('--size', default=10000, show_default=True, help='Shows per request.')
+@click.option('-r', '--repeat', default=5, show_default=True, help='Requests per case.')
+@click.option('-o', '--output', default=None, help='Results file (default: benchmarks/results/).')
+def schedule(size, repeat, output):
+  """Time bulk scheduling requests, accepted and rejected."""
+  from benchmarks import scheduling as scheduling_benchmarks
+  app = _app()
+  try:
+    cases = scheduling_benchmarks.run(app, size=size, repeat=repeat, progress=_report_schedule)
+  except ValueError as e:
+    click.echo(str(e))
+    sys.exit(1)
+  path = results.save('schedule', cases, output, size=size, repeat=repeat,
+                      database=app.config['SQLALCHEMY_DATABASE_URI'].split('://')[0])
+  click.echo(f'saved {path}')
+
+
+def _report_schedule(name, summary):
+  click.echo(f"{name:40} p50 {summary['p50_ms']:>9.3f} ms  p95 {summary['p95_ms']:>9.3f} ms"
+             f"  {summary['shows_per_second']:>8} shows/s")
+
+
+@cli.command()
+@click.option('--kind', 'kinds', multiple=True, type=click.Choice(['venues', 'artists', 'shows']),
+              help='What to export (repeatable; default all).')
+@click.option('--format', 'formats', multiple=True, type=click.Choice(['jsonl', 'csv', 'parquet']),
+              help='Export format (repeatable; default all; parquet needs pyarrow).')
+@click.option('-r', '--repeat', default=3, show_default=True, help='Processes per case.')
+@click.option('-o', '--output', default=None, help='Results file (default: benchmarks/results/).')
+def export(kinds, formats, repeat, output):
+  """Time full exports and their peak memory, in fresh processes."""
+  from benchmarks import export as export_benchmarks
+  app = _app()
+  cases = export_benchmarks.run(kinds or ('venues', 'artists', 'shows'),
+                                formats or ('jsonl', 'csv', 'parquet'), repeat=repeat,
+                                progress=_report_export)
+  path = results.save('export', cases, output, repeat=repeat,
+                      database=app.config['SQLALCHEMY_DATABASE_URI'].split('://')[0])
+  click.echo(f'saved {path}')
+
+
+def _report_export(name, summary):
+  click.echo(f"{name:40} {summary['rows']:>9} rows  {summary['rows_per_second']:>8} rows/s"
+             f"  peak {summary['peak_rss_mb']:>7.1f} MB (app {summary['ready_rss_mb']:.1f} MB)")
+
+
+@cli.command()
+@click.option('--generator', 'generators', multiple=True, type=click.Choice(['sequence', 'snowflake']),
+              help='Show id generator (repeatable; default both).')
+@click.option('--threads', default=8, show_default=True)
+@click.option('--processes', default=4, show_default=True)
+@click.option('-n', '--count', default=20000, show_default=True, help='Ids per thread or process.')
+@click.option('--batch', default=100, show_default=True, help='Ids per bulk request.')
+@click.option('--block-size', type=int, default=None, help='Sequence block (default: ID_BLOCK_SIZE).')
+@click.option('-o', '--output', default=None, help='Results file (default: benchmarks/results/).')
+def ids(generators, threads, processes, count, batch, block_size, output):
+  """Take show ids from many threads and processes."""
+  from benchmarks import ids as id_benchmarks
+  app = _app()
+  try:
+    cases = id_benchmarks.run(app, generators or id_benchmarks.GENERATORS, threads=threads,
+                              processes=processes, count=count, batch=batch,
+                              block_size=block_size, progress=_report_ids)
+  except ValueError as e:
+    click.echo(str(e))
+    sys.exit(1)
+  path = results.save('ids', cases, output, threads=threads, processes=processes, count=count,
+                      batch=batch, database=app.config['SQLALCHEMY_DATABASE_URI'].split('://')[0])
+  click.echo(f'saved {path}')
+
+
+def _report_ids(name, summary):
+  click.echo(f"{name:40} p50 {summary['p50_ms']:>9.3f} ms  p95 {summary['p95_ms']:>9.3f} ms"
+             f"  {summary['ids_per_second']:>9} ids/s  {summary['ids']} ids")
+
+
+@cli.command()
+@click.argument('baseline', type=click.Path(exists=True))
+@click.argument('current', type=click.Path(exists=True))
+@click.option('--threshold', default=0.1, show_default=True,
+              help='Relative slowdown that counts as a regression.')
+def compare(baseline, current, threshold):
+  """Diff two results files; exits 1 on regressions."""
+  rows = results.compare(results.load(baseline), results.load(current), threshold)
+  regressions = 0
+  for case, stat, before, after, change, regressed in rows:
+    mark = '  REGRESSION' if regressed else ''
+    click.echo(f'{case:40} {stat:20} {before:>10} -> {after:>10} {change:+7.1%}{mark}')
+    regressions += regressed
+  click.echo(f'{regressions} regression(s) over {threshold:.0%}')
+  sys.exit(1 if regressions else 0)
+
+
+if __name__ == '__main__':
+  cli(prog_name='python -m benchmarks')
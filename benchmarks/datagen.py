@@ -0,0 +1,272 @@
+import csv
+import io
+import random
+from datetime import datetime, timedelta, timezone
+from models import (
+  db,
+  SHOW_DURATION,
+  VenueGenre,
+  ArtistGenre,
+  Venue,
+  Artist,
+  Show
+)
+from forms import VenueForm
+
+#----------------------------------------------------------------------------#
+# Synthetic data.
+#
+# Venues, artists, their genres and shows, generated from a seed: the same
+# seed, scale and anchor always produce the same rows, so benchmark runs on
+# different machines or commits see the same data. Start times are spread a
+# year either side of the anchor (by default today, 00:00 UTC), so about
+# half the shows are upcoming. Rows are written with Core inserts, or COPY
+# on PostgreSQL, bypassing the ORM events; the show counters and is_past
+# are computed here instead.
+#----------------------------------------------------------------------------#
+
+# scale name -> number of shows
+SCALES = {
+  'xs': 1000,
+  's': 10000,
+  'm': 100000,
+  'l': 1000000,
+  'xl': 10000000,
+}
+
+CITIES = [
+  ('San Francisco', 'CA'), ('Los Angeles', 'CA'), ('New York', 'NY'),
+  ('Brooklyn', 'NY'), ('Austin', 'TX'), ('Houston', 'TX'), ('Chicago', 'IL'),
+  ('Seattle', 'WA'), ('Portland', 'OR'), ('Nashville', 'TN'), ('New Orleans', 'LA'),
+  ('Denver', 'CO'), ('Atlanta', 'GA'), ('Boston', 'MA'), ('Miami', 'FL'),
+]
+VENUE_WORDS = ['Musical', 'Dueling', 'Park', 'Blue', 'Velvet', 'Golden', 'Basement', 'Corner']
+VENUE_NOUNS = ['Hop', 'Pianos', 'Square', 'Room', 'Hall', 'Lounge', 'Club', 'Stage']
+ARTIST_WORDS = ['Guns', 'Matt', 'The Wild', 'Sonic', 'Electric', 'Midnight', 'Velvet', 'Lost']
+ARTIST_NOUNS = ['Petals', 'Quevedo', 'Sax Band', 'Youth', 'Owls', 'Riders', 'Echoes', 'Tigers']
+GENRES = [value for value, _ in VenueForm.genres.kwargs['choices']]
+
+BATCH_SIZE = 10000
+
+
+class Scale:
+  """Row counts for a number of shows: a venue per 20 shows and an artist
+  per 10, at least 10 of each, unless given."""
+
+  def __init__(self, shows, venues=None, artists=None):
+    self.shows = shows
+    self.venues = venues or max(shows // 20, 10)
+    self.artists = artists or max(shows // 10, 10)
+
+  @classmethod
+  def parse(cls, value):
+    """A scale name from SCALES or a number of shows."""
+    if value in SCALES:
+      return cls(SCALES[value])
+    return cls(int(value))
+
+
+def _anchor(value=None):
+  if value is None:
+    today = datetime.now(timezone.utc).date()
+    return datetime(today.year, today.month, today.day, tzinfo=timezone.utc)
+  return value if value.tzinfo else value.replace(tzinfo=timezone.utc)
+
+
+def _phone(rng):
+  return f'{rng.randint(201, 989)}-{rng.randint(200, 999)}-{rng.randint(0, 9999):04d}'
+
+
+def _genres(rng):
+  return rng.sample(GENRES, rng.randint(1, 3))
+
+
+def venue_rows(rng, count, created):
+  for venue_id in range(1, count + 1):
+    city, state = rng.choice(CITIES)
+    name = f'The {rng.choice(VENUE_WORDS)} {rng.choice(VENUE_NOUNS)} {venue_id}'
+    slug = name.lower().replace(' ', '')
+    row = {
+      'id': venue_id,
+      'name': name,
+      'city': city,
+      'state': state,
+      'address': f'{rng.randint(1, 9999)} {rng.choice(VENUE_NOUNS)} Street',
+      'phone': _phone(rng),
+      'website': f'https://www.{slug}.com',
+      'facebook_link': f'https://www.facebook.com/{slug}',
+      'seeking_talent': rng.random() < 0.3,
+      'seeking_description': None,
+      'image_link': f'https://images.example.com/venues/{venue_id}.jpg',
+      'created_date': created,
+    }
+    if row['seeking_talent']:
+      row['seeking_description'] = 'We are looking for local artists to play every weekend.'
+    yield row, _genres(rng)
+
+
+def artist_rows(rng, count, created):
+  for artist_id in range(1, count + 1):
+    city, state = rng.choice(CITIES)
+    name = f'{rng.choice(ARTIST_WORDS)} {rng.choice(ARTIST_NOUNS)} {artist_id}'
+    slug = name.lower().replace(' ', '')
+    row = {
+      'id': artist_id,
+      'name': name,
+      'city': city,
+      'state': state,
+      'phone': _phone(rng),
+      'website': f'https://www.{slug}.com',
+      'facebook_link': f'https://www.facebook.com/{slug}',
+      'seeking_venue': rng.random() < 0.3,
+      'seeking_description': None,
+      'image_link': f'https://images.example.com/artists/{artist_id}.jpg',
+      'created_date': created,
+    }
+    if row['seeking_venue']:
+      row['seeking_description'] = 'Looking for shows to perform at in the area.'
+    yield row, _genres(rng)
+
+
+def show_rows(seed, scale, anchor):
+  """(id, venue_id, artist_id, start_time) of every show. Popular venues
+  and artists get more shows (a rough power law), as on a real site."""
+  rng = random.Random(f'{seed}-shows')
+  year = 365 * 24 * 3600
+  for show_id in range(1, scale.shows + 1):
+    venue_id = min(int(scale.venues * rng.random() ** 2) + 1, scale.venues)
+    artist_id = min(int(scale.artists * rng.random() ** 2) + 1, scale.artists)
+    # on the hour, between 18:00 and 23:00
+    offset = rng.randint(-year, year)
+    start_time = (anchor + timedelta(seconds=offset)).replace(
+      hour=18 + rng.randint(0, 5), minute=0, second=0)
+    yield show_id, venue_id, artist_id, start_time
+
+
+def count_shows(seed, scale, anchor, now):
+  """(venue_counts, artist_counts), each a list of [upcoming, past] per id."""
+  venues = [[0, 0] for _ in range(scale.venues + 1)]
+  artists = [[0, 0] for _ in range(scale.artists + 1)]
+  for _, venue_id, artist_id, start_time in show_rows(seed, scale, anchor):
+    side = 1 if start_time <= now else 0
+    venues[venue_id][side] += 1
+    artists[artist_id][side] += 1
+  return venues, artists
+
+
+def _batches(rows, size=BATCH_SIZE):
+  batch = []
+  for row in rows:
+    batch.append(row)
+    if len(batch) == size:
+      yield batch
+      batch = []
+  if batch:
+    yield batch
+
+
+class _Writer:
+  """Inserts batches of row dicts, with COPY when on PostgreSQL."""
+
+  def __init__(self, connection):
+    self.connection = connection
+    self.copy = connection.dialect.name == 'postgresql'
+
+  def write(self, table, rows):
+    if not self.copy:
+      self.connection.execute(table.insert(), rows)
+      return
+    names = list(rows[0])
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    for row in rows:
+      writer.writerow(['\\N' if row[name] is None else row[name] for name in names])
+    buffer.seek(0)
+    cursor = self.connection.connection.cursor()
+    cursor.copy_expert(
+      f"COPY {table.name} ({', '.join(names)}) FROM STDIN WITH (FORMAT csv, NULL '\\N')",
+      buffer)
+
+
+def _entities(writer, model, genre_model, owner_key, rows, counts, updated_at):
+  genre_id = 0
+  for batch in _batches(rows):
+    entities, genres = [], []
+    for row, categories in batch:
+      upcoming, past = counts[row['id']]
+      entities.append(dict(row, num_upcoming_shows=upcoming, num_past_shows=past,
+                           updated_at=updated_at))
+      for category in categories:
+        genre_id += 1
+        genres.append({'id': genre_id, 'category': category, owner_key: row['id']})
+    writer.write(model.__table__, entities)
+    writer.write(genre_model.__table__, genres)
+
+
+def reset(connection):
+  """Empties the venue, artist, genre and show tables."""
+  tables = [Show.__table__, VenueGenre.__table__, ArtistGenre.__table__,
+            Venue.__table__, Artist.__table__]
+  if connection.dialect.name == 'postgresql':
+    names = ', '.join(table.name for table in tables)
+    connection.exec_driver_sql(f'TRUNCATE {names} RESTART IDENTITY CASCADE')
+  else:
+    for table in tables:
+      connection.execute(table.delete())
+
+
+def _is_empty(connection):
+  return all(
+    connection.execute(db.select(db.func.count()).select_from(model.__table__)).scalar() == 0
+    for model in (Venue, Artist, Show)
+  )
+
+
+def _sync_sequences(connection):
+  # ids were written explicitly; move the serial sequences past them
+  for table in (Venue.__table__, Artist.__table__, Show.__table__,
+                VenueGenre.__table__, ArtistGenre.__table__):
+    connection.exec_driver_sql(
+      f"SELECT setval(pg_get_serial_sequence('{table.name}', 'id'), "
+      f"coalesce((SELECT max(id) FROM {table.name}), 0) + 1, false)")
+
+
+def generate(scale, seed=0, anchor=None, now=None, progress=None):
+  """Writes scale's rows into the (empty) app database in one transaction.
+
+  anchor is the time show start times are spread around, now the time
+  that decides which shows are past; both default to today/now.
+  """
+  anchor = _anchor(anchor)
+  now = now or datetime.now(timezone.utc)
+  progress = progress or (lambda message: None)
+  rng = random.Random(seed)
+  venue_counts, artist_counts = count_shows(seed, scale, anchor, now)
+
+  with db.engine.begin() as connection:
+    if not _is_empty(connection):
+      raise ValueError('the database already has venues, artists or shows; reset it first')
+    writer = _Writer(connection)
+    _entities(writer, Venue, VenueGenre, 'venue_id',
+              venue_rows(rng, scale.venues, anchor), venue_counts, now)
+    progress(f'{scale.venues} venues')
+    _entities(writer, Artist, ArtistGenre, 'artist_id',
+              artist_rows(rng, scale.artists, anchor), artist_counts, now)
+    progress(f'{scale.artists} artists')
+    written = 0
+    rows = show_rows(seed, scale, anchor)
+    for batch in _batches(rows, BATCH_SIZE * 10):
+      writer.write(Show.__table__, [
+        {'id': show_id, 'venue_id': venue_id, 'artist_id': artist_id,
+         'start_time': start_time, 'end_time': start_time + SHOW_DURATION,
+         'is_past': start_time <= now, 'updated_at': now}
+        for show_id, venue_id, artist_id, start_time in batch
+      ])
+      written += len(batch)
+      progress(f'{written}/{scale.shows} shows')
+    if connection.dialect.name == 'postgresql':
+      _sync_sequences(connection)
+
+  if db.engine.dialect.name == 'postgresql':
+    with db.engine.connect() as connection:
+      connection.execution_options(isolation_level='AUTOCOMMIT').exec_driver_sql('ANALYZE')
@@ -0,0 +1,96 @@
+import json
+import os
+import resource
+import subprocess
+import sys
+import tempfile
+import time
+from benchmarks.results import summarize
+
+#----------------------------------------------------------------------------#
+# Export throughput and memory.
+#
+# Each sample is a fresh Python process that loads the app and writes one
+# kind in one format to a file, as 'flask export' does, so its peak RSS is
+# that export's alone. A case reports rows per second of the median sample
+# and the peak RSS, with the RSS of the loaded app before the export: the
+# difference is what the export itself holds, which should stay flat as
+# the tables grow. Parquet cases need pyarrow and are skipped without it.
+#----------------------------------------------------------------------------#
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def _rss_mb():
+  # peak RSS of this process; Linux reports it in KiB, macOS in bytes
+  peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+  return round(peak / (1024 * 1024 if sys.platform == 'darwin' else 1024), 1)
+
+
+def _child(kind, fmt, path):
+  import config
+  config.PAGE_CACHE_BACKEND = None
+  from app import app
+  import exporter
+  from models import db
+  model = {'venues': exporter.Venue, 'artists': exporter.Artist, 'shows': exporter.Show}[kind]
+  with app.app_context():
+    rows = db.session.query(db.func.count(model.id)).scalar()
+    db.session.close()
+    ready_rss = _rss_mb()
+    started = time.perf_counter()
+    if fmt == 'parquet':
+      exporter.parquet_export(kind, path)
+    else:
+      with open(path, 'w') as f:
+        for chunk in exporter.text_export(kind, fmt):
+          f.write(chunk)
+    seconds = time.perf_counter() - started
+    db.session.close()
+  print(json.dumps({'rows': rows, 'seconds': seconds, 'ready_rss_mb': ready_rss,
+                    'peak_rss_mb': _rss_mb(), 'bytes': os.path.getsize(path)}))
+
+
+def _spawn(kind, fmt, path):
+  output = subprocess.run(
+    [sys.executable, '-m', 'benchmarks.export', kind, fmt, path], cwd=ROOT, check=True,
+    capture_output=True, text=True
+  ).stdout
+  # the app's JSON log records may share stdout
+  samples = [line for line in output.splitlines() if line.startswith('{"rows"')]
+  return json.loads(samples[-1])
+
+
+def _formats(formats):
+  try:
+    import pyarrow  # noqa: F401
+  except ImportError:
+    return [fmt for fmt in formats if fmt != 'parquet']
+  return list(formats)
+
+
+def run(kinds, formats, repeat=3, progress=None):
+  """{'export_<kind>_<fmt>': summary} with rows_per_second, peak_rss_mb
+  and ready_rss_mb."""
+  progress = progress or (lambda name, summary: None)
+  results = {}
+  with tempfile.TemporaryDirectory() as directory:
+    for kind in kinds:
+      for fmt in _formats(formats):
+        path = os.path.join(directory, f'{kind}.{fmt}')
+        samples = [_spawn(kind, fmt, path) for _ in range(repeat)]
+        seconds = sorted(sample['seconds'] for sample in samples)
+        rows = samples[0]['rows']
+        name = f'export_{kind}_{fmt}'
+        results[name] = summarize(
+          seconds, rows=rows,
+          rows_per_second=round(rows / seconds[len(seconds) // 2]),
+          peak_rss_mb=max(sample['peak_rss_mb'] for sample in samples),
+          ready_rss_mb=max(sample['ready_rss_mb'] for sample in samples),
+          output_mb=round(samples[0]['bytes'] / (1024 * 1024), 1))
+        progress(name, results[name])
+  return results
+
+
+if __name__ == '__main__':
+  _child(*sys.argv[1:4])
@@ -0,0 +1,119 @@
+import multiprocessing
+import threading
+import time
+import database
+import ids
+from models import db
+from benchmarks.results import summarize
+
+#----------------------------------------------------------------------------#
+# Show id allocation under concurrency.
+#
+# Several workers take ids from one generator at once. Each worker asks
+# for one id, then for a batch of --batch, and so on, until it has
+# --count; the samples are the time of each request. Per generator:
+#   - ids_<generator>_threads: --threads threads share one generator;
+#   - ids_<generator>_processes: --processes processes are forked from one
+#     that has already taken ids, so each inherits its block or worker id,
+#     as gunicorn workers of a preloaded app do. The parent takes more ids
+#     after the fork.
+# The 'sequence' generator needs PostgreSQL. tests/test_ids.py runs the
+# same workers and checks that no id is handed out twice.
+#----------------------------------------------------------------------------#
+
+GENERATORS = ('sequence', 'snowflake')
+
+
+def _generator(name, block_size):
+  if name == 'sequence':
+    return ids.SequenceAllocator('shows_id_seq', block_size)
+  # leasing worker ids, as a fixed SNOWFLAKE_WORKER_ID would be shared by
+  # the forked processes
+  return ids.SnowflakeGenerator()
+
+
+def _take(app, count, batch):
+  """(ids, seconds per request) of count ids taken from the app's
+  generator."""
+  taken, samples = [], []
+  with app.app_context():
+    try:
+      while len(taken) < count:
+        size = min(1 if len(samples) % 2 == 0 else batch, count - len(taken))
+        started = time.perf_counter()
+        taken.extend(ids.show_ids(size))
+        samples.append(time.perf_counter() - started)
+      db.session.commit()
+    finally:
+      db.session.close()
+  return taken, samples
+
+
+def _take_in_child(app, count, batch, results):
+  database.dispose(app)
+  results.put(_take(app, count, batch))
+
+
+def _summary(takes, elapsed):
+  samples = [sample for _, worker_samples in takes for sample in worker_samples]
+  total = sum(len(taken) for taken, _ in takes)
+  return summarize(samples, ids=total, ids_per_second=round(total / elapsed))
+
+
+def run_threads(app, threads, count, batch):
+  """([(ids, samples)] per thread, seconds)."""
+  takes = [None] * threads
+
+  def worker(index):
+    takes[index] = _take(app, count, batch)
+
+  workers = [threading.Thread(target=worker, args=(index,)) for index in range(threads)]
+  started = time.perf_counter()
+  for thread in workers:
+    thread.start()
+  for thread in workers:
+    thread.join()
+  return takes, time.perf_counter() - started
+
+
+def run_processes(app, processes, count, batch):
+  """([(ids, samples)] of the parent before the fork, each child and the
+  parent after, seconds the children took)."""
+  # the parent holds a block (or a worker id) before its children fork
+  takes = [_take(app, batch + 1, batch)]
+  database.dispose(app)
+  context = multiprocessing.get_context('fork')
+  results = context.Queue()
+  children = [context.Process(target=_take_in_child, args=(app, count, batch, results))
+              for _ in range(processes)]
+  started = time.perf_counter()
+  for child in children:
+    child.start()
+  # read before joining: a child exits only once its results are taken
+  takes.extend(results.get() for _ in children)
+  for child in children:
+    child.join()
+  elapsed = time.perf_counter() - started
+  takes.append(_take(app, batch + 1, batch))
+  return takes, elapsed
+
+
+def run(app, generators=GENERATORS, threads=8, processes=4, count=20000, batch=100,
+        block_size=None, progress=None):
+  """{case name: summary} with ids_per_second across all workers."""
+  progress = progress or (lambda name, summary: None)
+  block_size = block_size or app.config['ID_BLOCK_SIZE']
+  with app.app_context():
+    postgresql = db.engine.dialect.name == 'postgresql'
+  results = {}
+  for generator in generators:
+    if generator == 'sequence' and not postgresql:
+      raise ValueError('the sequence generator needs PostgreSQL')
+    app.extensions['show_ids'] = _generator(generator, block_size)
+    for mode, workers, run_workers in (('threads', threads, run_threads),
+                                       ('processes', processes, run_processes)):
+      name = f'ids_{generator}_{mode}'
+      takes, elapsed = run_workers(app, workers, count, batch)
+      results[name] = _summary(takes, elapsed)
+      progress(name, results[name])
+  return results
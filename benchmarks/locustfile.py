@@ -0,0 +1,116 @@
+import random
+import re
+from datetime import datetime, timedelta, timezone
+from locust import HttpUser, between, task
+
+#----------------------------------------------------------------------------#
+# Mixed-traffic load test:
+#
+#   locust -f benchmarks/locustfile.py --host http://127.0.0.1:5000
+#
+# Most users browse (listings, venue/artist pages, paging through shows,
+# revalidating pages they have seen), fewer search, and a few book shows.
+# Ids are read from the JSON API when a user starts, so the scenario works
+# against any data set, e.g. one made with 'python -m benchmarks datagen'.
+#----------------------------------------------------------------------------#
+
+CSRF_TOKEN = re.compile(r'name="csrf_token" type="hidden" value="([^"]+)"')
+SEARCH_TERMS = ['music', 'hop', 'band', 'park', 'the', 'velvet', 'club', 'sax']
+
+
+class FyyurUser(HttpUser):
+  abstract = True
+  wait_time = between(0.5, 2)
+
+  def on_start(self):
+    self.venue_ids = self._ids('venues')
+    self.artist_ids = self._ids('artists')
+
+  def _ids(self, resource):
+    response = self.client.get(f'/api/v1/{resource}?fields=id&limit=500',
+                               name=f'/api/v1/{resource}?fields=id')
+    return [item['id'] for item in response.json()['data']] or [1]
+
+
+class Browser(FyyurUser):
+  weight = 8
+
+  def on_start(self):
+    super().on_start()
+    self.etags = {}
+
+  def _page(self, path, name=None):
+    # revalidate pages seen before, as a browser does
+    headers = {}
+    if path in self.etags:
+      headers['If-None-Match'] = self.etags[path]
+    with self.client.get(path, headers=headers, name=name or path,
+                         catch_response=True) as response:
+      if response.status_code in (200, 304):
+        response.success()
+        if 'ETag' in response.headers:
+          self.etags[path] = response.headers['ETag']
+      return response
+
+  @task(3)
+  def venues(self):
+    self._page('/venues')
+
+  @task(2)
+  def artists(self):
+    self._page('/artists')
+
+  @task(5)
+  def venue(self):
+    self._page(f'/venues/{random.choice(self.venue_ids)}', name='/venues/[id]')
+
+  @task(5)
+  def artist(self):
+    self._page(f'/artists/{random.choice(self.artist_ids)}', name='/artists/[id]')
+
+  @task(3)
+  def shows(self):
+    # the first page, then a few more by following the cursor
+    response = self.client.get('/api/v1/shows?limit=30', name='/api/v1/shows')
+    self._page('/shows')
+    for _ in range(random.randint(0, 3)):
+      next_link = response.json().get('next')
+      if not next_link:
+        break
+      response = self.client.get(next_link, name='/api/v1/shows?after=[cursor]')
+
+
+class Searcher(FyyurUser):
+  weight = 3
+
+  @task(2)
+  def search_venues(self):
+    self.client.post('/venues/search', data={'search_term': random.choice(SEARCH_TERMS)})
+
+  @task(2)
+  def search_artists(self):
+    self.client.post('/artists/search', data={'search_term': random.choice(SEARCH_TERMS)})
+
+  @task(1)
+  def search_api(self):
+    self.client.get(f'/api/v1/search/venues?q={random.choice(SEARCH_TERMS)}',
+                    name='/api/v1/search/venues')
+
+
+class Booker(FyyurUser):
+  weight = 1
+  wait_time = between(2, 5)
+
+  @task
+  def create_show(self):
+    form = self.client.get('/shows/create')
+    match = CSRF_TOKEN.search(form.text)
+    start_time = datetime.now(timezone.utc) + timedelta(days=random.randint(1, 180))
+    data = {
+      'artist_id': random.choice(self.artist_ids),
+      'venue_id': random.choice(self.venue_ids),
+      'start_time': start_time.strftime('%Y-%m-%d %H:%M:%S'),
+    }
+    if match:
+      data['csrf_token'] = match.group(1)
+    self.client.post('/shows/create', data=data)
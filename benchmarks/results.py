@@ -0,0 +1,112 @@
+import json
+import os
+import platform
+import subprocess
+import sys
+import time
+from datetime import datetime, timezone
+
+#----------------------------------------------------------------------------#
+# Benchmark results: timings summarized per case, saved as JSON with what
+# is needed to tell runs apart (commit, Python, database, scale), and
+# compared run against run.
+#----------------------------------------------------------------------------#
+
+RESULTS_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'results')
+
+
+def _percentile(ordered, share):
+  return ordered[min(int(len(ordered) * share), len(ordered) - 1)]
+
+
+def summarize(samples, **extra):
+  """Timing stats, in milliseconds, of samples given in seconds."""
+  ordered = sorted(samples)
+  summary = {
+    'n': len(ordered),
+    'mean_ms': round(sum(ordered) / len(ordered) * 1000, 3),
+    'p50_ms': round(_percentile(ordered, 0.5) * 1000, 3),
+    'p95_ms': round(_percentile(ordered, 0.95) * 1000, 3),
+    'p99_ms': round(_percentile(ordered, 0.99) * 1000, 3),
+    'max_ms': round(ordered[-1] * 1000, 3),
+  }
+  summary.update(extra)
+  return summary
+
+
+def measure(run, iterations, warmup=0):
+  """Calls run() warmup + iterations times; the seconds each of the last
+  iterations calls took."""
+  for _ in range(warmup):
+    run()
+  samples = []
+  for _ in range(iterations):
+    started = time.perf_counter()
+    run()
+    samples.append(time.perf_counter() - started)
+  return samples
+
+
+def _git_commit():
+  try:
+    return subprocess.run(
+      ['git', 'rev-parse', '--short', 'HEAD'], capture_output=True, text=True,
+      cwd=os.path.dirname(RESULTS_DIR), check=True
+    ).stdout.strip()
+  except (OSError, subprocess.CalledProcessError):
+    return None
+
+
+def environment(**extra):
+  data = {
+    'time': datetime.now(timezone.utc).isoformat(timespec='seconds'),
+    'commit': _git_commit(),
+    'python': sys.version.split()[0],
+    'platform': platform.platform(),
+    'cpus': os.cpu_count(),
+  }
+  data.update(extra)
+  return data
+
+
+def save(suite, cases, path=None, **environment_extra):
+  """Writes {suite, environment, cases} to path (by default
+  results/<suite>-<time>.json) and returns the path."""
+  data = {'suite': suite, 'environment': environment(**environment_extra), 'cases': cases}
+  if path is None:
+    os.makedirs(RESULTS_DIR, exist_ok=True)
+    stamp = datetime.now(timezone.utc).strftime('%Y%m%dT%H%M%S')
+    path = os.path.join(RESULTS_DIR, f'{suite}-{stamp}.json')
+  with open(path, 'w') as f:
+    json.dump(data, f, indent=2, default=str)
+    f.write('\n')
+  return path
+
+
+def load(path):
+  with open(path) as f:
+    return json.load(f)
+
+
+# the stat compared per case, and whether lower is better
+COMPARED = (('p50_ms', True), ('p95_ms', True), ('requests_per_second', False),
+            ('shows_per_second', False), ('ids_per_second', False),
+            ('rows_per_second', False), ('peak_rss_mb', True))
+
+
+def compare(baseline, current, threshold=0.1):
+  """[(case, stat, before, after, change, regressed)] for the cases and
+  stats both runs have; change is relative (0.1 = 10% higher), and a
+  change worse than threshold counts as a regression."""
+  rows = []
+  for case, after in current['cases'].items():
+    before = baseline['cases'].get(case)
+    if before is None:
+      continue
+    for stat, lower_is_better in COMPARED:
+      if stat not in before or stat not in after or not before[stat]:
+        continue
+      change = (after[stat] - before[stat]) / before[stat]
+      worse = change if lower_is_better else -change
+      rows.append((case, stat, before[stat], after[stat], change, worse > threshold))
+  return rows
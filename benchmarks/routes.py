@@ -0,0 +1,267 @@
+import json
+import random
+from contextlib import contextmanager
+from datetime import datetime, timedelta, timezone
+import babel.dates
+import dateutil.parser
+import jinja2
+import formatting
+import metrics
+import profiler
+from models import db, Venue, Artist, Show
+from serializers import dumps
+from benchmarks.results import measure, summarize
+
+#----------------------------------------------------------------------------#
+# Route micro-benchmarks.
+#
+# Each case requests one route through the Flask test client, in-process:
+# no server and no network, so the numbers are the app's own (view, ORM,
+# database, template and hook time). Detail pages rotate over a sample of
+# ids, the most-booked ones included, and run with the page cache off
+# unless the case is about the cache. The *_no_metrics cases repeat a
+# route with the metrics hooks and template timing off; their
+# metrics_overhead_p50_ms is what metrics add to each request of it. A few
+# cases time pieces below the routes: JSON serialization, the template
+# datetime filter and metrics, the request hooks included.
+#----------------------------------------------------------------------------#
+
+SAMPLE_SIZE = 100
+
+
+class Case:
+  """One route to benchmark. path may be a function of an id sample
+  (see sample_ids()) and a Random, for routes that take ids."""
+
+  def __init__(self, name, path, method='GET', data=None, headers=None,
+               page_cache=False, metrics=True, iterations=None, statuses=(200,)):
+    self.name = name
+    self.path = path
+    self.method = method
+    self.data = data
+    self.headers = headers or {}
+    self.page_cache = page_cache
+    self.metrics = metrics
+    self.iterations = iterations
+    self.statuses = statuses
+
+  def request(self, client, ids, rng):
+    path = self.path(ids, rng) if callable(self.path) else self.path
+    headers = self.headers(client, path) if callable(self.headers) else self.headers
+    response = client.open(path, method=self.method, data=self.data, headers=headers)
+    # read streamed bodies to the end
+    response.get_data()
+    if response.status_code not in self.statuses:
+      raise AssertionError(f'{self.name}: {path} returned {response.status_code}')
+    return response
+
+
+def sample_ids(rng, size=SAMPLE_SIZE):
+  """{'venue': [...], 'artist': [...]}: the ids with the most shows, then
+  random others, so detail pages cover both heavy and typical rows."""
+  ids = {}
+  for category, model in (('venue', Venue), ('artist', Artist)):
+    busiest = [row[0] for row in db.session.query(model.id).order_by(
+      db.desc(model.num_upcoming_shows + model.num_past_shows)).limit(size // 10)]
+    everyone = [row[0] for row in db.session.query(model.id)]
+    others = rng.sample(everyone, min(size - len(busiest), len(everyone)))
+    ids[category] = busiest + others
+  db.session.close()
+  return ids
+
+
+def _one(category):
+  return lambda ids, rng: f'/{category}s/{rng.choice(ids[category])}'
+
+
+def _busiest(category):
+  return lambda ids, rng: f'/{category}s/{ids[category][0]}'
+
+
+def _revalidate():
+  # If-None-Match with the page's current ETag, fetched once per path
+  etags = {}
+
+  def headers(client, path):
+    if path not in etags:
+      etags[path] = client.get(path).headers['ETag']
+    return {'If-None-Match': etags[path]}
+  return headers
+
+
+def route_cases():
+  search_venues = {'search_term': 'music'}
+  search_artists = {'search_term': 'band'}
+  export_headers = {'Authorization': 'Bearer benchmark'}
+  return [
+    Case('venues', '/venues'),
+    Case('artists', '/artists'),
+    Case('shows', '/shows'),
+    Case('shows_all_100', '/shows?scope=all&limit=100'),
+    Case('shows_streamed', '/shows?stream=1'),
+    Case('venue_detail', _one('venue')),
+    Case('artist_detail', _one('artist')),
+    Case('venue_detail_cached', _busiest('venue'), page_cache=True),
+    Case('venue_detail_304', _busiest('venue'), headers=_revalidate(), statuses=(304,)),
+    Case('search_venues', '/venues/search', method='POST', data=search_venues),
+    Case('search_artists', '/artists/search', method='POST', data=search_artists),
+    Case('api_venues', '/api/v1/venues?limit=50'),
+    Case('api_venues_embed_shows', '/api/v1/venues?limit=50&embed=shows'),
+    Case('api_venue', lambda ids, rng: f"/api/v1/venues/{rng.choice(ids['venue'])}?embed=shows"),
+    Case('api_shows', '/api/v1/shows?limit=50'),
+    Case('api_search', '/api/v1/search/venues?q=music'),
+    Case('export_venues_jsonl', '/export/venues.jsonl', headers=export_headers, iterations=3),
+    Case('metrics', '/metrics'),
+    # cheap requests, where the metrics hooks weigh most
+    Case('venue_detail_cached_no_metrics', _busiest('venue'), page_cache=True, metrics=False),
+    Case('venue_detail_304_no_metrics', _busiest('venue'), headers=_revalidate(),
+         statuses=(304,), metrics=False),
+    Case('api_venue_no_metrics',
+         lambda ids, rng: f"/api/v1/venues/{rng.choice(ids['venue'])}?embed=shows",
+         metrics=False),
+  ]
+
+
+@contextmanager
+def _page_cache(app, enabled):
+  cache = app.extensions.get('page_cache')
+  if not enabled:
+    app.extensions['page_cache'] = None
+  try:
+    yield
+  finally:
+    app.extensions['page_cache'] = cache
+
+
+@contextmanager
+def _metrics(app, enabled):
+  # takes metrics.init_app's hooks and timed templates out of the app
+  hooks = ((app.before_request_funcs, metrics._start_request),
+           (app.after_request_funcs, metrics._record_status),
+           (app.teardown_request_funcs, metrics._finish_request))
+  installed = 'metrics' in app.extensions
+  if enabled or not installed:
+    yield
+    return
+  template_class = app.jinja_env.template_class
+  for funcs, hook in hooks:
+    funcs[None].remove(hook)
+  app.jinja_env.template_class = jinja2.Template
+  app.jinja_env.cache.clear()
+  try:
+    yield
+  finally:
+    for funcs, hook in hooks:
+      funcs[None].append(hook)
+    app.jinja_env.template_class = template_class
+    app.jinja_env.cache.clear()
+
+
+def run_route(app, case, ids, iterations, warmup, seed=0):
+  rng = random.Random(seed)
+  client = app.test_client()
+  with _page_cache(app, case.page_cache), _metrics(app, case.metrics):
+    # the first request fills lazy state (search index, ETags); the
+    # second one counts the queries
+    case.request(client, ids, rng)
+    with profiler.profile() as queries:
+      case.request(client, ids, rng)
+    count = case.iterations or iterations
+    samples = measure(lambda: case.request(client, ids, rng), count,
+                      warmup=min(warmup, count))
+  return summarize(samples, queries=queries.queries)
+
+
+#----------------------------------------------------------------------------#
+# Below the routes.
+#----------------------------------------------------------------------------#
+
+def _api_page(limit=500):
+  # the dicts the API would serialize for a page of venues
+  rows = Venue.query.order_by(Venue.id).limit(limit).all()
+  data = {'data': [venue.to_dictionary() for venue in rows], 'next': None}
+  db.session.close()
+  return data
+
+
+def _string_datetime_filter(value, format='full'):
+  # the datetime filter as it was before formatting.py: templates were
+  # given ISO strings, parsed again and formatted by pattern each call
+  pattern = formatting.FORMATS[format]
+  return babel.dates.format_datetime(dateutil.parser.parse(value), pattern, locale='en')
+
+
+def _show_times(count=1000, distinct=200):
+  # count show times, each distinct one repeated as on a listing page
+  start = datetime(2026, 1, 1, 20, tzinfo=timezone.utc)
+  return [start + timedelta(hours=7 * (index % distinct)) for index in range(count)]
+
+
+def _request_hooks(app, count=1000):
+  # the metrics hooks around count requests, without the requests
+  response = app.response_class()
+  with app.test_request_context('/venues/1'):
+    for _ in range(count):
+      metrics._start_request()
+      metrics._record_status(response)
+      metrics._finish_request(None)
+
+
+def micro_cases(app):
+  """{name: function} of the non-route cases, run in an app context."""
+  page = _api_page()
+  times = _show_times()
+  strings = [value.strftime('%Y-%m-%dT%H:%M:%S.%f')[:-3] + 'Z' for value in times]
+  datetime_filter = app.jinja_env.filters['datetime']
+  registry = metrics.Registry()
+  counter = metrics.Counter('benchmark_counter_total', 'Benchmark only.', ('label',),
+                            registry=registry)
+  histogram = metrics.Histogram('benchmark_seconds', 'Benchmark only.', ('label',),
+                                registry=registry)
+  return {
+    'serialize_page_json': lambda: json.dumps(page, default=str).encode(),
+    'serialize_page_dumps': lambda: dumps(page),
+    'datetime_filter_string_x1000': lambda: [_string_datetime_filter(value) for value in strings],
+    'datetime_filter_compiled_x1000':
+      lambda: [formatting.format_datetime(value, 'full') for value in times],
+    'datetime_filter_x1000': lambda: [datetime_filter(value, 'full') for value in times],
+    'metrics_counter_inc_x1000': lambda: [counter.labels('a').inc() for _ in range(1000)],
+    'metrics_histogram_observe_x1000':
+      lambda: [histogram.labels('a').observe(0.003) for _ in range(1000)],
+    'metrics_render': metrics.REGISTRY.render,
+    'metrics_request_hooks_x1000': lambda: _request_hooks(app),
+  }
+
+
+def run(app, iterations=200, warmup=20, only=None, seed=0, progress=None):
+  """{case name: summary} for every case, or those named in only."""
+  progress = progress or (lambda name, summary: None)
+  app.config['EXPORT_TOKEN'] = 'benchmark'
+  results = {}
+  with app.app_context():
+    ids = sample_ids(random.Random(seed))
+  # outside an app context: each request gets its own, as when served
+  for case in route_cases():
+    if only and case.name not in only:
+      continue
+    results[case.name] = run_route(app, case, ids, iterations, warmup, seed)
+    with_metrics = results.get(case.name[:-len('_no_metrics')])
+    if not case.metrics and with_metrics is not None:
+      results[case.name]['metrics_overhead_p50_ms'] = round(
+        with_metrics['p50_ms'] - results[case.name]['p50_ms'], 3)
+    progress(case.name, results[case.name])
+  with app.app_context():
+    for name, function in micro_cases(app).items():
+      if only and name not in only:
+        continue
+      results[name] = summarize(measure(function, iterations, warmup=warmup))
+      progress(name, results[name])
+  return results
+
+
+def data_size():
+  return {
+    'venues': db.session.query(db.func.count(Venue.id)).scalar(),
+    'artists': db.session.query(db.func.count(Artist.id)).scalar(),
+    'shows': db.session.query(db.func.count(Show.id)).scalar(),
+  }
@@ -0,0 +1,85 @@
+import time
+from datetime import datetime, timedelta, timezone
+import counters
+from models import db, Venue, Artist, Show
+from benchmarks.results import summarize
+
+#----------------------------------------------------------------------------#
+# Bulk scheduling throughput.
+#
+# Each sample posts one batch of shows to POST /api/v1/shows through the
+# test client and times the whole request: JSON parsing, the venue/artist
+# checks, the advisory locks, the conflict query and the insert, committed.
+# The batch books the venues and artists in turn, at free times from
+# ANCHOR on, and its shows are deleted again after each sample.
+#   - schedule_<size>: the batch is accepted;
+#   - schedule_<size>_conflicting: the same batch is posted a second time,
+#     so every show conflicts and the request is rejected with a 409.
+#----------------------------------------------------------------------------#
+
+# far enough ahead to be free of generated shows
+ANCHOR = datetime(2100, 1, 1, tzinfo=timezone.utc)
+# apart enough that no two shows of the batch overlap
+SPACING = timedelta(hours=3)
+TOKEN = 'benchmark'
+
+
+def batch(size):
+  """size shows for POST /api/v1/shows, cycling through the venues and
+  artists."""
+  venue_ids = [item_id for item_id, in db.session.query(Venue.id).order_by(Venue.id)]
+  artist_ids = [item_id for item_id, in db.session.query(Artist.id).order_by(Artist.id)]
+  db.session.close()
+  if not venue_ids or not artist_ids:
+    raise ValueError('no venues or artists; run datagen first')
+  return [{
+    'venue_id': venue_ids[index % len(venue_ids)],
+    'artist_id': artist_ids[index % len(artist_ids)],
+    'start_time': (ANCHOR + index * SPACING).isoformat(),
+    'duration': 120
+  } for index in range(size)]
+
+
+def clean_up():
+  """Deletes the benchmark's shows and takes them off the counters."""
+  scheduled = Show.start_time >= ANCHOR
+  shows = db.select([Show.venue_id, Show.artist_id, Show.is_past]).where(scheduled).subquery()
+  counters.uncount(shows)
+  db.session.execute(Show.__table__.delete().where(scheduled))
+  db.session.commit()
+  db.session.close()
+
+
+def _post(client, shows, status):
+  started = time.perf_counter()
+  response = client.post('/api/v1/shows', json={'shows': shows},
+                         headers={'Authorization': f'Bearer {TOKEN}'})
+  elapsed = time.perf_counter() - started
+  if response.status_code != status:
+    raise AssertionError(f'POST /api/v1/shows returned {response.status_code}, not {status}')
+  return elapsed
+
+
+def run(app, size=10000, repeat=5, progress=None):
+  """{case name: summary} with shows_per_second at the median."""
+  progress = progress or (lambda name, summary: None)
+  app.config['API_WRITE_TOKEN'] = TOKEN
+  app.config['SCHEDULE_MAX_SHOWS'] = max(size, app.config['SCHEDULE_MAX_SHOWS'])
+  client = app.test_client()
+  with app.app_context():
+    shows = batch(size)
+    clean_up()
+  results = {}
+  for name, conflicting in ((f'schedule_{size}', False), (f'schedule_{size}_conflicting', True)):
+    samples = []
+    for _ in range(repeat):
+      if conflicting:
+        _post(client, shows, 201)
+      samples.append(_post(client, shows, 409 if conflicting else 201))
+      with app.app_context():
+        clean_up()
+    summary = summarize(samples)
+    summary['shows_per_second'] = round(size / (summary['p50_ms'] / 1000))
+    results[name] = summary
+    progress(name, summary)
+  return results
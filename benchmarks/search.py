@@ -0,0 +1,99 @@
+from contextlib import contextmanager
+from sqlalchemy import inspect
+import search
+from benchmarks.datagen import Scale, generate, reset
+from benchmarks.routes import Case, run_route
+from models import db, Venue, Artist
+
+#----------------------------------------------------------------------------#
+# Name search latency by table size.
+#
+# For each row count the venue and artist tables are emptied and filled
+# with that many generated venues and as many artists (no shows), then the
+# search routes are timed through the test client, as in routes.py. The
+# terms go from common ('velvet', in about one name in eight) through rare
+# (a number, in a handful of names) to matching nothing, so the cases show
+# both the index lookup and the cost of ranking and counting many matches.
+#
+# Each size also runs the same cases as ilike_*: the search as it was
+# before the trigram indexes, an unranked name ILIKE '%term%', with the
+# pg_trgm indexes dropped for the duration (and built again after), so
+# every case has a baseline in the same results file.
+#----------------------------------------------------------------------------#
+
+ROWS = (10000, 100000, 1000000)
+
+# generated names look like 'The Velvet Hop 123' and 'Velvet Youth 45'
+TERMS = {'common': 'velvet', 'rare': '4242', 'none': 'zeppelin'}
+
+
+def search_cases(rows):
+  cases = []
+  for kind, term in TERMS.items():
+    cases += [
+      Case(f'search_venues_{kind}_{rows}', '/venues/search', method='POST',
+           data={'search_term': term}),
+      Case(f'search_artists_{kind}_{rows}', '/artists/search', method='POST',
+           data={'search_term': term}),
+      Case(f'api_search_venues_{kind}_{rows}', f'/api/v1/search/venues?q={term}'),
+    ]
+  return cases
+
+
+class IlikeSearch:
+  """The search before the trigram indexes: ILIKE '%term%', unranked."""
+  name = 'ilike'
+
+  def match(self, model, term):
+    return model.name.ilike(f'%{term}%'), db.cast(db.literal(0.0), db.Float)
+
+
+@contextmanager
+def _ilike(app):
+  # the configured engine swapped for IlikeSearch, and the name indexes
+  # it would otherwise get to use dropped
+  engine = app.extensions['search']
+  with app.app_context():
+    existing = {index['name'] for table in ('venues', 'artists')
+                for index in inspect(db.engine).get_indexes(table)}
+    dropped = [index for model in (Venue, Artist) for index in model.__table__.indexes
+               if 'trgm' in index.name and index.name in existing]
+    for index in dropped:
+      index.drop(db.engine)
+  app.extensions['search'] = IlikeSearch()
+  try:
+    yield
+  finally:
+    app.extensions['search'] = engine
+    with app.app_context():
+      for index in dropped:
+        index.create(db.engine)
+
+
+def fill(rows, seed=0):
+  """Replaces the catalog with rows venues and rows artists."""
+  with db.engine.begin() as connection:
+    reset(connection)
+  generate(Scale(0, venues=rows, artists=rows), seed=seed)
+
+
+def run(app, sizes=ROWS, iterations=200, warmup=20, seed=0, progress=None):
+  """{case name: summary}, the ilike_* baselines included; empties and
+  refills the catalog per size."""
+  progress = progress or (lambda name, summary: None)
+  results = {}
+  for rows in sizes:
+    with app.app_context():
+      fill(rows, seed)
+    # a fresh engine, so an in-process (ngram) index is built from the new rows
+    search.init_app(app)
+    ids = {'venue': [], 'artist': []}
+    for case in search_cases(rows):
+      results[case.name] = run_route(app, case, ids, iterations, warmup, seed)
+      progress(case.name, results[case.name])
+    with _ilike(app):
+      for case in search_cases(rows):
+        case.name = f'ilike_{case.name}'
+        results[case.name] = run_route(app, case, ids, iterations, warmup, seed)
+        progress(case.name, results[case.name])
+  return results
@@ -0,0 +1,162 @@
+import http.client
+import os
+import signal
+import socket
+import subprocess
+import sys
+import threading
+import time
+from benchmarks.results import summarize
+
+#----------------------------------------------------------------------------#
+# Worker model comparison.
+#
+# Starts the app under each server configuration in turn (gunicorn with
+# sync, gthread and gevent workers, and the asgi.py read path under
+# uvicorn), drives it with closed-loop HTTP clients (each sends its next
+# request when the last one is answered) and records requests per second
+# and latency per route. The clients are Python threads on the same
+# machine, so they top out at a few thousand requests per second; for more,
+# or for mixed traffic, use locustfile.py or wrk against the same servers.
+#----------------------------------------------------------------------------#
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+ROUTES = {
+  'venues': '/venues',
+  'venue_detail': '/venues/1',
+  'shows': '/shows',
+  'search': '/api/v1/search/venues?q=music',
+}
+# the async path only serves these
+ASGI_ROUTES = ('venues', 'venue_detail', 'shows')
+
+MODELS = ('sync', 'gthread', 'gevent', 'asgi')
+
+
+def _free_port():
+  with socket.socket() as s:
+    s.bind(('127.0.0.1', 0))
+    return s.getsockname()[1]
+
+
+def command(model, port, workers, threads):
+  """(argv, environment) starting the app under model on port."""
+  env = dict(os.environ, WEB_WORKERS=str(workers), WEB_THREADS=str(threads))
+  if model == 'asgi':
+    return [sys.executable, '-m', 'uvicorn', 'asgi:application', '--host', '127.0.0.1',
+            '--port', str(port), '--workers', str(workers), '--log-level', 'warning'], env
+  env.update(WEB_WORKER_CLASS=model, WEB_BIND=f'127.0.0.1:{port}')
+  return [sys.executable, '-m', 'gunicorn', '-c', 'gunicorn.conf.py', 'wsgi:app'], env
+
+
+def _wait_ready(port, process, timeout=60):
+  deadline = time.monotonic() + timeout
+  while time.monotonic() < deadline:
+    if process.poll() is not None:
+      raise RuntimeError(f'server exited with {process.returncode}')
+    try:
+      connection = http.client.HTTPConnection('127.0.0.1', port, timeout=5)
+      connection.request('GET', '/venues')
+      connection.getresponse().read()
+      return
+    except OSError:
+      time.sleep(0.2)
+  raise RuntimeError(f'server not answering on port {port} after {timeout}s')
+
+
+class Server:
+  def __init__(self, model, workers, threads, log):
+    self.model = model
+    self.port = _free_port()
+    argv, env = command(model, self.port, workers, threads)
+    self.process = subprocess.Popen(argv, env=env, cwd=ROOT, stdout=log, stderr=log)
+
+  def __enter__(self):
+    try:
+      _wait_ready(self.port, self.process)
+    except Exception:
+      self.stop()
+      raise
+    return self
+
+  def __exit__(self, *exc):
+    self.stop()
+
+  def stop(self):
+    if self.process.poll() is None:
+      self.process.send_signal(signal.SIGTERM)
+      try:
+        self.process.wait(30)
+      except subprocess.TimeoutExpired:
+        self.process.kill()
+        self.process.wait()
+
+
+def load(port, path, concurrency, duration):
+  """Summary of the latencies of concurrency clients requesting path for
+  duration seconds, with requests_per_second and errors."""
+  latencies = [[] for _ in range(concurrency)]
+  errors = [0] * concurrency
+  deadline = time.perf_counter() + duration
+
+  def client(index):
+    connection = http.client.HTTPConnection('127.0.0.1', port, timeout=30)
+    while time.perf_counter() < deadline:
+      started = time.perf_counter()
+      try:
+        connection.request('GET', path)
+        response = connection.getresponse()
+        response.read()
+        ok = response.status == 200
+      except (OSError, http.client.HTTPException):
+        ok = False
+        connection.close()
+        connection = http.client.HTTPConnection('127.0.0.1', port, timeout=30)
+      if ok:
+        latencies[index].append(time.perf_counter() - started)
+      else:
+        errors[index] += 1
+    connection.close()
+
+  started = time.perf_counter()
+  threads = [threading.Thread(target=client, args=(index,)) for index in range(concurrency)]
+  for thread in threads:
+    thread.start()
+  for thread in threads:
+    thread.join()
+  elapsed = time.perf_counter() - started
+  samples = [value for values in latencies for value in values]
+  if not samples:
+    return {'n': 0, 'errors': sum(errors), 'requests_per_second': 0}
+  return summarize(samples, errors=sum(errors),
+                   requests_per_second=round(len(samples) / elapsed, 1))
+
+
+def _available(model):
+  module = {'gevent': 'gevent', 'asgi': 'uvicorn'}.get(model, 'gunicorn')
+  try:
+    __import__(module)
+  except ImportError:
+    return False
+  return True
+
+
+def run(models=MODELS, workers=2, threads=4, concurrency=16, duration=10, progress=None,
+        log=subprocess.DEVNULL):
+  """{'<model>/<route>': summary} for every available model and route."""
+  progress = progress or (lambda name, summary: None)
+  results = {}
+  for model in models:
+    if not _available(model):
+      progress(model, None)
+      continue
+    routes = ASGI_ROUTES if model == 'asgi' else ROUTES
+    with Server(model, workers, threads, log) as server:
+      for route in routes:
+        # warm up connections, caches and the search index
+        load(server.port, ROUTES[route], concurrency, 1)
+        name = f'{model}/{route}'
+        results[name] = load(server.port, ROUTES[route], concurrency, duration)
+        progress(name, results[name])
+  return results
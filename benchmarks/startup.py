@@ -0,0 +1,109 @@
+import json
+import os
+import subprocess
+import sys
+import tempfile
+import time
+from benchmarks.results import summarize
+
+#----------------------------------------------------------------------------#
+# First-request latency.
+#
+# Each sample is a fresh Python process that loads the app and requests one
+# route twice through the test client, as a new or recycled worker would
+# serve it. The process runs in one of three modes:
+#   - cold: no template bytecode cache and no warm-up, so the first request
+#     compiles the templates it renders;
+#   - bytecode: templates are loaded from a cache filled beforehand, as by
+#     'flask templates compile';
+#   - warm: the bytecode cache plus templating.warm_up() before the first
+#     request, as gunicorn's post_fork does.
+# Every mode pays the same other first-use costs (database connections,
+# SQL compilation), so the differences between modes are the templates'.
+#----------------------------------------------------------------------------#
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+ROUTES = {
+  'home': '/',
+  'venues': '/venues',
+  'venue_detail': '/venues/1',
+  'artist_detail': '/artists/1',
+  'shows': '/shows',
+  'new_show': '/shows/create',
+}
+
+MODES = ('cold', 'bytecode', 'warm')
+
+
+def _load_app(directory):
+  # in the child, before anything imports the app
+  import config
+  config.PAGE_CACHE_BACKEND = None
+  config.TEMPLATE_BYTECODE_DIR = directory
+  from app import app
+  return app
+
+
+def _child(mode, path, directory):
+  started = time.perf_counter()
+  app = _load_app(directory if mode != 'cold' else '')
+  if mode == 'warm':
+    from templating import warm_up
+    warm_up(app)
+  ready = time.perf_counter()
+  client = app.test_client()
+  timings = []
+  for _ in range(2):
+    request_started = time.perf_counter()
+    status = client.get(path).status_code
+    timings.append(time.perf_counter() - request_started)
+  print(json.dumps({'status': status, 'ready': ready - started, 'first': timings[0],
+                    'second': timings[1]}))
+
+
+def _compile(directory):
+  from templating import compile_all
+  compile_all(_load_app(directory))
+
+
+def _spawn(*args):
+  output = subprocess.run(
+    [sys.executable, '-m', 'benchmarks.startup', *args], cwd=ROOT, check=True,
+    capture_output=True, text=True
+  ).stdout
+  # the app's JSON log records may share stdout
+  samples = [line for line in output.splitlines() if line.startswith('{"status"')]
+  return json.loads(samples[-1]) if samples else None
+
+
+def run(modes=MODES, routes=None, repeat=5, progress=None):
+  """{'<mode>/<route>': summary of first requests} with ready_ms (process
+  start to ready to serve) and steady_p50_ms (the second request)."""
+  progress = progress or (lambda name, summary: None)
+  routes = routes or tuple(ROUTES)
+  results = {}
+  with tempfile.TemporaryDirectory() as directory:
+    _spawn('compile', directory)
+    for mode in modes:
+      for route in routes:
+        samples = []
+        for _ in range(repeat):
+          samples.append(_spawn(mode, ROUTES[route], directory))
+        name = f'{mode}/{route}'
+        ready = sorted(sample['ready'] for sample in samples)
+        second = sorted(sample['second'] for sample in samples)
+        results[name] = summarize(
+          [sample['first'] for sample in samples],
+          ready_ms=round(ready[len(ready) // 2] * 1000, 3),
+          steady_p50_ms=round(second[len(second) // 2] * 1000, 3),
+          errors=sum(sample['status'] != 200 for sample in samples))
+        progress(name, results[name])
+  return results
+
+
+if __name__ == '__main__':
+  if sys.argv[1] == 'compile':
+    _compile(sys.argv[2])
+  else:
+    _child(*sys.argv[1:4])
@@ -0,0 +1,136 @@
+import threading
+import time
+from collections import OrderedDict
+from flask import current_app
+
+#----------------------------------------------------------------------------#
+# Page cache.
+#
+# Backends share get/set/stats. A page's key holds its entity and
+# the entity's version ('venue:1:<version>', see versions.py), so a write
+# from any worker changes the key the next request looks up: pages are
+# never invalidated, a superseded one just stops being asked for and ages
+# out (LRU eviction, TTL).
+#----------------------------------------------------------------------------#
+
+class CacheStats:
+  def __init__(self):
+    self.hits = 0
+    self.misses = 0
+    self.evictions = 0
+    self.expirations = 0
+    self.lock = threading.Lock()
+
+  def incr(self, name, amount=1):
+    with self.lock:
+      setattr(self, name, getattr(self, name) + amount)
+
+  def as_dict(self):
+    with self.lock:
+      lookups = self.hits + self.misses
+      return {
+        'hits': self.hits,
+        'misses': self.misses,
+        'evictions': self.evictions,
+        'expirations': self.expirations,
+        'hit_ratio': self.hits / lookups if lookups else 0.0
+      }
+
+
+class LRUCache:
+  """In-process cache bounded by entry count, with a per-entry TTL."""
+  name = 'memory'
+
+  def __init__(self, max_entries=1024, ttl=300, clock=time.monotonic):
+    self.max_entries = max_entries
+    self.ttl = ttl
+    self.clock = clock
+    self.entries = OrderedDict()
+    self.lock = threading.Lock()
+    self.counters = CacheStats()
+
+  def get(self, key):
+    with self.lock:
+      entry = self.entries.get(key)
+      if entry is not None:
+        value, expires_at = entry
+        if expires_at > self.clock():
+          self.entries.move_to_end(key)
+          self.counters.incr('hits')
+          return value
+        del self.entries[key]
+        self.counters.incr('expirations')
+    self.counters.incr('misses')
+    return None
+
+  def set(self, key, value, ttl=None):
+    expires_at = self.clock() + (self.ttl if ttl is None else ttl)
+    with self.lock:
+      self.entries[key] = (value, expires_at)
+      self.entries.move_to_end(key)
+      while len(self.entries) > self.max_entries:
+        self.entries.popitem(last=False)
+        self.counters.incr('evictions')
+
+  def stats(self):
+    data = self.counters.as_dict()
+    with self.lock:
+      data['entries'] = len(self.entries)
+    return data
+
+
+class RedisCache:
+  """Cache on a Redis-compatible client (anything with get/set).
+
+  Expiry and eviction are left to the server (set a maxmemory policy), so
+  only hits and misses are counted here.
+  """
+  name = 'redis'
+
+  def __init__(self, client, ttl=300, prefix='fyyur:page:'):
+    self.client = client
+    self.ttl = ttl
+    self.prefix = prefix
+    self.counters = CacheStats()
+
+  @classmethod
+  def from_url(cls, url, **kwargs):
+    import redis
+    return cls(redis.Redis.from_url(url), **kwargs)
+
+  def get(self, key):
+    value = self.client.get(self.prefix + key)
+    if value is None:
+      self.counters.incr('misses')
+      return None
+    self.counters.incr('hits')
+    return value.decode() if isinstance(value, bytes) else value
+
+  def set(self, key, value, ttl=None):
+    self.client.set(self.prefix + key, value, ex=self.ttl if ttl is None else ttl)
+
+  def stats(self):
+    return self.counters.as_dict()
+
+
+def page_key(category, item_id, version):
+  return f'{category}:{item_id}:{version}'
+
+
+def page_cache():
+  """The app's page cache, or None when PAGE_CACHE_BACKEND is unset."""
+  return current_app.extensions.get('page_cache')
+
+
+def init_app(app):
+  backend = app.config.get('PAGE_CACHE_BACKEND')
+  ttl = app.config.get('PAGE_CACHE_TTL', 300)
+  if backend is None:
+    cache = None
+  elif backend == 'memory':
+    cache = LRUCache(max_entries=app.config.get('PAGE_CACHE_MAX_ENTRIES', 1024), ttl=ttl)
+  elif backend == 'redis':
+    cache = RedisCache.from_url(app.config['PAGE_CACHE_REDIS_URL'], ttl=ttl)
+  else:
+    raise ValueError(f'unknown PAGE_CACHE_BACKEND {backend!r}')
+  app.extensions['page_cache'] = cache
@@ -0,0 +1,298 @@
+import sys
+import time
+import click
+import counters
+import partitions
+import importer
+import exporter
+import profiler
+import templating
+from flask import current_app
+from flask.cli import with_appcontext
+from datetime import datetime, timedelta, timezone
+from models import (
+  db,
+  Venue,
+  VenueGenre,
+  Artist,
+  ArtistGenre,
+  Show
+)
+
+#----------------------------------------------------------------------------#
+# CLI commands, registered on the app with init_app(app).
+#----------------------------------------------------------------------------#
+
+def _index_access_paths():
+  # the lookups the venue/artist pages, the home page and show scheduling
+  # run, with a representative id
+  current_time = datetime.now(timezone.utc)
+  # the overlap test of scheduling.CONFLICTS for a two hour slot
+  booked = db.func.tstzrange(Show.start_time, Show.end_time).op('&&')(
+    db.func.tstzrange(current_time, current_time + timedelta(hours=2)))
+  return [
+    ('future shows by venue',
+     Show.query.filter(Show.venue_id == 1, Show.start_time > current_time)),
+    ('past shows by venue',
+     Show.query.filter(Show.venue_id == 1, Show.start_time < current_time)),
+    ('future shows by artist',
+     Show.query.filter(Show.artist_id == 1, Show.start_time > current_time)),
+    ('past shows by artist',
+     Show.query.filter(Show.artist_id == 1, Show.start_time < current_time)),
+    ('shows of a venue', Show.query.filter(Show.venue_id == 1)),
+    ('shows of an artist', Show.query.filter(Show.artist_id == 1)),
+    ('genres of a venue', VenueGenre.query.filter(VenueGenre.venue_id == 1)),
+    ('genres of an artist', ArtistGenre.query.filter(ArtistGenre.artist_id == 1)),
+    ('newest venues', Venue.query.order_by(Venue.created_date.desc()).limit(10)),
+    ('newest artists', Artist.query.order_by(Artist.created_date.desc()).limit(10)),
+    ('bookings of a venue', Show.query.filter(Show.venue_id == 1, booked)),
+    ('bookings of an artist', Show.query.filter(Show.artist_id == 1, booked)),
+  ]
+
+
+def explain(query):
+  connection = db.session.connection()
+  compiled = query.statement.compile(dialect=connection.dialect)
+  rows = connection.exec_driver_sql('EXPLAIN ' + str(compiled), compiled.params)
+  return [row[0] for row in rows]
+
+
+@click.command('check-indexes')
+@with_appcontext
+def check_indexes():
+  """EXPLAIN the show/genre/newest/booking lookups and fail on any sequential scan."""
+  if db.engine.dialect.name != 'postgresql':
+    click.echo('check-indexes needs a PostgreSQL database.')
+    sys.exit(2)
+  failures = []
+  try:
+    # with seq scans priced out, the planner only picks one when no index
+    # can serve the predicate
+    db.session.execute(db.text('SET LOCAL enable_seqscan = off'))
+    for name, query in _index_access_paths():
+      plan = explain(query)
+      seq_scans = [line.strip() for line in plan if 'Seq Scan' in line]
+      status = 'FAIL' if seq_scans else 'ok'
+      click.echo(f'[{status}] {name}: {plan[0].strip()}')
+      if seq_scans:
+        failures.append(name)
+  finally:
+    db.session.rollback()
+    db.session.close()
+  if failures:
+    click.echo(f'{len(failures)} lookup(s) fall back to a sequential scan.')
+    sys.exit(1)
+
+
+@click.group('counters')
+def counters_cli():
+  """Maintain the venue/artist show counters."""
+
+
+@counters_cli.command('roll-forward')
+@click.option('--every', type=int, default=None,
+              help='Keep running, rolling forward every N seconds.')
+@with_appcontext
+def roll_forward(every):
+  """Move shows that have started from upcoming to past."""
+  while True:
+    try:
+      moved = counters.roll_forward()
+      db.session.commit()
+      click.echo(f'rolled {moved} show(s) forward.')
+    except Exception as e:
+      db.session.rollback()
+      click.echo(f'error rolling counters forward: {e}', err=True)
+      if every is None:
+        sys.exit(1)
+    finally:
+      db.session.close()
+    if every is None:
+      break
+    time.sleep(every)
+
+
+@counters_cli.command('check')
+@click.option('--repair', is_flag=True, help='Overwrite drifted counters.')
+@with_appcontext
+def check_counters(repair):
+  """Recompute the counters from the shows table and report drift."""
+  try:
+    pending = counters.pending_roll_forward()
+    drift = counters.check(repair=repair)
+    for table, item_id, stored, expected in drift:
+      click.echo(f'{table} {item_id}: stored (upcoming, past)={stored}, expected {expected}')
+    if pending:
+      click.echo(f'{pending} show(s) have started and wait for roll-forward.')
+    if repair:
+      db.session.commit()
+      click.echo(f'repaired {len(drift)} row(s).')
+    else:
+      click.echo(f'{len(drift)} row(s) drifted.')
+  finally:
+    db.session.close()
+  if drift and not repair:
+    sys.exit(1)
+
+
+@click.group('partitions')
+def partitions_cli():
+  """Maintain the monthly partitions of the shows table."""
+
+
+@partitions_cli.command('list')
+@with_appcontext
+def list_partitions():
+  """List the attached partitions with their estimated row counts."""
+  try:
+    if not partitions.is_partitioned():
+      click.echo('shows is not partitioned.')
+      return
+    for partition in partitions.list_partitions():
+      click.echo(f'{partition.name:20} ~{partition.rows} row(s)')
+  finally:
+    db.session.close()
+
+
+@partitions_cli.command('ensure')
+@click.option('--months-ahead', default=12, show_default=True,
+              help='Months after the current one to create partitions for.')
+@with_appcontext
+def ensure_partitions(months_ahead):
+  """Create the partitions of the coming months. Run it at least monthly."""
+  try:
+    created = partitions.ensure(months_ahead=months_ahead)
+    db.session.commit()
+    click.echo(f'created {len(created)} partition(s) {" ".join(created)}'.rstrip())
+  except Exception as e:
+    db.session.rollback()
+    click.echo(f'error creating partitions: {e}', err=True)
+    sys.exit(1)
+  finally:
+    db.session.close()
+
+
+@partitions_cli.command('archive')
+@click.option('--before', required=True, type=click.DateTime(formats=['%Y-%m']),
+              help='Archive the months before this one (YYYY-MM).')
+@click.option('--drop', is_flag=True, help='Drop the partitions instead of keeping them detached.')
+@with_appcontext
+def archive_partitions(before, drop):
+  """Detach the partitions of the months before --before."""
+  try:
+    archived = partitions.archive(before.replace(tzinfo=timezone.utc), drop=drop)
+    db.session.commit()
+    action = 'dropped' if drop else 'detached'
+    click.echo(f'{action} {len(archived)} partition(s) {" ".join(archived)}'.rstrip())
+  except Exception as e:
+    db.session.rollback()
+    click.echo(f'error archiving partitions: {e}', err=True)
+    sys.exit(1)
+  finally:
+    db.session.close()
+
+
+@click.command('import')
+@click.argument('kind', type=click.Choice(sorted(importer.LOADERS)))
+@click.argument('path', type=click.Path(exists=True, dir_okay=False))
+@click.option('--batch-size', default=1000, show_default=True,
+              help='Rows written per transaction.')
+@click.option('--resume', is_flag=True,
+              help='Continue after the line saved in PATH.checkpoint.')
+@with_appcontext
+def import_rows(kind, path, batch_size, resume):
+  """Bulk load venues, artists or shows from a CSV or JSONL file."""
+  def progress(report):
+    click.echo(f'line {report.last_line}: {report.accepted} imported, '
+               f'{report.rejected} rejected, {report.rows_per_second:.0f} rows/s')
+  try:
+    report = importer.run_import(kind, path, batch_size=batch_size,
+                                 resume=resume, progress=progress)
+  finally:
+    db.session.close()
+  click.echo(f'done: {report.accepted} imported, {report.rejected} rejected '
+             f'({path}.rejects.jsonl), {report.rows_per_second:.0f} rows/s')
+
+
+@click.command('export')
+@click.argument('kind', type=click.Choice(exporter.KINDS))
+@click.argument('fmt', type=click.Choice(exporter.FORMATS))
+@click.option('-o', '--output', type=click.Path(dir_okay=False),
+              help='Output file; text formats default to stdout.')
+@with_appcontext
+def export_rows(kind, fmt, output):
+  """Stream venues, artists or shows out as JSONL, CSV or Parquet."""
+  try:
+    if fmt == 'parquet':
+      if output is None:
+        raise click.UsageError('parquet export needs --output')
+      try:
+        exporter.parquet_export(kind, output)
+      except ImportError:
+        raise click.ClickException('parquet export needs pyarrow installed')
+    else:
+      with click.open_file(output or '-', 'w') as f:
+        for chunk in exporter.text_export(kind, fmt):
+          f.write(chunk)
+  finally:
+    db.session.close()
+
+
+@click.group('templates')
+def templates_cli():
+  """Compile the Jinja templates."""
+
+
+@templates_cli.command('compile')
+@with_appcontext
+def compile_templates():
+  """Compile every template into the bytecode cache (run at build time)."""
+  directory = current_app.config.get('TEMPLATE_BYTECODE_DIR')
+  if not directory:
+    click.echo('TEMPLATE_BYTECODE_DIR is not set; nothing to write.', err=True)
+    sys.exit(1)
+  try:
+    timings = templating.compile_all(current_app)
+  except Exception as e:
+    click.echo(f'error compiling templates: {e}', err=True)
+    sys.exit(1)
+  for name, seconds in timings.items():
+    click.echo(f'{name:32} {seconds * 1000:8.1f} ms')
+  click.echo(f'compiled {len(timings)} template(s) into {directory}')
+
+
+@click.command('check-queries')
+@with_appcontext
+def check_queries():
+  """GET each page in profiler.ROUTE_QUERY_BUDGETS and fail if one runs
+  more queries than its budget."""
+  app = current_app._get_current_object()
+  client = app.test_client()
+  # a cached page runs no queries at all
+  page_cache = app.extensions.get('page_cache')
+  app.extensions['page_cache'] = None
+  failures = 0
+  try:
+    for path, limit in profiler.ROUTE_QUERY_BUDGETS.items():
+      with profiler.profile() as current:
+        status = client.get(path).status_code
+      ok = current.queries <= limit
+      failures += not ok
+      click.echo(f"[{'ok' if ok else 'FAIL'}] {path} ({status}): "
+                 f'{current.queries} of at most {limit} queries')
+      if not ok:
+        click.echo(current.report())
+  finally:
+    app.extensions['page_cache'] = page_cache
+  if failures:
+    sys.exit(1)
+
+
+def init_app(app):
+  app.cli.add_command(check_indexes)
+  app.cli.add_command(counters_cli)
+  app.cli.add_command(partitions_cli)
+  app.cli.add_command(import_rows)
+  app.cli.add_command(export_rows)
+  app.cli.add_command(check_queries)
+  app.cli.add_command(templates_cli)
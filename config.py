@@ -1,10 +1,16 @@
 import os
-SECRET_KEY = os.urandom(32)
+# Workers of one gunicorn master share the key generated here (the app is
+# loaded before forking); set SECRET_KEY when several hosts serve the site.
+SECRET_KEY = os.environ.get('SECRET_KEY') or os.urandom(32)
 # Grabs the folder where the script runs.
 basedir = os.path.abspath(os.path.dirname(__file__))
 
-# Enable debug mode.
-DEBUG = True
+def env_flag(name, default):
+  return os.environ.get(name, str(default)).lower() in ('1', 'true', 'yes', 'on')
+
+# Debug mode (reloader, debugger, no error log file). Off unless DEBUG is
+# set, e.g. DEBUG=1 python3 app.py during development.
+DEBUG = env_flag('DEBUG', False)
 
 # Connect to the database
 DATABASE_NAME = "fyyur"
@@ -13,5 +19,141 @@ password = "postgres"
 url = "localhost:5432"
 
 # TODO IMPLEMENT DATABASE URL
-SQLALCHEMY_DATABASE_URI = "postgresql://{}:{}@{}/{}".format(
+# DATABASE_URL (as set by Heroku, or to point the benchmarks at a scratch
+# database) overrides the local default.
+SQLALCHEMY_DATABASE_URI = os.environ.get('DATABASE_URL') or "postgresql://{}:{}@{}/{}".format(
   username, password, url, DATABASE_NAME)
+if SQLALCHEMY_DATABASE_URI.startswith('postgres://'):
+  # SQLAlchemy 1.4 only accepts the postgresql:// spelling
+  SQLALCHEMY_DATABASE_URI = 'postgresql://' + SQLALCHEMY_DATABASE_URI[len('postgres://'):]
+
+# Connection pool, each setting overridable from the environment. The pool
+# keeps DB_POOL_SIZE connections and opens up to DB_MAX_OVERFLOW more under
+# load; a request waits at most DB_POOL_TIMEOUT seconds for one. Connections
+# are replaced after DB_POOL_RECYCLE seconds and, with DB_POOL_PRE_PING,
+# tested before use. DB_STATEMENT_TIMEOUT_MS (0 = none) cancels statements
+# that run longer. Set DB_PGBOUNCER when connecting through PgBouncer in
+# transaction mode: the app then keeps no connections of its own.
+DB_POOL_SIZE = int(os.environ.get('DB_POOL_SIZE', 5))
+DB_MAX_OVERFLOW = int(os.environ.get('DB_MAX_OVERFLOW', 10))
+DB_POOL_TIMEOUT = float(os.environ.get('DB_POOL_TIMEOUT', 30))
+DB_POOL_RECYCLE = int(os.environ.get('DB_POOL_RECYCLE', 1800))
+DB_POOL_PRE_PING = env_flag('DB_POOL_PRE_PING', True)
+DB_STATEMENT_TIMEOUT_MS = int(os.environ.get('DB_STATEMENT_TIMEOUT_MS', 0))
+DB_PGBOUNCER = env_flag('DB_PGBOUNCER', False)
+
+# Production server (gunicorn.conf.py). WEB_WORKER_CLASS is 'sync' (one
+# request at a time per process), 'gthread' (WEB_THREADS threads per
+# process) or 'gevent' (up to WEB_WORKER_CONNECTIONS greenlets per process;
+# needs gevent and psycogreen installed). Each worker process has its own
+# connection pool, so WEB_WORKERS * (DB_POOL_SIZE + DB_MAX_OVERFLOW) must
+# stay under the database's max_connections; with gthread and gevent keep
+# the pool at least as large as the threads/greenlets that query at once.
+WEB_BIND = os.environ.get('WEB_BIND', '0.0.0.0:' + os.environ.get('PORT', '5000'))
+WEB_WORKER_CLASS = os.environ.get('WEB_WORKER_CLASS', 'gthread')
+WEB_WORKERS = int(os.environ.get('WEB_WORKERS', 2 * (os.cpu_count() or 1) + 1))
+WEB_THREADS = int(os.environ.get('WEB_THREADS', 4))
+WEB_WORKER_CONNECTIONS = int(os.environ.get('WEB_WORKER_CONNECTIONS', 100))
+WEB_TIMEOUT = int(os.environ.get('WEB_TIMEOUT', 30))
+WEB_GRACEFUL_TIMEOUT = int(os.environ.get('WEB_GRACEFUL_TIMEOUT', 30))
+WEB_KEEPALIVE = int(os.environ.get('WEB_KEEPALIVE', 5))
+# restart a worker after this many requests (plus up to 10% jitter); 0 = never
+WEB_MAX_REQUESTS = int(os.environ.get('WEB_MAX_REQUESTS', 0))
+
+# Logging: JSON lines on stdout (and LOG_FILE unless DEBUG), written by a
+# background thread from a queue of at most LOG_QUEUE_SIZE records; records
+# arriving while it is full are dropped and counted. Only a
+# LOG_DEBUG_SAMPLE_RATE share of DEBUG records is kept.
+LOG_LEVEL = os.environ.get('LOG_LEVEL', 'INFO').upper()
+LOG_FILE = os.environ.get('LOG_FILE', 'error.log')
+LOG_QUEUE_SIZE = int(os.environ.get('LOG_QUEUE_SIZE', 10000))
+LOG_DEBUG_SAMPLE_RATE = float(os.environ.get('LOG_DEBUG_SAMPLE_RATE', 0.1))
+
+# Serve Prometheus metrics (requests, templates, database, page cache) at
+# /metrics. Under a multi-process server set METRICS_DIR to a directory the
+# workers share: each writes its metrics there at most every
+# METRICS_FLUSH_INTERVAL seconds and /metrics reports the sum of all of them.
+METRICS_ENABLED = env_flag('METRICS_ENABLED', True)
+METRICS_DIR = os.environ.get('METRICS_DIR')
+METRICS_FLUSH_INTERVAL = float(os.environ.get('METRICS_FLUSH_INTERVAL', 5))
+
+# Per-request query profiling: a Server-Timing header on every response,
+# and a warning with the slowest and repeated statements for requests that
+# run more than QUERY_BUDGET queries or DB_TIME_BUDGET_MS of database time.
+PROFILER_ENABLED = env_flag('PROFILER_ENABLED', True)
+PROFILER_KEEP_SLOWEST = 5
+QUERY_BUDGET = int(os.environ.get('QUERY_BUDGET', 10))
+DB_TIME_BUDGET_MS = float(os.environ.get('DB_TIME_BUDGET_MS', 200))
+
+# Name search backend: 'trigram' (PostgreSQL pg_trgm indexes) or 'ngram'
+# (in-process index, for SQLite test runs). Picked from the database URL
+# when left as None.
+SEARCH_BACKEND = None
+
+# Results per page for venue/artist search, and the most a client may ask for.
+SEARCH_PAGE_SIZE = 20
+SEARCH_MAX_PAGE_SIZE = 100
+
+# /shows keyset pages: default and maximum rows per page, and whether pages
+# are streamed to the client by default (?stream=1 turns it on per request).
+SHOWS_PAGE_SIZE = 30
+SHOWS_MAX_PAGE_SIZE = 500
+SHOWS_STREAM = False
+
+# Locale of the template datetime filter, and how many recently formatted
+# (value, format) pairs each process remembers (0 turns that off).
+DATETIME_LOCALE = 'en'
+DATETIME_FORMAT_CACHE_SIZE = 4096
+
+# Compiled templates are kept in TEMPLATE_BYTECODE_DIR (empty turns that
+# off); 'flask templates compile' fills it at build time. With
+# TEMPLATE_WARM_UP, each worker loads every template as it starts.
+TEMPLATE_BYTECODE_DIR = os.environ.get('TEMPLATE_BYTECODE_DIR', os.path.join(basedir, '.jinja_cache'))
+TEMPLATE_WARM_UP = env_flag('TEMPLATE_WARM_UP', True)
+
+# /api/v1 list pages: default and maximum rows per page.
+API_PAGE_SIZE = 50
+API_MAX_PAGE_SIZE = 500
+
+# Most shows one request may schedule (the /shows/schedule form and POST
+# /api/v1/shows), and the bearer token that enables that API endpoint
+# (unset disables it).
+SCHEDULE_MAX_SHOWS = 10000
+API_WRITE_TOKEN = os.environ.get('API_WRITE_TOKEN')
+
+# How new shows get their ids (see ids.py): 'sequence' (shows_id_seq, each
+# process taking ID_BLOCK_SIZE values at a time) or 'snowflake'
+# (time-ordered, made in the process). Snowflake worker ids, 0-1023, must
+# differ between running processes: each process leases one from the
+# database for SNOWFLAKE_LEASE_SECONDS at a time, renewing it as it goes,
+# unless SNOWFLAKE_WORKER_ID is set. Set that only for a process that
+# forks no workers, and give each such process its own.
+SHOW_ID_GENERATOR = os.environ.get('SHOW_ID_GENERATOR', 'sequence')
+ID_BLOCK_SIZE = int(os.environ.get('ID_BLOCK_SIZE', 100))
+SNOWFLAKE_WORKER_ID = (int(os.environ['SNOWFLAKE_WORKER_ID'])
+                       if os.environ.get('SNOWFLAKE_WORKER_ID') else None)
+SNOWFLAKE_LEASE_SECONDS = int(os.environ.get('SNOWFLAKE_LEASE_SECONDS', 300))
+
+# Rendered venue/artist page cache: None (off), 'memory' (per-process LRU)
+# or 'redis' (shared, at PAGE_CACHE_REDIS_URL). TTL is in seconds. Pages
+# are keyed by the entity's version, so a write from any worker is seen by
+# all of them at once.
+PAGE_CACHE_BACKEND = 'memory'
+PAGE_CACHE_TTL = 300
+PAGE_CACHE_MAX_ENTRIES = 1024
+PAGE_CACHE_REDIS_URL = os.environ.get('PAGE_CACHE_REDIS_URL', 'redis://localhost:6379/0')
+
+# Rendered template fragments ({% cache %} in templates, see fragments.py):
+# None (off), 'memory' (per process) or 'redis' (shared, at
+# FRAGMENT_CACHE_REDIS_URL). Each fragment gives its own TTL.
+FRAGMENT_CACHE_BACKEND = 'memory'
+FRAGMENT_CACHE_MAX_ENTRIES = 256
+FRAGMENT_CACHE_REDIS_URL = os.environ.get('FRAGMENT_CACHE_REDIS_URL', PAGE_CACHE_REDIS_URL)
+
+# Cache-Control max-age (seconds) of the venue/artist/show pages. They also
+# carry an ETag and Last-Modified, so with 0 clients revalidate every time
+# and get a 304 when nothing changed.
+HTTP_CACHE_MAX_AGE = 0
+
+# Bearer token for the /export/<kind>.<fmt> endpoint; unset disables it.
+EXPORT_TOKEN = os.environ.get('EXPORT_TOKEN')
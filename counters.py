@@ -0,0 +1,221 @@
+from collections import Counter
+from datetime import datetime, timezone
+from sqlalchemy import event
+from sqlalchemy.orm import attributes
+from models import (
+  db,
+  Venue,
+  Artist,
+  Show
+)
+
+#----------------------------------------------------------------------------#
+# Denormalized show counters.
+#
+# venues/artists carry num_upcoming_shows and num_past_shows. Each show is
+# counted on one side according to shows.is_past:
+#   - inserts, deletes and updates of a Show adjust the counters in the same
+#     flush (mapper events below);
+#   - roll_forward() flips shows whose start_time has passed to is_past and
+#     moves the shows it flipped from upcoming to past, so runs that
+#     overlap never move a show twice;
+#   - check() recomputes everything from the shows table to find drift.
+#----------------------------------------------------------------------------#
+
+OWNERS = ((Venue, 'venue_id'), (Artist, 'artist_id'))
+
+
+def _utc(value):
+  # naive datetimes (e.g. from ShowForm) are taken to be UTC
+  if value.tzinfo is None:
+    return value.replace(tzinfo=timezone.utc)
+  return value
+
+
+def _is_past(start_time, now=None):
+  now = now or datetime.now(timezone.utc)
+  return start_time is not None and _utc(start_time) <= now
+
+
+def _adjust(connection, model, item_id, is_past, delta):
+  name = 'num_past_shows' if is_past else 'num_upcoming_shows'
+  table = model.__table__
+  connection.execute(
+    table.update().where(table.c.id == item_id).values({name: table.c[name] + delta})
+  )
+
+
+@event.listens_for(Show, 'before_insert')
+def _flag_new_show(mapper, connection, target):
+  target.is_past = _is_past(target.start_time)
+
+
+@event.listens_for(Show, 'after_insert')
+def _count_new_show(mapper, connection, target):
+  for model, key in OWNERS:
+    _adjust(connection, model, getattr(target, key), target.is_past, 1)
+
+
+@event.listens_for(Show, 'after_delete')
+def _uncount_show(mapper, connection, target):
+  for model, key in OWNERS:
+    _adjust(connection, model, getattr(target, key), target.is_past, -1)
+
+
+@event.listens_for(Show, 'before_update')
+def _reflag_show(mapper, connection, target):
+  if not any(attributes.get_history(target, key).has_changes()
+             for key in ('start_time', 'venue_id', 'artist_id')):
+    return
+  # expired attributes carry no history, so read what is counted now
+  table = Show.__table__
+  target._counted_as = connection.execute(
+    db.select([table.c.venue_id, table.c.artist_id, table.c.is_past]).where(
+      table.c.id == target.id
+    )
+  ).first()
+  target.is_past = _is_past(target.start_time)
+
+
+@event.listens_for(Show, 'after_update')
+def _recount_show(mapper, connection, target):
+  counted_as = target.__dict__.pop('_counted_as', None)
+  if counted_as is None:
+    return
+  old_ids = {'venue_id': counted_as.venue_id, 'artist_id': counted_as.artist_id}
+  for model, key in OWNERS:
+    old = (old_ids[key], counted_as.is_past)
+    new = (getattr(target, key), target.is_past)
+    if old != new:
+      _adjust(connection, model, old[0], old[1], -1)
+      _adjust(connection, model, new[0], new[1], 1)
+
+
+def count_inserted(session, shows):
+  """Adds bulk-inserted show rows (dicts with venue_id, artist_id and
+  is_past) to the counters, one executemany per owner table."""
+  for model, key in OWNERS:
+    table = model.__table__
+    deltas = Counter((show[key], show['is_past']) for show in shows)
+    for is_past in (False, True):
+      name = 'num_past_shows' if is_past else 'num_upcoming_shows'
+      params = [
+        {'item_id': item_id, 'n': n}
+        for (item_id, past), n in deltas.items() if past == is_past
+      ]
+      if params:
+        session.execute(
+          table.update().where(
+            table.c.id == db.bindparam('item_id')
+          ).values({name: table.c[name] + db.bindparam('n')}),
+          params
+        )
+
+
+def _flip_due(due):
+  """Sets is_past on the due shows; returns their (venue_id, artist_id)."""
+  table = Show.__table__
+  flip = table.update().where(due).values(is_past=True)
+  if db.engine.dialect.name == 'postgresql':
+    # a concurrent run's UPDATE waits for these rows, then finds them no
+    # longer due, so each show is flipped (and counted) once
+    return db.session.execute(flip.returning(table.c.venue_id, table.c.artist_id)).all()
+  # SQLite has one writer at a time: the rows read are the rows flipped
+  rows = db.session.query(Show.venue_id, Show.artist_id).filter(due).all()
+  db.session.execute(flip)
+  return rows
+
+
+def roll_forward(now=None):
+  """Move shows that have started from upcoming to past.
+
+  Returns the number of shows moved. The caller commits.
+  """
+  now = now or datetime.now(timezone.utc)
+  due = db.and_(Show.is_past.is_(False), Show.start_time <= now)
+  flipped = _flip_due(due)
+  for model, key in OWNERS:
+    table = model.__table__
+    moved = Counter(getattr(row, key) for row in flipped)
+    if moved:
+      # in id order, so concurrent runs lock the rows in the same order
+      db.session.execute(
+        table.update().where(
+          table.c.id == db.bindparam('item_id')
+        ).values(
+          num_upcoming_shows=table.c.num_upcoming_shows - db.bindparam('n'),
+          num_past_shows=table.c.num_past_shows + db.bindparam('n')
+        ),
+        [{'item_id': item_id, 'n': n} for item_id, n in sorted(moved.items())]
+      )
+  return len(flipped)
+
+
+def check(repair=False):
+  """Compare stored counters with counts from the shows table.
+
+  Returns a list of (table, id, stored, expected) for every drifted row,
+  where stored/expected are (upcoming, past) pairs. With repair=True the
+  stored values are overwritten; the caller commits.
+  """
+  drift = []
+  for model, key in OWNERS:
+    foreign_key = getattr(Show, key)
+    counts = db.session.query(
+      foreign_key.label('item_id'),
+      db.func.count(Show.id).filter(Show.is_past.is_(False)).label('upcoming'),
+      db.func.count(Show.id).filter(Show.is_past.is_(True)).label('past')
+    ).group_by(foreign_key).subquery()
+    expected_upcoming = db.func.coalesce(counts.c.upcoming, 0)
+    expected_past = db.func.coalesce(counts.c.past, 0)
+    rows = db.session.query(
+      model.id,
+      model.num_upcoming_shows,
+      model.num_past_shows,
+      expected_upcoming,
+      expected_past
+    ).outerjoin(
+      counts, counts.c.item_id == model.id
+    ).filter(db.or_(
+      model.num_upcoming_shows != expected_upcoming,
+      model.num_past_shows != expected_past
+    )).all()
+    for item_id, upcoming, past, exp_upcoming, exp_past in rows:
+      drift.append((model.__tablename__, item_id, (upcoming, past), (exp_upcoming, exp_past)))
+      if repair:
+        db.session.execute(
+          model.__table__.update().where(
+            model.__table__.c.id == item_id
+          ).values(num_upcoming_shows=exp_upcoming, num_past_shows=exp_past)
+        )
+  return drift
+
+
+def pending_roll_forward(now=None):
+  now = now or datetime.now(timezone.utc)
+  return db.session.query(db.func.count(Show.id)).filter(
+    Show.is_past.is_(False), Show.start_time <= now
+  ).scalar()
+
+
+def uncount(shows):
+  """Removes the rows of shows (a table or subquery with venue_id,
+  artist_id and is_past) from the counters, for shows leaving the table in
+  bulk. Returns {model: [ids of the updated rows]}; the caller commits."""
+  updated = {}
+  for model, key in OWNERS:
+    foreign_key = shows.c[key]
+    counts = db.select([
+      foreign_key.label('item_id'),
+      db.func.count().filter(shows.c.is_past.is_(False)).label('upcoming'),
+      db.func.count().filter(shows.c.is_past.is_(True)).label('past')
+    ]).group_by(foreign_key).subquery()
+    table = model.__table__
+    result = db.session.execute(
+      table.update().where(table.c.id == counts.c.item_id).values(
+        num_upcoming_shows=table.c.num_upcoming_shows - counts.c.upcoming,
+        num_past_shows=table.c.num_past_shows - counts.c.past
+      ).returning(table.c.id)
+    )
+    updated[model] = [item_id for item_id, in result]
+  return updated
@@ -0,0 +1,154 @@
+import logging
+import threading
+import time
+from flask import current_app
+from sqlalchemy import event, exc
+from sqlalchemy.pool import NullPool, Pool, QueuePool
+from models import db
+from metrics import Counter, Gauge, Histogram
+
+#----------------------------------------------------------------------------#
+# Engine and connection pool.
+#
+# Pool sizing, recycling, pre-ping and the statement timeout come from the
+# DB_* settings in config.py (each one read from the environment). With
+# DB_PGBOUNCER set, pooling is left to PgBouncer: the app holds no idle
+# connections (NullPool) and the statement timeout is set per transaction,
+# since PgBouncer in transaction mode neither accepts startup options nor
+# keeps session settings.
+#----------------------------------------------------------------------------#
+
+CHECKOUT_SECONDS = Histogram(
+  'db_pool_checkout_seconds',
+  'Time to get a connection from the pool, including any wait for one.')
+WAIT_SECONDS = Counter(
+  'db_pool_wait_seconds_total',
+  'Time spent waiting for a connection while the pool was exhausted.')
+WAITS = Counter(
+  'db_pool_waits_total',
+  'Checkouts that found the pool exhausted and had to wait.')
+TIMEOUTS = Counter(
+  'db_pool_timeouts_total',
+  'Checkouts that gave up after DB_POOL_TIMEOUT seconds.')
+
+# maintained by pool events, so it works for every pool class
+_checked_out = [0]
+_checked_out_lock = threading.Lock()
+
+
+class TimedQueuePool(QueuePool):
+  """QueuePool that records checkout latency and time spent waiting."""
+
+  def _do_get(self):
+    exhausted = self.checkedin() == 0 and (
+      self._max_overflow > -1 and self.overflow() >= self._max_overflow
+    )
+    started = time.perf_counter()
+    try:
+      return super()._do_get()
+    except exc.TimeoutError:
+      TIMEOUTS.inc()
+      raise
+    finally:
+      elapsed = time.perf_counter() - started
+      CHECKOUT_SECONDS.observe(elapsed)
+      if exhausted:
+        WAITS.inc()
+        WAIT_SECONDS.inc(elapsed)
+
+
+# SQLAlchemy logs a pool under its class's module; keep this one as quiet
+# as its own sqlalchemy.pool loggers
+logging.getLogger(f'{__name__}.{TimedQueuePool.__name__}').setLevel(logging.WARNING)
+
+
+@event.listens_for(Pool, 'checkout')
+def _count_checkout(dbapi_connection, connection_record, connection_proxy):
+  with _checked_out_lock:
+    _checked_out[0] += 1
+
+
+@event.listens_for(Pool, 'checkin')
+def _count_checkin(dbapi_connection, connection_record):
+  with _checked_out_lock:
+    _checked_out[0] -= 1
+
+
+def _queue_pool():
+  # the app's pool when it pools connections itself, else None
+  try:
+    pool = db.get_engine(current_app).pool
+  except RuntimeError:
+    return None
+  return pool if isinstance(pool, QueuePool) else None
+
+
+def _pool_stat(name):
+  def read():
+    pool = _queue_pool()
+    return getattr(pool, name)() if pool is not None else None
+  return read
+
+
+Gauge('db_pool_checked_out', 'Connections currently checked out.', lambda: _checked_out[0])
+Gauge('db_pool_size', 'Connections the pool keeps open.', _pool_stat('size'))
+Gauge('db_pool_idle', 'Open connections waiting in the pool.', _pool_stat('checkedin'))
+# negative while the pool has fewer than size connections open
+Gauge('db_pool_overflow', 'Connections open beyond the pool size.', _pool_stat('overflow'))
+
+
+def engine_options(config):
+  """SQLALCHEMY_ENGINE_OPTIONS for the DB_* settings in config."""
+  uri = config['SQLALCHEMY_DATABASE_URI']
+  if uri.startswith('sqlite'):
+    # SQLite gets its own pool from SQLAlchemy
+    return {}
+  options = {'pool_pre_ping': config['DB_POOL_PRE_PING']}
+  if config['DB_PGBOUNCER']:
+    options['poolclass'] = NullPool
+  else:
+    options.update(
+      poolclass=TimedQueuePool,
+      pool_size=config['DB_POOL_SIZE'],
+      max_overflow=config['DB_MAX_OVERFLOW'],
+      pool_timeout=config['DB_POOL_TIMEOUT'],
+      pool_recycle=config['DB_POOL_RECYCLE']
+    )
+    timeout = config['DB_STATEMENT_TIMEOUT_MS']
+    if timeout and uri.startswith('postgres'):
+      options['connect_args'] = {'options': f'-c statement_timeout={int(timeout)}'}
+  return options
+
+
+def set_local_statement_timeout(timeout):
+  def begin(connection):
+    connection.exec_driver_sql(f'SET LOCAL statement_timeout = {int(timeout)}')
+  return begin
+
+
+def dispose(app):
+  """Closes the pool's connections and starts a new, empty pool.
+
+  gunicorn.conf.py calls this in the master before forking workers and in
+  each worker after, so that no worker uses a connection (a socket) opened
+  by, or shared with, another process.
+  """
+  with app.app_context():
+    db.get_engine(app).dispose()
+  with _checked_out_lock:
+    _checked_out[0] = 0
+
+
+def init_app(app):
+  """Call after db.init_app(app), before the engine is first used."""
+  options = engine_options(app.config)
+  # explicit SQLALCHEMY_ENGINE_OPTIONS win
+  options.update(app.config.get('SQLALCHEMY_ENGINE_OPTIONS') or {})
+  app.config['SQLALCHEMY_ENGINE_OPTIONS'] = options
+
+  timeout = app.config['DB_STATEMENT_TIMEOUT_MS']
+  postgres = app.config['SQLALCHEMY_DATABASE_URI'].startswith('postgres')
+  if app.config['DB_PGBOUNCER'] and timeout and postgres:
+    with app.app_context():
+      engine = db.get_engine(app)
+    event.listen(engine, 'begin', set_local_statement_timeout(timeout))
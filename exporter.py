@@ -0,0 +1,152 @@
+import csv
+import io
+from serializers import dumps
+from models import (
+  db,
+  VenueGenre,
+  Venue,
+  ArtistGenre,
+  Artist,
+  Show
+)
+
+#----------------------------------------------------------------------------#
+# Streaming export of the catalog.
+#
+# Every kind is read with server-side cursors (stream_results + yield_per),
+# so memory stays flat however large the tables are. Genre lists are
+# attached by merging a second id-ordered stream of genre rows instead of
+# loading the genres relationship per entity.
+#----------------------------------------------------------------------------#
+
+BATCH_SIZE = 1000
+
+ENTITY_COLUMNS = {
+  'venues': ('id', 'name', 'city', 'state', 'address', 'phone', 'website',
+             'facebook_link', 'seeking_talent', 'seeking_description',
+             'image_link', 'created_date'),
+  'artists': ('id', 'name', 'city', 'state', 'phone', 'website',
+              'facebook_link', 'seeking_venue', 'seeking_description',
+              'image_link', 'created_date'),
+}
+GENRES = {
+  'venues': (Venue, VenueGenre, VenueGenre.venue_id),
+  'artists': (Artist, ArtistGenre, ArtistGenre.artist_id),
+}
+SHOW_COLUMNS = ('id', 'venue_id', 'artist_id', 'start_time')
+KINDS = ('venues', 'artists', 'shows')
+FORMATS = ('jsonl', 'csv', 'parquet')
+
+
+def columns(kind):
+  if kind == 'shows':
+    return SHOW_COLUMNS
+  return ENTITY_COLUMNS[kind] + ('genres',)
+
+
+def _stream(query):
+  return query.execution_options(stream_results=True).yield_per(BATCH_SIZE)
+
+
+def iter_rows(kind):
+  """Yields one dict per row of kind, ordered by id."""
+  if kind == 'shows':
+    query = db.session.query(*(getattr(Show, name) for name in SHOW_COLUMNS))
+    for row in _stream(query.order_by(Show.id)):
+      yield dict(zip(SHOW_COLUMNS, row))
+    return
+
+  model, genre_model, owner_id = GENRES[kind]
+  names = ENTITY_COLUMNS[kind]
+  entities = _stream(db.session.query(*(getattr(model, name) for name in names)).order_by(model.id))
+  genres = iter(_stream(
+    db.session.query(owner_id, genre_model.category).order_by(owner_id, genre_model.id)
+  ))
+  genre = next(genres, None)
+  for row in entities:
+    data = dict(zip(names, row))
+    data['genres'] = []
+    # both streams are ordered by entity id
+    while genre is not None and (genre[0] is None or genre[0] < data['id']):
+      genre = next(genres, None)
+    while genre is not None and genre[0] == data['id']:
+      data['genres'].append(genre[1])
+      genre = next(genres, None)
+    yield data
+
+
+def _chunks(lines, size=64 * 1024):
+  # group small writes into chunks worth sending
+  buffer, length = [], 0
+  for line in lines:
+    buffer.append(line)
+    length += len(line)
+    if length >= size:
+      yield ''.join(buffer)
+      buffer, length = [], 0
+  if buffer:
+    yield ''.join(buffer)
+
+
+def jsonl_lines(rows):
+  for row in rows:
+    yield dumps(row).decode() + '\n'
+
+
+def csv_lines(rows, fieldnames):
+  buffer = io.StringIO()
+  writer = csv.writer(buffer)
+  writer.writerow(fieldnames)
+  for row in rows:
+    writer.writerow([
+      ';'.join(row[name]) if name == 'genres' else row[name] for name in fieldnames
+    ])
+    yield buffer.getvalue()
+    buffer.seek(0)
+    buffer.truncate()
+  yield buffer.getvalue()
+
+
+def text_export(kind, fmt):
+  """Yields the export of kind as jsonl or csv text chunks."""
+  rows = iter_rows(kind)
+  if fmt == 'jsonl':
+    return _chunks(jsonl_lines(rows))
+  elif fmt == 'csv':
+    return _chunks(csv_lines(rows, columns(kind)))
+  raise ValueError(f'{fmt} is not a text format')
+
+
+def _arrow_type(pa, name):
+  if name in ('id', 'venue_id', 'artist_id'):
+    return pa.int64()
+  elif name in ('seeking_talent', 'seeking_venue'):
+    return pa.bool_()
+  elif name in ('created_date', 'start_time'):
+    return pa.timestamp('us', tz='UTC')
+  elif name == 'genres':
+    return pa.list_(pa.string())
+  return pa.string()
+
+
+def parquet_export(kind, path):
+  """Writes kind to a Parquet file a row group at a time (needs pyarrow)."""
+  import pyarrow as pa
+  import pyarrow.parquet as pq
+  names = columns(kind)
+  schema = pa.schema([(name, _arrow_type(pa, name)) for name in names])
+
+  def row_group(batch):
+    return pa.Table.from_pydict(
+      {name: [row[name] for row in batch] for name in names}, schema=schema
+    )
+
+  with pq.ParquetWriter(path, schema) as writer:
+    batch = []
+    for row in iter_rows(kind):
+      batch.append(row)
+      if len(batch) == BATCH_SIZE * 10:
+        writer.write_table(row_group(batch))
+        batch = []
+    if batch:
+      writer.write_table(row_group(batch))
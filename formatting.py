@@ -0,0 +1,75 @@
+import functools
+from datetime import timezone
+import babel.dates
+import dateutil.parser
+from babel import Locale
+
+#----------------------------------------------------------------------------#
+# Datetime formatting for templates.
+#
+# The 'datetime' filter takes the datetimes the queries return. Each format
+# is compiled to a Babel pattern once per (format, locale) and applied
+# directly, skipping the pattern and locale lookups babel.dates does per
+# call. Results are memoized in a bounded LRU, since listings repeat the
+# same start times across tiles and across requests.
+#----------------------------------------------------------------------------#
+
+# the filter's names for its formats; other values are Babel patterns
+FORMATS = {
+  'full': "EEEE MMMM, d, y 'at' h:mma",
+  'medium': "EE MM, dd, y h:mma",
+}
+# Babel's own named formats, which it builds from separate date and time
+# patterns
+BABEL_FORMATS = ('long', 'short')
+
+
+@functools.lru_cache(maxsize=None)
+def compiled(format, locale):
+  """(DateTimePattern, Locale) for format, parsed once."""
+  return babel.dates.parse_pattern(FORMATS.get(format, format)), Locale.parse(locale)
+
+
+def format_datetime(value, format='medium', locale='en'):
+  """value (a datetime; naive ones are UTC) formatted without memoizing."""
+  if value.tzinfo is None:
+    value = value.replace(tzinfo=timezone.utc)
+  if format in BABEL_FORMATS:
+    return babel.dates.format_datetime(value, format, locale=locale)
+  pattern, locale = compiled(format, locale)
+  return pattern.apply(value, locale)
+
+
+class DatetimeFilter:
+  """The 'datetime' template filter, memoizing up to cache_size results."""
+
+  def __init__(self, locale='en', cache_size=4096):
+    self.locale = locale
+    if cache_size:
+      self._format = functools.lru_cache(maxsize=cache_size)(self._uncached)
+    else:
+      self._format = self._uncached
+
+  def _uncached(self, value, offset, format):
+    return format_datetime(value, format, self.locale)
+
+  def __call__(self, value, format='medium'):
+    if value is None:
+      return ''
+    if isinstance(value, str):
+      # ISO strings, as templates used to be given
+      value = dateutil.parser.parse(value)
+    # aware datetimes at the same instant compare equal whatever their
+    # offset, but print different wall times, so the offset is in the key
+    return self._format(value, value.utcoffset(), format)
+
+  def cache_info(self):
+    """functools' hits/misses/currsize for the memo, or None without one."""
+    info = getattr(self._format, 'cache_info', None)
+    return info() if info else None
+
+
+def init_app(app):
+  app.jinja_env.filters['datetime'] = DatetimeFilter(
+    locale=app.config.get('DATETIME_LOCALE', 'en'),
+    cache_size=app.config.get('DATETIME_FORMAT_CACHE_SIZE', 4096))
@@ -1,8 +1,15 @@
 from datetime import datetime
 from flask_wtf import FlaskForm as Form
-from wtforms import StringField, SelectField, SelectMultipleField, DateTimeField, BooleanField
-from wtforms.validators import DataRequired, AnyOf, URL, ValidationError
+from wtforms import StringField, SelectField, SelectMultipleField, DateTimeField, BooleanField, IntegerField, TextAreaField
+from wtforms.validators import DataRequired, AnyOf, URL, ValidationError, Optional, NumberRange
+import logging
 import phonenumbers
+from models import SHOW_DURATION, MAX_SHOW_DURATION
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_DURATION_MINUTES = int(SHOW_DURATION.total_seconds()) // 60
+MAX_DURATION_MINUTES = int(MAX_SHOW_DURATION.total_seconds()) // 60
 
 
 
@@ -14,8 +21,7 @@ def check_phone(form, field):
         if not (phonenumbers.is_valid_number(input_number)):
             raise ValidationError('Error, phone number must be in format xxx-xxx-xxxx')
     except Exception as e:
-        print(f'entered phone number: {field.data}')
-        print(e)
+        logger.debug('phone number rejected: %s', e)
         raise ValidationError('Error, phone number must be in format xxx-xxx-xxxx')
 
 
@@ -31,6 +37,18 @@ class ShowForm(Form):
         validators=[DataRequired()],
         default= datetime.today()
     )
+    # minutes
+    duration = IntegerField(
+        'duration',
+        validators=[Optional(), NumberRange(min=1, max=MAX_DURATION_MINUTES)],
+        default=DEFAULT_DURATION_MINUTES
+    )
+
+class ScheduleForm(Form):
+    # one show per line: artist_id, venue_id, start time[, duration in minutes]
+    shows = TextAreaField(
+        'shows', validators=[DataRequired()]
+    )
 
 class VenueForm(Form):
     name = StringField(
@@ -0,0 +1,180 @@
+import threading
+from flask import current_app, has_app_context
+from jinja2 import nodes
+from jinja2.ext import Extension
+from markupsafe import Markup
+from sqlalchemy import event
+from sqlalchemy.orm import Session, object_session
+from cache import LRUCache, RedisCache
+from models import (
+  Venue,
+  Artist
+)
+
+#----------------------------------------------------------------------------#
+# Template fragment cache.
+#
+#   {% cache 'venues:areas', 300, 'venue' %} ... {% endcache %}
+#
+# stores the rendered body under the key for ttl seconds. The names after
+# the ttl are the generations the fragment depends on: counters bumped when
+# a commit has written rows of that kind (the hooks below), whose current
+# values are part of the stored key. A bump makes the fragments depending
+# on it miss once and be rendered again; nothing else is invalidated.
+#
+# A view should hand a fragment's data to the template as a callable that
+# the block calls, so that a hit skips the queries as well as the
+# rendering.
+#
+# With the 'memory' store the fragments and generations belong to one
+# process, so a write bumps them only in the worker that made it; other
+# workers serve their copy until its ttl runs out. The 'redis' store
+# shares both between processes.
+#----------------------------------------------------------------------------#
+
+# the generation each model's writes bump
+GENERATIONS = {Venue: 'venue', Artist: 'artist'}
+
+
+class Generations:
+  """In-process generation counters."""
+
+  def __init__(self):
+    self.values = {}
+    self.lock = threading.Lock()
+
+  def get(self, names):
+    with self.lock:
+      return [self.values.get(name, 0) for name in names]
+
+  def bump(self, names):
+    with self.lock:
+      for name in names:
+        self.values[name] = self.values.get(name, 0) + 1
+
+
+class RedisGenerations:
+  """Generation counters in Redis, shared by every process using it. They
+  never expire: a counter that went back to 0 could revive fragments
+  stored under its old values."""
+
+  def __init__(self, client, prefix='fyyur:generation:'):
+    self.client = client
+    self.prefix = prefix
+
+  def get(self, names):
+    if not names:
+      return []
+    return [int(value or 0) for value in self.client.mget([self.prefix + name for name in names])]
+
+  def bump(self, names):
+    pipeline = self.client.pipeline()
+    for name in names:
+      pipeline.incr(self.prefix + name)
+    pipeline.execute()
+
+
+class FragmentCache:
+  def __init__(self, store, generations):
+    self.store = store
+    self.generations = generations
+
+  def key(self, key, depends):
+    """key qualified with the current value of each generation in depends."""
+    values = self.generations.get(depends)
+    return key + ''.join(f'|{name}:{value}' for name, value in zip(depends, values))
+
+  def render(self, key, ttl, depends, render):
+    full_key = self.key(key, depends)
+    value = self.store.get(full_key)
+    if value is None:
+      value = render()
+      self.store.set(full_key, str(value), ttl)
+    return Markup(value)
+
+  def bump(self, names):
+    self.generations.bump(names)
+
+
+def fragment_cache():
+  """The app's fragment cache, or None when FRAGMENT_CACHE_BACKEND is unset."""
+  return current_app.extensions.get('fragment_cache')
+
+
+class FragmentCacheExtension(Extension):
+  """The {% cache key, ttl[, generation ...] %} tag."""
+  tags = {'cache'}
+
+  def parse(self, parser):
+    lineno = next(parser.stream).lineno
+    args = [parser.parse_expression()]
+    while parser.stream.skip_if('comma'):
+      args.append(parser.parse_expression())
+    if len(args) < 2:
+      parser.fail('cache takes a key and a ttl', lineno)
+    body = parser.parse_statements(['name:endcache'], drop_needle=True)
+    call = self.call_method('_render', [nodes.List(args)])
+    return nodes.CallBlock(call, [], [], body).set_lineno(lineno)
+
+  def _render(self, args, caller):
+    key, ttl, *depends = args
+    cache = fragment_cache() if has_app_context() else None
+    if cache is None:
+      return caller()
+    return cache.render(key, ttl, depends, caller)
+
+
+#  Bump generations on committed writes.
+#  ----------------------------------------------------------------
+
+def mark_changed(session, *names):
+  """Bumps the named generations when session commits; for writes that
+  bypass the ORM hooks (Core inserts and updates)."""
+  session.info.setdefault('fragment_generations', set()).update(names)
+
+
+def _register_listeners(model, name):
+  def changed(mapper, connection, target):
+    session = object_session(target)
+    if session is not None:
+      mark_changed(session, name)
+
+  for event_name in ('after_insert', 'after_update', 'after_delete'):
+    event.listen(model, event_name, changed)
+
+
+for _model, _name in GENERATIONS.items():
+  _register_listeners(_model, _name)
+
+
+@event.listens_for(Session, 'after_commit')
+def _bump_generations(session):
+  names = session.info.pop('fragment_generations', None)
+  if not names or not has_app_context():
+    return
+  cache = fragment_cache()
+  if cache is not None:
+    cache.bump(sorted(names))
+
+
+@event.listens_for(Session, 'after_soft_rollback')
+def _discard_generations(session, previous_transaction):
+  session.info.pop('fragment_generations', None)
+
+
+def init_app(app):
+  app.jinja_env.add_extension(FragmentCacheExtension)
+  backend = app.config.get('FRAGMENT_CACHE_BACKEND')
+  if backend is None:
+    cache = None
+  elif backend == 'memory':
+    # the ttl given in the tag applies; entries stranded by a generation
+    # bump are evicted as the least recently used
+    store = LRUCache(max_entries=app.config.get('FRAGMENT_CACHE_MAX_ENTRIES', 256))
+    cache = FragmentCache(store, Generations())
+  elif backend == 'redis':
+    store = RedisCache.from_url(app.config['FRAGMENT_CACHE_REDIS_URL'], prefix='fyyur:fragment:')
+    cache = FragmentCache(store, RedisGenerations(store.client))
+  else:
+    raise ValueError(f'unknown FRAGMENT_CACHE_BACKEND {backend!r}')
+  app.extensions['fragment_cache'] = cache
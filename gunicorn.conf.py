@@ -0,0 +1,85 @@
+import glob
+import os
+import time
+# not 'import config': gunicorn would take the module for its own config setting
+import config as settings
+
+#----------------------------------------------------------------------------#
+# gunicorn settings and server hooks:
+#
+#   gunicorn -c gunicorn.conf.py wsgi:app
+#
+# The worker model and counts come from the WEB_* settings in config.py.
+# The app is loaded once in the master and then forked (preload_app), so
+# workers share its memory and start fast. Things that must not cross a
+# fork are reset in post_fork: the database pool (its sockets) and the
+# logging thread. post_fork also loads every template (TEMPLATE_WARM_UP),
+# so a new or recycled worker's first requests do not compile them.
+#
+# Signals to the master: HUP starts new workers with reloaded settings and
+# stops the old ones gracefully (within WEB_GRACEFUL_TIMEOUT). As the app is
+# preloaded, new code needs a new master: send USR2, then QUIT to the old
+# master once the new one is serving.
+#----------------------------------------------------------------------------#
+
+worker_class = settings.WEB_WORKER_CLASS
+if worker_class not in ('sync', 'gthread', 'gevent'):
+  raise ValueError(f'WEB_WORKER_CLASS must be sync, gthread or gevent, not {worker_class!r}')
+
+if worker_class == 'gevent':
+  # patch before the app, and with it psycopg2 and the pool, is loaded in
+  # the master; otherwise database calls block the whole worker
+  from gevent import monkey
+  monkey.patch_all()
+  from psycogreen.gevent import patch_psycopg
+  patch_psycopg()
+
+import database
+import metrics
+import templating
+
+bind = settings.WEB_BIND
+workers = settings.WEB_WORKERS
+threads = settings.WEB_THREADS if worker_class == 'gthread' else 1
+worker_connections = settings.WEB_WORKER_CONNECTIONS
+timeout = settings.WEB_TIMEOUT
+graceful_timeout = settings.WEB_GRACEFUL_TIMEOUT
+keepalive = settings.WEB_KEEPALIVE
+max_requests = settings.WEB_MAX_REQUESTS
+max_requests_jitter = settings.WEB_MAX_REQUESTS // 10
+preload_app = True
+# the app writes its own JSON access records (logs.py)
+accesslog = None
+# /dev/shm keeps worker heartbeats off disk-backed /tmp (slow in containers)
+worker_tmp_dir = '/dev/shm' if os.path.isdir('/dev/shm') else None
+
+
+def on_starting(server):
+  # snapshots left by a previous run's workers would be summed forever
+  directory = settings.METRICS_DIR
+  if directory:
+    for path in glob.glob(os.path.join(directory, '*.json')):
+      os.remove(path)
+
+
+def pre_fork(server, worker):
+  database.dispose(server.app.wsgi())
+
+
+def post_fork(server, worker):
+  app = server.app.wsgi()
+  database.dispose(app)
+  app.extensions['logs'].after_fork()
+  if app.config['TEMPLATE_WARM_UP']:
+    started = time.perf_counter()
+    count = templating.warm_up(app)
+    server.log.info('worker %s loaded %d templates in %.0f ms', worker.pid, count,
+                    (time.perf_counter() - started) * 1000)
+  server.log.info('worker %s ready (%s)', worker.pid, worker_class)
+
+
+def child_exit(server, worker):
+  # fold the worker's counters into the exited workers' totals now rather
+  # than at the next scrape
+  if settings.METRICS_DIR:
+    metrics.fold_exited(settings.METRICS_DIR)
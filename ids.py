@@ -0,0 +1,219 @@
+import os
+import socket
+import threading
+import time
+from datetime import datetime, timezone
+from flask import current_app
+from sqlalchemy import text
+from models import db
+
+#----------------------------------------------------------------------------#
+# Show ids.
+#
+# Writers get show ids before they insert, a batch at a time, so a bulk
+# import or a scheduled tour knows its ids without a round-trip per row
+# (and without RETURNING). SHOW_ID_GENERATOR picks how:
+#   - 'sequence': values of shows_id_seq, the column's own sequence.
+#     allocate(n) takes n of them in one statement; ids asked for one or a
+#     few at a time come from a block of ID_BLOCK_SIZE values the process
+#     keeps and refills when it runs out. PostgreSQL hands each value out
+#     once, so they are unique across workers and hosts; a block's unused
+#     values are lost with the process, which leaves gaps.
+#   - 'snowflake': time-ordered 63-bit ids made in the process, with no
+#     database round-trip at all: milliseconds since EPOCH (41 bits), a
+#     worker id (10 bits) and a counter within the millisecond (12 bits).
+#     Running processes need distinct worker ids. Unless SNOWFLAKE_WORKER_ID
+#     is set, a process leases one from show_id_workers: the lease lasts
+#     SNOWFLAKE_LEASE_SECONDS and is renewed, before making ids, once half
+#     of it has gone by. A process that could not renew in time (it was
+#     idle, or the database was away) leases an id again, and an id whose
+#     lease ran out goes to the next process that asks, so two running
+#     processes never hold the same one. These ids do not fit a JavaScript
+#     number.
+# A process that inherits a generator from its parent (gunicorn --preload)
+# does not reuse the parent's block or leased worker id: both start over
+# after a fork. A configured SNOWFLAKE_WORKER_ID cannot be shared that way,
+# so a forked process refuses to use it.
+#
+# Databases without sequences (SQLite in development) leave 'sequence'
+# ids to the database: allocate() returns None and the rows are inserted
+# without one. They have no worker id leases either; a snowflake worker id
+# there comes from the process id.
+#----------------------------------------------------------------------------#
+
+# n values of a sequence in one round-trip
+BLOCK = 'SELECT nextval(CAST(:sequence AS regclass)) FROM generate_series(1, :n)'
+
+EPOCH = datetime(2020, 1, 1, tzinfo=timezone.utc)
+WORKER_BITS = 10
+COUNTER_BITS = 12
+MAX_WORKER_ID = (1 << WORKER_BITS) - 1
+MAX_COUNTER = (1 << COUNTER_BITS) - 1
+
+# the free id whose lease ran out longest ago; SKIP LOCKED lets processes
+# starting together take different ones
+LEASE = '''
+UPDATE show_id_workers SET holder = :holder, expires_at = now() + make_interval(secs => :seconds)
+WHERE worker_id = (
+  SELECT worker_id FROM show_id_workers WHERE expires_at < now()
+  ORDER BY expires_at, worker_id LIMIT 1 FOR UPDATE SKIP LOCKED
+)
+RETURNING worker_id
+'''
+RENEW = '''
+UPDATE show_id_workers SET expires_at = now() + make_interval(secs => :seconds)
+WHERE worker_id = :worker_id AND holder = :holder AND expires_at > now()
+RETURNING worker_id
+'''
+
+
+def _postgresql():
+  return db.engine.dialect.name == 'postgresql'
+
+
+class SequenceAllocator:
+  """Ids from a database sequence, fetched in blocks. Thread-safe."""
+
+  def __init__(self, sequence, block_size=100):
+    if block_size < 1:
+      raise ValueError('ID_BLOCK_SIZE must be at least 1')
+    self.sequence = sequence
+    self.block_size = block_size
+    self.lock = threading.Lock()
+    self.pid = os.getpid()
+    self.block = []
+
+  def _fetch(self, n):
+    rows = db.session.execute(text(BLOCK), {'sequence': self.sequence, 'n': n})
+    return [value for value, in rows]
+
+  def allocate(self, n):
+    """n new ids, in ascending order, or None without sequences. Takes what
+    it needs from the process's block and fetches the rest in one go."""
+    if not _postgresql():
+      return None
+    with self.lock:
+      if self.pid != os.getpid():
+        # the block was copied from the parent process, which uses it too
+        self.pid, self.block = os.getpid(), []
+      if n > len(self.block):
+        # a small request refills the block, a large one fetches just what
+        # it lacks
+        self.block.extend(self._fetch(max(n - len(self.block), self.block_size)))
+      ids, self.block = self.block[:n], self.block[n:]
+    return ids
+
+
+class SnowflakeGenerator:
+  """Time-ordered ids made in the process. Thread-safe. When the clock
+  steps back, or a millisecond's counter runs out, ids carry on from the
+  last timestamp used (borrowing the next millisecond), so they stay unique
+  and increasing without waiting."""
+
+  def __init__(self, worker_id=None, clock=time.time, lease_seconds=300):
+    if worker_id is not None and not 0 <= worker_id <= MAX_WORKER_ID:
+      raise ValueError(f'SNOWFLAKE_WORKER_ID must be between 0 and {MAX_WORKER_ID}')
+    if lease_seconds <= 0:
+      raise ValueError('SNOWFLAKE_LEASE_SECONDS must be positive')
+    self.configured_worker_id = worker_id
+    self.clock = clock
+    self.lease_seconds = lease_seconds
+    self.lock = threading.Lock()
+    self.created_pid = os.getpid()
+    self.pid = None
+    self.worker_id = None
+    # monotonic time the lease was last taken or renewed; None when the
+    # worker id is not leased
+    self.leased_at = None
+    self.last = -1
+    self.counter = 0
+
+  def _holder(self):
+    return f'{socket.gethostname()}:{os.getpid()}:{id(self):x}'
+
+  def _lease(self):
+    started = time.monotonic()
+    with db.engine.begin() as connection:
+      worker_id = connection.execute(
+        text(LEASE), {'holder': self._holder(), 'seconds': self.lease_seconds}
+      ).scalar()
+    if worker_id is None:
+      raise RuntimeError(f'all {MAX_WORKER_ID + 1} snowflake worker ids are leased')
+    self.worker_id, self.leased_at = worker_id, started
+    # ids made under the new worker id may share a millisecond with the
+    # old one's: go on from the next millisecond so they stay increasing
+    self.counter = MAX_COUNTER
+
+  def _renew(self):
+    started = time.monotonic()
+    with db.engine.begin() as connection:
+      renewed = connection.execute(text(RENEW), {
+        'worker_id': self.worker_id, 'holder': self._holder(), 'seconds': self.lease_seconds
+      }).scalar()
+    if renewed is None:
+      # the lease ran out, and another process may hold the id by now
+      self._lease()
+    else:
+      self.leased_at = started
+
+  def _ensure_worker_id(self):
+    if self.configured_worker_id is not None:
+      if os.getpid() != self.created_pid:
+        raise RuntimeError('SNOWFLAKE_WORKER_ID would be shared by processes forked from the '
+                           'one that read it; leave it unset to lease worker ids')
+      self.worker_id = self.configured_worker_id
+    elif self.pid != os.getpid():
+      # a worker id copied from the parent process would repeat its ids
+      if _postgresql():
+        self._lease()
+      else:
+        # no leases: distinct among the host's running processes, mostly
+        self.worker_id = os.getpid() & MAX_WORKER_ID
+    elif (self.leased_at is not None
+          and time.monotonic() - self.leased_at >= self.lease_seconds / 2):
+      self._renew()
+    self.pid = os.getpid()
+
+  def _millis(self):
+    return int((self.clock() - EPOCH.timestamp()) * 1000)
+
+  def allocate(self, n):
+    """n new ids, in ascending order."""
+    with self.lock:
+      self._ensure_worker_id()
+      ids = []
+      for _ in range(n):
+        now = self._millis()
+        if now > self.last:
+          self.last, self.counter = now, 0
+        elif self.counter < MAX_COUNTER:
+          self.counter += 1
+        else:
+          self.last, self.counter = self.last + 1, 0
+        ids.append((self.last << (WORKER_BITS + COUNTER_BITS))
+                   | (self.worker_id << COUNTER_BITS) | self.counter)
+      return ids
+
+
+def timestamp(show_id):
+  """When a snowflake id was made."""
+  millis = show_id >> (WORKER_BITS + COUNTER_BITS)
+  return datetime.fromtimestamp(EPOCH.timestamp() + millis / 1000, timezone.utc)
+
+
+def show_ids(n):
+  """n new show ids from the app's generator, or None when the database
+  assigns them."""
+  return current_app.extensions['show_ids'].allocate(n)
+
+
+def init_app(app):
+  generator = app.config.get('SHOW_ID_GENERATOR', 'sequence')
+  if generator == 'sequence':
+    ids = SequenceAllocator('shows_id_seq', app.config.get('ID_BLOCK_SIZE', 100))
+  elif generator == 'snowflake':
+    ids = SnowflakeGenerator(app.config.get('SNOWFLAKE_WORKER_ID'),
+                             lease_seconds=app.config.get('SNOWFLAKE_LEASE_SECONDS', 300))
+  else:
+    raise ValueError(f'unknown SHOW_ID_GENERATOR {generator!r}')
+  app.extensions['show_ids'] = ids
@@ -0,0 +1,244 @@
+import csv
+import json
+import os
+import time
+from datetime import datetime, timezone
+from werkzeug.datastructures import MultiDict
+from forms import VenueForm, ArtistForm, ShowForm
+from models import (
+  db,
+  VenueGenre,
+  Venue,
+  ArtistGenre,
+  Artist
+)
+import fragments
+import scheduling
+import search
+
+#----------------------------------------------------------------------------#
+# Bulk import of venues, artists and shows from CSV or JSONL files.
+#
+# Rows are streamed, validated with the same WTForms rules as the create
+# handlers, and written a batch per transaction with executemany. After
+# each batch the line number reached is saved to <path>.checkpoint so an
+# interrupted import can be resumed; rejected rows go to
+# <path>.rejects.jsonl along with their validation errors, as do JSONL
+# lines that are not a JSON object.
+#----------------------------------------------------------------------------#
+
+def _parse_line(line):
+  """(row dict, None) for a JSON object, else (what was read, errors)."""
+  try:
+    row = json.loads(line)
+  except ValueError as e:
+    return line.rstrip('\r\n'), {'row': [f'invalid JSON: {e}']}
+  if not isinstance(row, dict):
+    return row, {'row': [f'expected a JSON object, got {type(row).__name__}']}
+  return row, None
+
+
+def read_rows(path):
+  """Yields (line_no, row, errors) from a .csv or .jsonl file; errors is
+  None unless the line could not be read as a row."""
+  with open(path, newline='') as f:
+    if path.endswith('.csv'):
+      # line 1 is the header
+      for line_no, row in enumerate(csv.DictReader(f), start=2):
+        yield line_no, row, None
+    else:
+      for line_no, line in enumerate(f, start=1):
+        if line.strip():
+          yield (line_no, *_parse_line(line))
+
+
+def _formdata(row):
+  data = MultiDict()
+  for key, value in row.items():
+    if key == 'genres' and isinstance(value, str):
+      # CSV cells hold genres as "Jazz;Blues"
+      value = [item.strip() for item in value.split(';') if item.strip()]
+    if isinstance(value, list):
+      for item in value:
+        data.add(key, item)
+    elif isinstance(value, bool):
+      # JSON booleans, spelled the way BooleanField expects
+      data.add(key, 'y' if value else 'false')
+    elif value is not None:
+      data.add(key, str(value))
+  return data
+
+
+def validate(form_class, row):
+  """(form.data, None) if row passes form_class, else (None, errors)."""
+  form = form_class(formdata=_formdata(row), meta={'csrf': False})
+  if form.validate():
+    return form.data, None
+  return None, form.errors
+
+
+class EntityLoader:
+  """Writes validated venue or artist rows and their genres."""
+
+  def __init__(self, model, genre_model, owner_key, form_class, flag):
+    self.model = model
+    self.genre_model = genre_model
+    # venue_id / artist_id on the genre table
+    self.owner_key = owner_key
+    self.form_class = form_class
+    # seeking_talent / seeking_venue
+    self.flag = flag
+
+  def prepare(self, data):
+    now = datetime.now(timezone.utc)
+    record = {
+      'name': data['name'],
+      'city': data['city'],
+      'state': data['state'],
+      'phone': data['phone'],
+      'image_link': data['image_link'] or None,
+      'facebook_link': data['facebook_link'],
+      'website': data['website_link'],
+      self.flag: data[self.flag],
+      'seeking_description': data['seeking_description'] or None,
+      'created_date': now
+    }
+    if 'address' in data:
+      record['address'] = data['address']
+    return record, data['genres']
+
+  def write(self, batch):
+    """Inserts a batch of (line_no, (record, genres)); returns rejects."""
+    names = [record['name'] for _, (record, _) in batch]
+    existing = {
+      name for name, in db.session.query(self.model.name).filter(self.model.name.in_(names))
+    }
+    rejects, accepted, seen = [], [], set()
+    for line_no, (record, genres) in batch:
+      if record['name'] in existing or record['name'] in seen:
+        rejects.append((line_no, {'name': ['already exists']}))
+      else:
+        seen.add(record['name'])
+        accepted.append((record, genres))
+    if not accepted:
+      return rejects
+    db.session.execute(self.model.__table__.insert(), [record for record, _ in accepted])
+    fragments.mark_changed(db.session, fragments.GENERATIONS[self.model])
+    # names are unique, so they resolve the new ids in one query
+    ids = dict(db.session.query(self.model.name, self.model.id).filter(self.model.name.in_(seen)))
+    search.mark_changed(db.session, self.model, [(item_id, name) for name, item_id in ids.items()])
+    genre_rows = [
+      {'category': category, self.owner_key: ids[record['name']]}
+      for record, genres in accepted for category in genres
+    ]
+    if genre_rows:
+      db.session.execute(self.genre_model.__table__.insert(), genre_rows)
+    return rejects
+
+
+class ShowLoader:
+  form_class = ShowForm
+
+  def prepare(self, data):
+    return scheduling.booking(data['artist_id'], data['venue_id'], data['start_time'],
+                              data['duration']), None
+
+  def write(self, batch):
+    """Inserts a batch of (line_no, (booking, None)); rows whose venue or
+    artist is missing, or that overlap a booked show, are rejected."""
+    line_nos = [line_no for line_no, _ in batch]
+    bookings = [booking for _, (booking, _) in batch]
+    rejects = []
+    unknown = scheduling.unknown_owners(bookings)
+    known = [index for index in range(len(bookings)) if index not in unknown]
+    rejects.extend((line_nos[index], {'row': errors}) for index, errors in unknown.items())
+    scheduling.lock([bookings[index] for index in known])
+    conflicts = scheduling.find_conflicts([bookings[index] for index in known])
+    accepted = []
+    for position, index in enumerate(known):
+      if position in conflicts:
+        rejects.append((line_nos[index], {'row': conflicts[position]}))
+      else:
+        accepted.append(bookings[index])
+    scheduling.insert(accepted)
+    return rejects
+
+
+LOADERS = {
+  'venues': lambda: EntityLoader(Venue, VenueGenre, 'venue_id', VenueForm, 'seeking_talent'),
+  'artists': lambda: EntityLoader(Artist, ArtistGenre, 'artist_id', ArtistForm, 'seeking_venue'),
+  'shows': ShowLoader
+}
+
+
+class ImportReport:
+  def __init__(self):
+    self.accepted = 0
+    self.rejected = 0
+    self.last_line = 0
+    self.started = time.monotonic()
+
+  @property
+  def rows_per_second(self):
+    elapsed = time.monotonic() - self.started
+    return (self.accepted + self.rejected) / elapsed if elapsed else 0.0
+
+
+def run_import(kind, path, batch_size=1000, resume=False, progress=None):
+  """Imports path into the kind table ('venues', 'artists' or 'shows')."""
+  loader = LOADERS[kind]()
+  checkpoint_path = path + '.checkpoint'
+  start_after = 0
+  if resume and os.path.exists(checkpoint_path):
+    with open(checkpoint_path) as f:
+      start_after = json.load(f)['line']
+  report = ImportReport()
+  report.last_line = start_after
+
+  with open(path + '.rejects.jsonl', 'a' if resume else 'w') as rejects_file:
+    def reject(line_no, row, errors):
+      report.rejected += 1
+      rejects_file.write(json.dumps({'line': line_no, 'errors': errors, 'row': row}, default=str) + '\n')
+
+    def flush(batch, invalid, rows):
+      try:
+        write_rejects = loader.write(batch) if batch else []
+        db.session.commit()
+      except Exception:
+        db.session.rollback()
+        raise
+      # rejects are recorded with the batch, so a resumed import
+      # never reports a row twice
+      for line_no, errors in sorted(invalid + write_rejects):
+        reject(line_no, rows[line_no], errors)
+      report.accepted += len(batch) - len(write_rejects)
+      report.last_line = max(rows)
+      with open(checkpoint_path, 'w') as f:
+        json.dump({'line': report.last_line}, f)
+      rejects_file.flush()
+      if progress is not None:
+        progress(report)
+
+    batch, invalid, rows = [], [], {}
+    for line_no, row, errors in read_rows(path):
+      if line_no <= start_after:
+        continue
+      rows[line_no] = row
+      if errors is None:
+        data, errors = validate(loader.form_class, row)
+      if errors is None:
+        try:
+          batch.append((line_no, loader.prepare(data)))
+        except ValueError as e:
+          errors = {'row': [str(e)]}
+      if errors:
+        invalid.append((line_no, errors))
+      if len(rows) == batch_size:
+        flush(batch, invalid, rows)
+        batch, invalid, rows = [], [], {}
+    if rows:
+      flush(batch, invalid, rows)
+
+  if os.path.exists(checkpoint_path):
+    os.remove(checkpoint_path)
+  return report
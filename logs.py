@@ -0,0 +1,202 @@
+import atexit
+import json
+import logging
+import queue
+import random
+import sys
+import time
+import traceback
+import uuid
+from datetime import datetime, timezone
+from logging.handlers import QueueHandler, QueueListener
+from flask import g, has_request_context, request
+from flask.logging import default_handler
+import metrics
+
+#----------------------------------------------------------------------------#
+# Structured logging.
+#
+# Records are handed to a bounded in-memory queue on the request thread and
+# written as JSON lines by a background QueueListener thread, so logging
+# never waits on I/O. When the queue is full the record is dropped and
+# counted (log_records_dropped_total) rather than blocking the request.
+# Records logged during a request carry its request id (taken from an
+# incoming X-Request-ID header or generated, and echoed back), method,
+# path and endpoint; every request ends with one 'fyyur.access' record
+# holding its status and duration. DEBUG records can be sampled.
+#----------------------------------------------------------------------------#
+
+DROPPED = metrics.Counter(
+  'log_records_dropped_total', 'Log records dropped because the log queue was full.')
+SAMPLED_OUT = metrics.Counter(
+  'log_records_sampled_out_total', 'DEBUG log records skipped by sampling.')
+
+access_log = logging.getLogger('fyyur.access')
+
+# fields of a LogRecord that are not extras passed by the caller
+_RECORD_FIELDS = set(vars(logging.LogRecord('', 0, '', 0, '', (), None))) | {'message'}
+_CONTEXT_FIELDS = ('request_id', 'method', 'path', 'endpoint')
+
+
+class JsonFormatter(logging.Formatter):
+  def format(self, record):
+    data = {
+      'ts': datetime.fromtimestamp(record.created, timezone.utc).isoformat(timespec='milliseconds'),
+      'level': record.levelname,
+      'logger': record.name,
+      'message': record.getMessage()
+    }
+    for key, value in vars(record).items():
+      if key not in _RECORD_FIELDS and value is not None:
+        data[key] = value
+    if record.exc_text:
+      data['exc'] = record.exc_text
+    return json.dumps(data, default=str)
+
+
+class RequestContextFilter(logging.Filter):
+  """Adds the current request's id, method, path and endpoint."""
+
+  def filter(self, record):
+    if has_request_context():
+      record.request_id = g.get('request_id')
+      record.method = request.method
+      record.path = request.path
+      record.endpoint = request.endpoint
+    return True
+
+
+class DebugSampler(logging.Filter):
+  """Lets through only a share (rate) of DEBUG records."""
+
+  def __init__(self, rate):
+    super().__init__()
+    self.rate = rate
+
+  def filter(self, record):
+    if record.levelno > logging.DEBUG or self.rate >= 1:
+      return True
+    if random.random() < self.rate:
+      return True
+    SAMPLED_OUT.inc()
+    return False
+
+
+class BoundedQueueHandler(QueueHandler):
+  """QueueHandler that drops (and counts) records instead of blocking."""
+
+  def enqueue(self, record):
+    try:
+      self.queue.put_nowait(record)
+    except queue.Full:
+      DROPPED.inc()
+
+  def prepare(self, record):
+    # resolve everything that depends on the caller's state now; the JSON
+    # encoding is left to the listener thread
+    record.message = record.getMessage()
+    record.msg, record.args = record.message, None
+    if record.exc_info:
+      record.exc_text = ''.join(traceback.format_exception(*record.exc_info))
+      record.exc_info = None
+    record.stack_info = None
+    return record
+
+
+class LogPipeline:
+  """The queue, its handler on the root logger and the writer thread."""
+
+  def __init__(self, handlers, max_queue, debug_sample_rate, level):
+    self.queue = queue.Queue(max_queue)
+    self.handler = BoundedQueueHandler(self.queue)
+    self.handler.addFilter(RequestContextFilter())
+    self.handler.addFilter(DebugSampler(debug_sample_rate))
+    self.handlers = handlers
+    self.level = level
+    self.listener = None
+
+  def start(self):
+    """Starts the writer thread."""
+    self.listener = QueueListener(self.queue, *self.handlers, respect_handler_level=True)
+    self.listener.start()
+
+  def stop(self):
+    # writes out what is queued
+    if self.listener is not None:
+      self.listener.stop()
+      self.listener = None
+
+  def after_fork(self):
+    """Restarts logging in a forked child process.
+
+    Threads do not survive fork(), so the child starts its own writer. It
+    also gets a fresh queue: records the parent had queued are the
+    parent's to write, and the parent may have held the queue's lock.
+    """
+    self.queue = queue.Queue(self.queue.maxsize)
+    self.handler.queue = self.queue
+    self.listener = None
+    self.start()
+
+  def install(self):
+    root = logging.getLogger()
+    root.addHandler(self.handler)
+    root.setLevel(self.level)
+
+
+def _start_request():
+  request_id = request.headers.get('X-Request-ID', '')
+  # accept a caller's id only if it is short and printable
+  if not (0 < len(request_id) <= 64 and request_id.isprintable()):
+    request_id = uuid.uuid4().hex
+  g.request_id = request_id
+  g.log_started = time.perf_counter()
+
+
+def _add_request_id(response):
+  request_id = g.get('request_id')
+  if request_id:
+    response.headers['X-Request-ID'] = request_id
+  g.log_status = response.status_code
+  return response
+
+
+def _log_request(exc):
+  started = g.get('log_started')
+  if started is None:
+    return
+  access_log.info('%s %s %s', request.method, request.full_path.rstrip('?'),
+                  g.get('log_status', 500), extra={
+                    'status': g.get('log_status', 500),
+                    'duration_ms': round((time.perf_counter() - started) * 1000, 2)
+                  })
+
+
+def init_app(app):
+  formatter = JsonFormatter()
+  stream = logging.StreamHandler(sys.stdout)
+  stream.setFormatter(formatter)
+  handlers = [stream]
+  log_file = app.config.get('LOG_FILE')
+  if log_file and not app.debug:
+    file_handler = logging.FileHandler(log_file)
+    file_handler.setFormatter(formatter)
+    file_handler.setLevel(logging.INFO)
+    handlers.append(file_handler)
+
+  pipeline = LogPipeline(
+    handlers,
+    max_queue=app.config['LOG_QUEUE_SIZE'],
+    debug_sample_rate=app.config['LOG_DEBUG_SAMPLE_RATE'],
+    level=app.config['LOG_LEVEL']
+  )
+  pipeline.install()
+  pipeline.start()
+  atexit.register(pipeline.stop)
+  app.extensions['logs'] = pipeline
+
+  # records reach the queue through the root logger
+  app.logger.removeHandler(default_handler)
+  app.before_request(_start_request)
+  app.after_request(_add_request_id)
+  app.teardown_request(_log_request)
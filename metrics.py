@@ -0,0 +1,476 @@
+import bisect
+import fcntl
+import glob
+import json
+import os
+import threading
+import time
+from contextlib import contextmanager
+from flask import Response, current_app, g, request
+from jinja2 import Template
+
+#----------------------------------------------------------------------------#
+# Prometheus metrics.
+#
+# A small in-process registry rendered in the Prometheus text format at
+# /metrics. Counters and histograms are updated where things happen (one
+# dict lookup and one lock per update); gauges, and counters kept elsewhere
+# such as the page cache's, are read from a callback at scrape time.
+#
+# Under gunicorn every worker has its own registry. With METRICS_DIR set,
+# each worker writes a snapshot of its registry to
+# METRICS_DIR/<pid>-<first write, ns>.json (atomically, at most every
+# METRICS_FLUSH_INTERVAL seconds, after a request) and /metrics merges the
+# snapshots of all workers: counters and histograms are summed, gauges are
+# combined over live workers only. The counters and histograms of exited
+# workers are folded into METRICS_DIR/exited.json and their snapshots
+# deleted, so totals never go backwards and the directory does not grow.
+#----------------------------------------------------------------------------#
+
+CONTENT_TYPE = 'text/plain; version=0.0.4; charset=utf-8'
+
+# seconds; fine at the low end, where connection checkouts normally land
+LATENCY_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05,
+                   0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+
+
+class Registry:
+  def __init__(self):
+    self.metrics = []
+    self.lock = threading.Lock()
+
+  def register(self, metric):
+    with self.lock:
+      if any(existing.name == metric.name for existing in self.metrics):
+        raise ValueError(f'metric {metric.name} is already registered')
+      self.metrics.append(metric)
+    return metric
+
+  def collect(self):
+    """{name: family}, a family being a JSON-friendly dict of the metric's
+    type, help, label names and {label values: value} samples."""
+    families = {}
+    for metric in self.metrics:
+      family = {
+        'kind': metric.kind,
+        'help': metric.help,
+        'labelnames': list(metric.labelnames),
+        'samples': [[list(labels), value] for labels, value in metric.collect()]
+      }
+      if metric.kind == 'histogram':
+        family['buckets'] = list(metric.buckets)
+      if metric.kind == 'gauge':
+        family['mode'] = metric.multiprocess_mode
+      families[metric.name] = family
+    return families
+
+  def render(self):
+    return render(self.collect())
+
+
+REGISTRY = Registry()
+
+
+def _format(value):
+  if value == float('inf'):
+    return '+Inf'
+  return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+def _label_text(names, values, extra=()):
+  pairs = list(zip(names, values)) + list(extra)
+  if not pairs:
+    return ''
+  escaped = (str(value).replace('\\', r'\\').replace('"', r'\"').replace('\n', r'\n')
+             for _, value in pairs)
+  return '{' + ','.join(f'{name}="{value}"' for (name, _), value in zip(pairs, escaped)) + '}'
+
+
+def render(families):
+  lines = []
+  for name, family in families.items():
+    lines.append(f"# HELP {name} {family['help']}")
+    lines.append(f"# TYPE {name} {family['kind']}")
+    names = family['labelnames']
+    for labels, value in family['samples']:
+      if family['kind'] != 'histogram':
+        lines.append(f'{name}{_label_text(names, labels)} {_format(value)}')
+        continue
+      counts, total = value
+      cumulative = 0
+      for bound, count in zip(family['buckets'] + [float('inf')], counts):
+        cumulative += count
+        le = (('le', _format(bound)),)
+        lines.append(f'{name}_bucket{_label_text(names, labels, le)} {cumulative}')
+      lines.append(f'{name}_sum{_label_text(names, labels)} {_format(total)}')
+      lines.append(f'{name}_count{_label_text(names, labels)} {cumulative}')
+  return '\n'.join(lines) + '\n'
+
+
+class _Metric:
+  labelnames = ()
+
+  def __init__(self, name, help, labelnames=(), registry=REGISTRY):
+    self.name = name
+    self.help = help
+    self.labelnames = tuple(labelnames)
+    self.children = {}
+    self.lock = threading.Lock()
+    if not self.labelnames:
+      # report 0 before the first update
+      self.children[()] = self._child()
+    registry.register(self)
+
+  def labels(self, *values):
+    """The child for one combination of label values."""
+    child = self.children.get(values)
+    if child is None:
+      if len(values) != len(self.labelnames):
+        raise ValueError(f'{self.name} takes labels {self.labelnames}')
+      with self.lock:
+        child = self.children.setdefault(values, self._child())
+    return child
+
+  def collect(self):
+    return [(labels, child.value()) for labels, child in list(self.children.items())]
+
+
+class _CounterChild:
+  def __init__(self):
+    self.count = 0
+    self.lock = threading.Lock()
+
+  def inc(self, amount=1):
+    with self.lock:
+      self.count += amount
+
+  def value(self):
+    return self.count
+
+
+class Counter(_Metric):
+  kind = 'counter'
+  _child = _CounterChild
+
+  def inc(self, amount=1):
+    self.labels().inc(amount)
+
+
+class _HistogramChild:
+  def __init__(self, buckets):
+    self.buckets = buckets
+    # per-bucket (not cumulative) counts, the last one being +Inf
+    self.counts = [0] * (len(buckets) + 1)
+    self.sum = 0.0
+    self.lock = threading.Lock()
+
+  def observe(self, value):
+    index = bisect.bisect_left(self.buckets, value)
+    with self.lock:
+      self.counts[index] += 1
+      self.sum += value
+
+  def value(self):
+    with self.lock:
+      return [list(self.counts), self.sum]
+
+
+class Histogram(_Metric):
+  kind = 'histogram'
+
+  def __init__(self, name, help, labelnames=(), buckets=LATENCY_BUCKETS, registry=REGISTRY):
+    self.buckets = tuple(buckets)
+    super().__init__(name, help, labelnames, registry)
+
+  def _child(self):
+    return _HistogramChild(self.buckets)
+
+  def observe(self, value):
+    self.labels().observe(value)
+
+
+class Gauge:
+  """A value read from callback() whenever metrics are collected; samples
+  are skipped while the callback returns None, or raises RuntimeError
+  (outside an app context).
+
+  multiprocess_mode says how workers' values combine: 'sum', 'max', or
+  'all' to keep one sample per worker, labelled with its pid.
+  """
+  kind = 'gauge'
+  labelnames = ()
+
+  def __init__(self, name, help, callback, multiprocess_mode='sum', registry=REGISTRY):
+    self.name = name
+    self.help = help
+    self.callback = callback
+    self.multiprocess_mode = multiprocess_mode
+    registry.register(self)
+
+  def collect(self):
+    try:
+      value = self.callback()
+    except RuntimeError:
+      return []
+    return [] if value is None else [((), value)]
+
+
+class CallbackCounter(Gauge):
+  """A counter kept elsewhere (e.g. by the page cache), read at scrape time."""
+  kind = 'counter'
+
+
+#----------------------------------------------------------------------------#
+# Multi-process snapshots.
+#----------------------------------------------------------------------------#
+
+# counters and histograms of processes that have exited, folded together
+EXITED = 'exited.json'
+
+# this process's snapshot file: the pid and when it first wrote one, so
+# that a later process given the same pid starts a file of its own
+_snapshot_name = None
+
+
+def _pid_alive(pid):
+  try:
+    os.kill(pid, 0)
+  except ProcessLookupError:
+    return False
+  except PermissionError:
+    pass
+  return True
+
+
+def write_snapshot(directory, registry=REGISTRY):
+  global _snapshot_name
+  pid = os.getpid()
+  if _snapshot_name is None or _snapshot_name[0] != pid:
+    _snapshot_name = (pid, f'{pid}-{time.time_ns()}.json')
+  path = os.path.join(directory, _snapshot_name[1])
+  temporary = f'{path}.tmp'
+  with open(temporary, 'w') as f:
+    json.dump(registry.collect(), f)
+  os.replace(temporary, path)
+
+
+def _snapshots(directory):
+  """[(pid, path, alive)] of the process snapshots in directory. Of the
+  snapshots sharing a pid only the newest can be the running process's."""
+  found = []
+  for path in glob.glob(os.path.join(directory, '*-*.json')):
+    try:
+      pid, started = map(int, os.path.basename(path)[:-len('.json')].split('-'))
+    except ValueError:
+      continue
+    found.append((pid, started, path))
+  newest = {}
+  for pid, started, _ in found:
+    newest[pid] = max(newest.get(pid, started), started)
+  return [(pid, path, started == newest[pid] and _pid_alive(pid))
+          for pid, started, path in sorted(found, key=lambda snapshot: snapshot[2])]
+
+
+def _load(path):
+  try:
+    with open(path) as f:
+      return json.load(f)
+  except (OSError, ValueError):
+    return None
+
+
+def _combine(merged, families, pid):
+  # adds families into merged, whose samples are {label values: value}
+  for name, family in families.items():
+    target = merged.setdefault(name, dict(family, samples={}))
+    mode = family.get('mode')
+    if mode == 'all':
+      target['labelnames'] = family['labelnames'] + ['pid']
+    for labels, value in family['samples']:
+      if mode == 'all':
+        labels = labels + [str(pid)]
+      key = tuple(labels)
+      if key not in target['samples']:
+        target['samples'][key] = value
+      elif family['kind'] == 'histogram':
+        counts, total = target['samples'][key]
+        target['samples'][key] = [[a + b for a, b in zip(counts, value[0])], total + value[1]]
+      elif mode == 'max':
+        target['samples'][key] = max(target['samples'][key], value)
+      else:
+        target['samples'][key] += value
+
+
+def _listed(merged):
+  for family in merged.values():
+    family['samples'] = [[list(labels), value] for labels, value in family['samples'].items()]
+  return merged
+
+
+@contextmanager
+def _directory_lock(directory):
+  # one process at a time folds or reads the snapshots
+  with open(os.path.join(directory, '.lock'), 'w') as lock:
+    fcntl.flock(lock, fcntl.LOCK_EX)
+    yield
+
+
+def _fold_exited(directory):
+  exited = [path for _, path, alive in _snapshots(directory) if not alive]
+  if not exited:
+    return
+  state = _load(os.path.join(directory, EXITED)) or {'families': {}, 'folded': []}
+  # names stay in folded until their file is gone, so a snapshot folded
+  # just before a crash is deleted rather than added again
+  folded = [name for name in state['folded'] if os.path.exists(os.path.join(directory, name))]
+  families = {}
+  _combine(families, state['families'], None)
+  for path in exited:
+    name = os.path.basename(path)
+    if name in folded:
+      continue
+    snapshot = _load(path)
+    if snapshot is None:
+      continue
+    _combine(families, {key: family for key, family in snapshot.items()
+                        if family['kind'] != 'gauge'}, None)
+    folded.append(name)
+  temporary = os.path.join(directory, f'{EXITED}.tmp')
+  with open(temporary, 'w') as f:
+    json.dump({'families': _listed(families), 'folded': folded}, f)
+  os.replace(temporary, os.path.join(directory, EXITED))
+  for path in exited:
+    try:
+      os.remove(path)
+    except FileNotFoundError:
+      pass
+
+
+def fold_exited(directory):
+  """Adds the counters and histograms of exited processes' snapshots to
+  EXITED and deletes the snapshots, so the directory does not grow with
+  every worker restart."""
+  with _directory_lock(directory):
+    _fold_exited(directory)
+
+
+def merge_snapshots(directory):
+  """The families of every worker's snapshot in directory, combined:
+  counters and histograms of running and exited workers, gauges of the
+  running ones."""
+  merged = {}
+  with _directory_lock(directory):
+    _fold_exited(directory)
+    exited = _load(os.path.join(directory, EXITED))
+    if exited is not None:
+      _combine(merged, exited['families'], None)
+    for pid, path, alive in _snapshots(directory):
+      families = _load(path)
+      if families is None or not alive:
+        continue
+      _combine(merged, families, pid)
+  return _listed(merged)
+
+
+#----------------------------------------------------------------------------#
+# Request, template and cache metrics.
+#----------------------------------------------------------------------------#
+
+REQUESTS = Counter(
+  'http_requests_total', 'Requests served.', ('endpoint', 'method', 'status'))
+REQUEST_SECONDS = Histogram(
+  'http_request_duration_seconds', 'Time to serve a request, streamed bodies included.',
+  ('endpoint',))
+REQUEST_EXCEPTIONS = Counter(
+  'http_request_exceptions_total', 'Requests that raised an unhandled exception.',
+  ('endpoint',))
+REQUEST_DB_SECONDS = Histogram(
+  'http_request_db_seconds', 'Database time spent serving a request.', ('endpoint',))
+TEMPLATE_SECONDS = Histogram(
+  'template_render_seconds', 'Time to render a template (not counting streamed ones).',
+  ('template',))
+
+
+class TimedTemplate(Template):
+  def render(self, *args, **kwargs):
+    started = time.perf_counter()
+    try:
+      return super().render(*args, **kwargs)
+    finally:
+      TEMPLATE_SECONDS.labels(self.name or '<string>').observe(time.perf_counter() - started)
+
+
+def _page_cache_stat(name):
+  def read():
+    cache = current_app.extensions.get('page_cache')
+    return cache.stats()[name] if cache is not None else None
+  return read
+
+
+for _name in ('hits', 'misses', 'evictions', 'expirations'):
+  CallbackCounter(f'page_cache_{_name}_total', f'Page cache {_name}.', _page_cache_stat(_name))
+Gauge('page_cache_hit_ratio', "Share of this worker's page cache lookups that hit.",
+      _page_cache_stat('hit_ratio'), multiprocess_mode='all')
+
+
+def _endpoint():
+  # the route's endpoint name; 'none' for unmatched URLs keeps label
+  # values bounded
+  return request.endpoint or 'none'
+
+
+def _start_request():
+  g.metrics_started = time.perf_counter()
+
+
+def _record_status(response):
+  g.metrics_status = response.status_code
+  return response
+
+
+def _finish_request(exc):
+  started = g.pop('metrics_started', None)
+  if started is None:
+    return
+  endpoint = _endpoint()
+  REQUEST_SECONDS.labels(endpoint).observe(time.perf_counter() - started)
+  status = g.pop('metrics_status', 500)
+  REQUESTS.labels(endpoint, request.method, str(status)).inc()
+  if exc is not None:
+    REQUEST_EXCEPTIONS.labels(endpoint).inc()
+  profile = g.get('query_profile')
+  if profile is not None:
+    REQUEST_DB_SECONDS.labels(endpoint).observe(profile.db_time)
+
+  directory = current_app.config.get('METRICS_DIR')
+  if directory:
+    state = current_app.extensions['metrics']
+    now = time.monotonic()
+    if now - state['flushed'] >= current_app.config['METRICS_FLUSH_INTERVAL']:
+      state['flushed'] = now
+      write_snapshot(directory)
+
+
+def metrics_view():
+  directory = current_app.config.get('METRICS_DIR')
+  if directory:
+    write_snapshot(directory)
+    current_app.extensions['metrics']['flushed'] = time.monotonic()
+    body = render(merge_snapshots(directory))
+  else:
+    body = REGISTRY.render()
+  return Response(body, content_type=CONTENT_TYPE)
+
+
+def init_app(app):
+  if not app.config.get('METRICS_ENABLED', True):
+    return
+  directory = app.config.get('METRICS_DIR')
+  if directory:
+    os.makedirs(directory, exist_ok=True)
+  app.extensions['metrics'] = {'flushed': 0.0}
+  app.jinja_env.template_class = TimedTemplate
+  app.before_request(_start_request)
+  app.after_request(_record_status)
+  app.teardown_request(_finish_request)
+  app.add_url_rule('/metrics', 'metrics', metrics_view)
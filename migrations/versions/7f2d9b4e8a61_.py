@@ -0,0 +1,30 @@
+"""add trigram name search indexes
+
+Revision ID: 7f2d9b4e8a61
+Revises: e5a1c3f0b7d2
+Create Date: 2026-10-18 10:03:27.540918
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '7f2d9b4e8a61'
+down_revision = 'e5a1c3f0b7d2'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.execute('CREATE EXTENSION IF NOT EXISTS pg_trgm')
+    op.create_index('ix_artists_name_trgm', 'artists', ['name'], unique=False,
+                    postgresql_using='gin', postgresql_ops={'name': 'gin_trgm_ops'})
+    op.create_index('ix_venues_name_trgm', 'venues', ['name'], unique=False,
+                    postgresql_using='gin', postgresql_ops={'name': 'gin_trgm_ops'})
+
+
+def downgrade():
+    op.drop_index('ix_venues_name_trgm', table_name='venues')
+    op.drop_index('ix_artists_name_trgm', table_name='artists')
+    # the extension is left installed; other database objects may use it
@@ -0,0 +1,48 @@
+"""add denormalized show counters
+
+Revision ID: a41f5e7c2b90
+Revises: 1c6e0a9d3f45
+Create Date: 2026-10-18 12:40:51.203377
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'a41f5e7c2b90'
+down_revision = '1c6e0a9d3f45'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.add_column('artists', sa.Column('num_upcoming_shows', sa.Integer(), server_default='0', nullable=False))
+    op.add_column('artists', sa.Column('num_past_shows', sa.Integer(), server_default='0', nullable=False))
+    op.add_column('venues', sa.Column('num_upcoming_shows', sa.Integer(), server_default='0', nullable=False))
+    op.add_column('venues', sa.Column('num_past_shows', sa.Integer(), server_default='0', nullable=False))
+    op.add_column('shows', sa.Column('is_past', sa.Boolean(), server_default=sa.false(), nullable=False))
+
+    # backfill from the existing shows
+    op.execute('UPDATE shows SET is_past = (start_time <= now())')
+    for table, key in (('venues', 'venue_id'), ('artists', 'artist_id')):
+        op.execute(f'''
+            UPDATE {table} SET
+              num_upcoming_shows = c.upcoming,
+              num_past_shows = c.past
+            FROM (
+              SELECT {key} AS item_id,
+                     count(*) FILTER (WHERE NOT is_past) AS upcoming,
+                     count(*) FILTER (WHERE is_past) AS past
+              FROM shows GROUP BY {key}
+            ) AS c
+            WHERE {table}.id = c.item_id
+        ''')
+
+
+def downgrade():
+    op.drop_column('shows', 'is_past')
+    op.drop_column('venues', 'num_past_shows')
+    op.drop_column('venues', 'num_upcoming_shows')
+    op.drop_column('artists', 'num_past_shows')
+    op.drop_column('artists', 'num_upcoming_shows')
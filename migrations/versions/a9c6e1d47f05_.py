@@ -0,0 +1,36 @@
+"""widen shows.id to bigint and add the snowflake worker id sequence
+
+Revision ID: a9c6e1d47f05
+Revises: f3a7c9e2d184
+Create Date: 2026-10-18 22:40:13.502874
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'a9c6e1d47f05'
+down_revision = 'f3a7c9e2d184'
+branch_labels = None
+depends_on = None
+
+# see ids.py
+WORKER_SEQUENCE = sa.Sequence('show_worker_id_seq', minvalue=0, maxvalue=1023, start=0, cycle=True)
+
+
+def upgrade():
+    # snowflake ids need 63 bits; on the partitioned table this rewrites
+    # every partition
+    op.alter_column('shows', 'id', type_=sa.BigInteger, existing_type=sa.Integer,
+                    existing_nullable=False)
+    op.execute('ALTER SEQUENCE shows_id_seq AS bigint')
+    op.execute(sa.schema.CreateSequence(WORKER_SEQUENCE))
+
+
+def downgrade():
+    # fails while snowflake ids are stored, which do not fit an integer
+    op.execute(sa.schema.DropSequence(WORKER_SEQUENCE))
+    op.execute('ALTER SEQUENCE shows_id_seq AS integer')
+    op.alter_column('shows', 'id', type_=sa.Integer, existing_type=sa.BigInteger,
+                    existing_nullable=False)
@@ -0,0 +1,27 @@
+"""index venues and artists on created_date
+
+Revision ID: b8e4c07a1d36
+Revises: d5f2a8c94b17
+Create Date: 2026-10-18 20:02:41.736150
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'b8e4c07a1d36'
+down_revision = 'd5f2a8c94b17'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    # the home page lists the newest of each, ORDER BY created_date DESC
+    for table in ('venues', 'artists'):
+        op.create_index(op.f(f'ix_{table}_created_date'), table, ['created_date'], unique=False)
+
+
+def downgrade():
+    for table in ('artists', 'venues'):
+        op.drop_index(op.f(f'ix_{table}_created_date'), table_name=table)
@@ -0,0 +1,110 @@
+"""partition shows by month on start_time
+
+Revision ID: d5f2a8c94b17
+Revises: c3d8e1f0a527
+Create Date: 2026-10-18 19:34:51.204716
+
+"""
+from datetime import datetime, timezone
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'd5f2a8c94b17'
+down_revision = 'c3d8e1f0a527'
+branch_labels = None
+depends_on = None
+
+# months of partitions created ahead of the current one; later months are
+# added by 'flask partitions ensure'
+MONTHS_AHEAD = 12
+
+COLUMNS = 'id, start_time, venue_id, artist_id, is_past, updated_at'
+
+INDEXES = (
+    ('ix_shows_venue_id_start_time', 'venue_id, start_time'),
+    ('ix_shows_artist_id_start_time', 'artist_id, start_time'),
+    ('ix_shows_start_time_id', 'start_time, id'),
+    ('ix_shows_updated_at', 'updated_at'),
+)
+
+
+def _month(value):
+    return datetime(value.year, value.month, 1, tzinfo=timezone.utc)
+
+
+def _next_month(month):
+    if month.month == 12:
+        return month.replace(year=month.year + 1, month=1)
+    return month.replace(month=month.month + 1)
+
+
+def _create_table(partitioned):
+    # a partitioned table's primary key has to include the partition key
+    op.execute(f"""
+        CREATE TABLE shows (
+            id integer NOT NULL DEFAULT nextval('shows_id_seq'),
+            start_time timestamp with time zone {'NOT NULL' if partitioned else ''},
+            venue_id integer NOT NULL REFERENCES venues (id),
+            artist_id integer NOT NULL REFERENCES artists (id),
+            is_past boolean NOT NULL DEFAULT false,
+            updated_at timestamp with time zone NOT NULL DEFAULT now(),
+            PRIMARY KEY ({'id, start_time' if partitioned else 'id'})
+        ) {'PARTITION BY RANGE (start_time)' if partitioned else ''}
+    """)
+
+
+def _swap_table(partitioned):
+    """Moves every row of shows into a new table of the other kind."""
+    old = 'shows_unpartitioned' if partitioned else 'shows_partitioned'
+    for name, _ in INDEXES:
+        op.execute(f'DROP INDEX {name}')
+    op.execute(f'ALTER TABLE shows RENAME TO {old}')
+    op.execute(f'ALTER TABLE {old} RENAME CONSTRAINT shows_pkey TO {old}_pkey')
+    _create_table(partitioned)
+    if partitioned:
+        _create_partitions(old)
+    op.execute(f'INSERT INTO shows ({COLUMNS}) SELECT {COLUMNS} FROM {old}')
+    # the sequence would be dropped with the old table
+    op.execute('ALTER SEQUENCE shows_id_seq OWNED BY shows.id')
+    op.execute(f'DROP TABLE {old}')
+    # built after the copy, which is faster than maintaining them during it;
+    # on the partitioned table each one cascades to every partition
+    for name, columns in INDEXES:
+        op.execute(f'CREATE INDEX {name} ON shows ({columns})')
+
+
+def _create_partitions(source):
+    # one per month from the earliest show to MONTHS_AHEAD months from now,
+    # plus a default partition for anything outside them
+    earliest, latest = op.get_bind().execute(
+        sa.text(f'SELECT min(start_time), max(start_time) FROM {source}')).one()
+    now = datetime.now(timezone.utc)
+    month = _month(earliest or now)
+    last = _month(now)
+    for _ in range(MONTHS_AHEAD):
+        last = _next_month(last)
+    if latest is not None:
+        last = max(last, _month(latest))
+    while month <= last:
+        following = _next_month(month)
+        op.execute(
+            f"CREATE TABLE shows_{month:%Y_%m} PARTITION OF shows "
+            f"FOR VALUES FROM ('{month.isoformat()}') TO ('{following.isoformat()}')")
+        month = following
+    op.execute('CREATE TABLE shows_default PARTITION OF shows DEFAULT')
+
+
+def upgrade():
+    # the partition key cannot be null; shows without a start time (the form
+    # requires one) are filed under their last update
+    op.execute('UPDATE shows SET start_time = updated_at WHERE start_time IS NULL')
+    _swap_table(partitioned=True)
+    op.execute('ANALYZE shows')
+
+
+def downgrade():
+    # partitions detached by 'flask partitions archive' are left alone
+    _swap_table(partitioned=False)
+    op.execute('ANALYZE shows')
@@ -0,0 +1,37 @@
+"""lease snowflake worker ids from show_id_workers instead of a cycling sequence
+
+Revision ID: e4b7d2a91c58
+Revises: a9c6e1d47f05
+Create Date: 2026-10-18 23:12:37.118204
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'e4b7d2a91c58'
+down_revision = 'a9c6e1d47f05'
+branch_labels = None
+depends_on = None
+
+# see ids.py
+WORKER_SEQUENCE = sa.Sequence('show_worker_id_seq', minvalue=0, maxvalue=1023, start=0, cycle=True)
+
+
+def upgrade():
+    op.create_table(
+        'show_id_workers',
+        sa.Column('worker_id', sa.SmallInteger(), autoincrement=False, nullable=False),
+        sa.Column('holder', sa.String(), nullable=True),
+        sa.Column('expires_at', sa.DateTime(timezone=True), nullable=False,
+                  server_default=sa.text("'-infinity'")),
+        sa.PrimaryKeyConstraint('worker_id')
+    )
+    op.execute('INSERT INTO show_id_workers (worker_id) SELECT generate_series(0, 1023)')
+    op.execute(sa.schema.DropSequence(WORKER_SEQUENCE))
+
+
+def downgrade():
+    op.execute(sa.schema.CreateSequence(WORKER_SEQUENCE))
+    op.drop_table('show_id_workers')
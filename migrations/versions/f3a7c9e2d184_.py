@@ -0,0 +1,46 @@
+"""give shows an end_time and index their time ranges for booking conflicts
+
+Revision ID: f3a7c9e2d184
+Revises: b8e4c07a1d36
+Create Date: 2026-10-18 21:12:09.418233
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'f3a7c9e2d184'
+down_revision = 'b8e4c07a1d36'
+branch_labels = None
+depends_on = None
+
+OWNERS = ('venue_id', 'artist_id')
+
+
+def upgrade():
+    op.add_column('shows', sa.Column('end_time', sa.DateTime(timezone=True), nullable=True))
+    # shows had no length so far; they get the default (models.SHOW_DURATION)
+    op.execute("UPDATE shows SET end_time = start_time + interval '2 hours'")
+    op.alter_column('shows', 'end_time', nullable=False)
+    op.create_check_constraint('ck_shows_end_after_start', 'shows', 'end_time > start_time')
+    # models.MAX_SHOW_DURATION; the conflict check relies on it
+    op.create_check_constraint(
+        'ck_shows_max_duration', 'shows', "end_time <= start_time + interval '24 hours'")
+    # GiST indexes over an integer column and a range need btree_gist. An
+    # exclusion constraint is not possible: shows is partitioned by month
+    # and such a constraint cannot span partitions, see scheduling.py
+    op.execute('CREATE EXTENSION IF NOT EXISTS btree_gist')
+    for owner in OWNERS:
+        op.create_index(f'ix_shows_{owner}_during', 'shows',
+                        [owner, sa.text('tstzrange(start_time, end_time)')],
+                        unique=False, postgresql_using='gist')
+    op.execute('ANALYZE shows')
+
+
+def downgrade():
+    for owner in reversed(OWNERS):
+        op.drop_index(f'ix_shows_{owner}_during', table_name='shows')
+    op.drop_constraint('ck_shows_max_duration', 'shows', type_='check')
+    op.drop_constraint('ck_shows_end_after_start', 'shows', type_='check')
+    op.drop_column('shows', 'end_time')
@@ -1,8 +1,22 @@
 from flask_sqlalchemy import SQLAlchemy
-from datetime import datetime, timezone
+from datetime import datetime, timedelta, timezone
 
 db = SQLAlchemy()
 
+# how long a show lasts when no duration or end_time is given, and at most
+# (ck_shows_max_duration on the shows table says the same)
+SHOW_DURATION = timedelta(hours=2)
+MAX_SHOW_DURATION = timedelta(hours=24)
+
+
+def utcnow():
+  return datetime.now(timezone.utc)
+
+
+def default_end_time(context):
+  return context.get_current_parameters()['start_time'] + SHOW_DURATION
+
+
 #----------------------------------------------------------------------------#
 # Models.
 #----------------------------------------------------------------------------#
@@ -14,7 +28,7 @@ class VenueGenre(db.Model):
 
   id = db.Column(db.Integer, primary_key=True, nullable=False)
   category = db.Column(db.String, nullable=False)
-  venue_id = db.Column(db.Integer, db.ForeignKey('venues.id', ondelete="CASCADE"))
+  venue_id = db.Column(db.Integer, db.ForeignKey('venues.id', ondelete="CASCADE"), index=True)
   # venue_name = db.Column(db.String, db.ForeignKey('venues.name'))
 
 
@@ -26,14 +40,17 @@ class ArtistGenre(db.Model):
   
   id = db.Column(db.Integer, primary_key=True, nullable=False)
   category = db.Column(db.String, nullable=False)
-  artist_id = db.Column(db.Integer, db.ForeignKey('artists.id', ondelete="CASCADE"))
+  artist_id = db.Column(db.Integer, db.ForeignKey('artists.id', ondelete="CASCADE"), index=True)
   # artist_name = db.Column(db.String, db.ForeignKey('artists.name'))
 
 
 class Venue(db.Model):
     __tablename__ = 'venues'
     __table_args__ = (
-      {'extend_existing': True}
+      # name search: ILIKE '%term%' and similarity() ranking via pg_trgm
+      db.Index('ix_venues_name_trgm', 'name',
+               postgresql_using='gin', postgresql_ops={'name': 'gin_trgm_ops'}),
+      {'extend_existing': True},
     )
 
     id = db.Column(db.Integer, primary_key=True, nullable=False, autoincrement=True)
@@ -49,14 +66,21 @@ class Venue(db.Model):
     seeking_talent = db.Column(db.Boolean, nullable=False)
     seeking_description = db.Column(db.String, nullable=True)
     image_link = db.Column(db.String(500))
-    created_date = db.Column(db.DateTime(timezone=True), nullable=True, default=datetime.now(timezone.utc))
+    # newest first on the home page
+    created_date = db.Column(db.DateTime(timezone=True), nullable=True, index=True, default=utcnow)
     shows = db.relationship("Show", backref="venues")
+    # maintained by counters.py
+    num_upcoming_shows = db.Column(db.Integer, nullable=False, default=0, server_default='0')
+    num_past_shows = db.Column(db.Integer, nullable=False, default=0, server_default='0')
+    # bumped on every write to the row and by versions.touch(); the page
+    # ETag/Last-Modified are derived from it
+    updated_at = db.Column(db.DateTime(timezone=True), nullable=False, index=True,
+                           default=utcnow, onupdate=utcnow, server_default=db.func.now())
 
     def __repr__(self):
       return f'<Venue {self.id} {self.name}>'
     
     def to_dictionary(self):
-      fmt = '%Y-%m-%dT%H:%M:%S.%f'
       data = {
         'id': self.id,
         'name': self.name,
@@ -70,7 +94,7 @@ class Venue(db.Model):
         'seeking_talent': self.seeking_talent,
         'seeking_description': self.seeking_description,
         'image_link': self.image_link,
-        'created_date': self.created_date.strftime(fmt)[:-3] + 'Z',
+        'created_date': self.created_date,
         'past_shows': [],
         'upcoming_shows': [],
         'past_shows_count': 0,
@@ -82,7 +106,10 @@ class Venue(db.Model):
 class Artist(db.Model):
     __tablename__ = 'artists'
     __table_args__ = (
-      {'extend_existing': True}
+      # name search: ILIKE '%term%' and similarity() ranking via pg_trgm
+      db.Index('ix_artists_name_trgm', 'name',
+               postgresql_using='gin', postgresql_ops={'name': 'gin_trgm_ops'}),
+      {'extend_existing': True},
     )
 
     id = db.Column(db.Integer, primary_key=True, nullable=False, autoincrement=True)
@@ -97,14 +124,21 @@ class Artist(db.Model):
     seeking_venue = db.Column(db.Boolean, nullable=False)
     seeking_description = db.Column(db.String, nullable=True)
     image_link = db.Column(db.String(500))
-    created_date = db.Column(db.DateTime(timezone=True), nullable=True, default=datetime.now(timezone.utc))
+    # newest first on the home page
+    created_date = db.Column(db.DateTime(timezone=True), nullable=True, index=True, default=utcnow)
     shows = db.relationship("Show", backref="artists")
+    # maintained by counters.py
+    num_upcoming_shows = db.Column(db.Integer, nullable=False, default=0, server_default='0')
+    num_past_shows = db.Column(db.Integer, nullable=False, default=0, server_default='0')
+    # bumped on every write to the row and by versions.touch(); the page
+    # ETag/Last-Modified are derived from it
+    updated_at = db.Column(db.DateTime(timezone=True), nullable=False, index=True,
+                           default=utcnow, onupdate=utcnow, server_default=db.func.now())
 
     def __repr__(self):
       return f'<Artist {self.id} {self.name}>'
 
     def to_dictionary(self):
-      fmt = '%Y-%m-%dT%H:%M:%S.%f'
       data = {
         'id': self.id,
         'name': self.name,
@@ -117,7 +151,7 @@ class Artist(db.Model):
         'seeking_venue': self.seeking_venue,
         'seeking_description': self.seeking_description,
         'image_link': self.image_link,
-        'created_date': self.created_date.strftime(fmt)[:-3] + 'Z',
+        'created_date': self.created_date,
         'past_shows': [],
         'upcoming_shows': [],
         'past_shows_count': 0,
@@ -127,36 +161,86 @@ class Artist(db.Model):
 
 
 class Show(db.Model):
+  # on PostgreSQL the table is partitioned by month on start_time, so its
+  # real primary key is (id, start_time); see partitions.py
   __tablename__ = 'shows'
   __table_args__ = (
+    # upcoming/past lookups filter on the owner id plus a start_time range
+    db.Index('ix_shows_venue_id_start_time', 'venue_id', 'start_time'),
+    db.Index('ix_shows_artist_id_start_time', 'artist_id', 'start_time'),
+    # keyset pagination of /shows orders by (start_time, id)
+    db.Index('ix_shows_start_time_id', 'start_time', 'id'),
+    db.CheckConstraint('end_time > start_time', name='ck_shows_end_after_start'),
     {'extend_existing': True},
   )
-  id = db.Column(db.Integer, primary_key=True)
-  start_time = db.Column(db.DateTime(timezone=True), nullable=True, 
-                         default=datetime.now(timezone.utc))
+  # allocated by the writer before the insert (ids.py); bigint for
+  # snowflake ids, plain INTEGER on SQLite so it stays the rowid
+  id = db.Column(db.BigInteger().with_variant(db.Integer, 'sqlite'), primary_key=True)
+  start_time = db.Column(db.DateTime(timezone=True), nullable=False, default=utcnow)
+  # the show occupies its venue and artist for [start_time, end_time)
+  end_time = db.Column(db.DateTime(timezone=True), nullable=False, default=default_end_time)
   venue_id = db.Column(db.Integer, db.ForeignKey('venues.id'), nullable=False)
   artist_id = db.Column(db.Integer, db.ForeignKey('artists.id'), nullable=False)
+  # which venue/artist counter the show is counted in, see counters.py
+  is_past = db.Column(db.Boolean, nullable=False, default=False, server_default=db.false())
+  updated_at = db.Column(db.DateTime(timezone=True), nullable=False, index=True,
+                         default=utcnow, onupdate=utcnow, server_default=db.func.now())
   
   def __repr__(self):
     return f'<Show {self.id} {self.venue_id} {self.artist_id}>'
 
 
   def to_dictionary(self, category=None):
-    fmt = '%Y-%m-%dT%H:%M:%S.%f'
+    # the counterpart comes from the artists/venues backrefs, so callers
+    # listing many shows should eager load them (see queries.entity_detail)
     data = {
       'artist_id': self.artist_id,
-      'start_time': self.start_time.strftime(fmt)[:-3] + 'Z'
+      'venue_id': self.venue_id,
+      'start_time': self.start_time
     }
     if category is None:
       pass
     elif category == 'artist':
-      artist = Artist.query.get(self.artist_id)
-      data['artist_name'] = artist.name
-      data['artist_image_link'] = artist.image_link
+      data['artist_name'] = self.artists.name
+      data['artist_image_link'] = self.artists.image_link
     elif category == 'venue':
-      venue = Venue.query.get(self.venue_id)
-      data['venue_name'] = venue.name
-      data['venue_image_link'] = venue.image_link
+      data['venue_name'] = self.venues.name
+      data['venue_image_link'] = self.venues.image_link
     else:
       raise NotImplementedError
     return data
+
+
+# PostgreSQL only, so that create_all() still works on SQLite: the indexes
+# behind booking conflict checks (see scheduling.py; GiST over an integer
+# needs btree_gist) and the bound on a show's length those checks rely on
+for _statement in (
+  "ALTER TABLE shows ADD CONSTRAINT ck_shows_max_duration "
+  "CHECK (end_time <= start_time + interval '24 hours')",
+  'CREATE INDEX ix_shows_venue_id_during ON shows '
+  'USING gist (venue_id, tstzrange(start_time, end_time))',
+  'CREATE INDEX ix_shows_artist_id_during ON shows '
+  'USING gist (artist_id, tstzrange(start_time, end_time))',
+):
+  db.event.listen(Show.__table__, 'after_create',
+                  db.DDL(_statement).execute_if(dialect='postgresql'))
+
+
+# snowflake worker ids (ids.py): one row per id, which a running process
+# holds until expires_at and renews while it makes ids; a lease that is not
+# renewed expires and the id goes to the next process that asks
+show_id_workers = db.Table(
+  'show_id_workers', db.metadata,
+  db.Column('worker_id', db.SmallInteger, primary_key=True, autoincrement=False),
+  db.Column('holder', db.String),
+  db.Column('expires_at', db.DateTime(timezone=True), nullable=False,
+            server_default=db.text("'-infinity'")),
+)
+db.event.listen(show_id_workers, 'after_create', db.DDL(
+  'INSERT INTO show_id_workers (worker_id) SELECT generate_series(0, 1023)'
+).execute_if(dialect='postgresql'))
+
+# set up the backrefs (Show.venues, Show.artists, ...) now rather than at
+# the first query: statements built from them, as in
+# queries.entity_detail_statements, may come before any query runs
+db.configure_mappers()
@@ -0,0 +1,150 @@
+import re
+from collections import namedtuple
+from datetime import datetime, timezone
+from sqlalchemy import text
+import counters
+from models import (
+  db,
+  Venue,
+  Artist
+)
+
+#----------------------------------------------------------------------------#
+# Monthly partitions of the shows table.
+#
+# On PostgreSQL, shows is partitioned by range of start_time (migration
+# d5f2a8c94b17): one partition per UTC month, named shows_YYYY_MM, plus
+# shows_default for rows outside all of them. Queries bounded on
+# start_time, like the /shows filters, only scan the months they cover.
+#   - ensure() creates the partitions for the coming months, moving any of
+#     their rows out of the default partition first;
+#   - archive() detaches the partitions of months before a date, taking
+#     their shows off the venue/artist counters. A detached partition stays
+#     as a plain table (e.g. for pg_dump) unless it is dropped.
+# Every function is a no-op on a database where shows is not partitioned
+# (SQLite, or tables made by create_all()).
+#----------------------------------------------------------------------------#
+
+PARENT = 'shows'
+DEFAULT = 'shows_default'
+NAME = re.compile(r'^shows_(\d{4})_(\d{2})$')
+
+Partition = namedtuple('Partition', 'name month rows')
+
+
+def month_start(value):
+  """The first instant of value's month in UTC."""
+  if value.tzinfo is not None:
+    value = value.astimezone(timezone.utc)
+  return datetime(value.year, value.month, 1, tzinfo=timezone.utc)
+
+
+def next_month(month):
+  if month.month == 12:
+    return month.replace(year=month.year + 1, month=1)
+  return month.replace(month=month.month + 1)
+
+
+def partition_name(month):
+  return f'{PARENT}_{month:%Y_%m}'
+
+
+def is_partitioned():
+  if db.engine.dialect.name != 'postgresql':
+    return False
+  return db.session.execute(text("""
+    SELECT EXISTS (
+      SELECT 1 FROM pg_partitioned_table p JOIN pg_class c ON c.oid = p.partrelid
+      WHERE c.oid = to_regclass(:parent)
+    )
+  """), {'parent': PARENT}).scalar()
+
+
+def list_partitions():
+  """The attached partitions in month order (the default one last, with
+  month None); rows is the planner's estimate."""
+  if not is_partitioned():
+    return []
+  rows = db.session.execute(text("""
+    SELECT c.relname, c.reltuples
+    FROM pg_inherits i JOIN pg_class c ON c.oid = i.inhrelid
+    WHERE i.inhparent = to_regclass(:parent)
+  """), {'parent': PARENT})
+  partitions = []
+  for name, estimate in rows:
+    match = NAME.match(name)
+    month = None
+    if match:
+      month = datetime(int(match.group(1)), int(match.group(2)), 1, tzinfo=timezone.utc)
+    # reltuples is -1 for a table never analyzed
+    partitions.append(Partition(name, month, max(int(estimate), 0)))
+  partitions.sort(key=lambda partition: (partition.month is None, partition.month or 0))
+  return partitions
+
+
+def create_partition(month):
+  """Creates the partition for month; the caller commits.
+
+  Rows of that month already in the default partition would make a plain
+  CREATE ... PARTITION OF fail, so the table is made detached, those rows
+  are moved into it and then it is attached.
+  """
+  start, end = month_start(month), next_month(month_start(month))
+  name = partition_name(start)
+  bounds = {'start': start, 'end': end}
+  db.session.execute(text(
+    f'CREATE TABLE {name} (LIKE {PARENT} INCLUDING DEFAULTS INCLUDING CONSTRAINTS)'))
+  db.session.execute(text(f"""
+    WITH moved AS (
+      DELETE FROM {DEFAULT} WHERE start_time >= :start AND start_time < :end RETURNING *
+    )
+    INSERT INTO {name} SELECT * FROM moved
+  """), bounds)
+  # bounds are literals in DDL; the datetimes are ours, not user input
+  db.session.execute(text(
+    f"ALTER TABLE {PARENT} ATTACH PARTITION {name} "
+    f"FOR VALUES FROM ('{start.isoformat()}') TO ('{end.isoformat()}')"))
+  return name
+
+
+def ensure(months_ahead=12, now=None):
+  """Creates the missing partitions from the current month to
+  months_ahead months after it. Returns their names; the caller commits."""
+  if not is_partitioned():
+    return []
+  existing = {partition.month for partition in list_partitions()}
+  month = month_start(now or datetime.now(timezone.utc))
+  created = []
+  for _ in range(months_ahead + 1):
+    if month not in existing:
+      created.append(create_partition(month))
+    month = next_month(month)
+  return created
+
+
+def archive(before, drop=False):
+  """Detaches (or with drop, drops) the partitions of the months before
+  before's month. Returns their names; the caller commits.
+
+  The shows in them leave the venue/artist counters, which also bumps
+  those rows' versions, so their cached pages are not served again. Raises
+  ValueError for a month that is not over yet, which ensure() would
+  otherwise try to recreate.
+  """
+  if not is_partitioned():
+    return []
+  cutoff = month_start(before)
+  if cutoff > month_start(datetime.now(timezone.utc)):
+    raise ValueError('only months before the current one can be archived')
+  archived = []
+  for partition in list_partitions():
+    if partition.month is None or partition.month >= cutoff:
+      continue
+    shows = db.table(partition.name, db.column('venue_id'), db.column('artist_id'),
+                     db.column('is_past'))
+    counters.uncount(shows)
+    db.session.execute(text(f'ALTER TABLE {PARENT} DETACH PARTITION {partition.name}'))
+    if drop:
+      db.session.execute(text(f'DROP TABLE {partition.name}'))
+    archived.append(partition.name)
+  return archived
@@ -0,0 +1,186 @@
+import heapq
+import re
+import threading
+import time
+from collections import Counter
+from contextlib import contextmanager
+from flask import current_app, g, has_request_context, request
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+import metrics
+
+#----------------------------------------------------------------------------#
+# Per-request query profiling.
+#
+# Every statement run through SQLAlchemy is timed (cursor execute events)
+# and recorded on the current request's QueryProfile: query count, total
+# DB time, the slowest statements and how often each statement fingerprint
+# repeated, which is what an N+1 looks like. Responses get a Server-Timing
+# header; requests over the configured budgets are logged and counted in
+# /metrics. assert_max_queries() and 'flask check-queries' turn the counts
+# into checks that fail CI.
+#----------------------------------------------------------------------------#
+
+OVER_BUDGET = metrics.Counter(
+  'http_requests_over_query_budget_total',
+  'Requests that ran more queries or spent more DB time than budgeted.')
+
+# path -> most queries a GET may run, checked by 'flask check-queries';
+# the pages count one extra for their ETag version
+ROUTE_QUERY_BUDGETS = {
+  '/venues': 2,
+  '/artists': 2,
+  '/shows': 2,
+  '/venues/1': 4,
+  '/artists/1': 4,
+  '/api/v1/venues?embed=shows': 3,
+  '/api/v1/artists?embed=shows': 3,
+  '/api/v1/shows': 1,
+}
+
+_BIND_PARAMS = re.compile(r"%\(\w+\)s|%s|\$\d+|:\w+")
+_LITERALS = re.compile(r"'(?:[^']|'')*'|\b\d+(?:\.\d+)?\b")
+_LISTS = re.compile(r"\(\s*\?(?:\s*,\s*\?)*\s*\)")
+_SPACE = re.compile(r"\s+")
+
+
+def fingerprint(statement):
+  """statement with literals and parameters replaced by ?, so repeats of
+  one query with different values compare equal."""
+  statement = _SPACE.sub(' ', statement).strip()
+  statement = _BIND_PARAMS.sub('?', statement)
+  statement = _LITERALS.sub('?', statement)
+  return _LISTS.sub('(?)', statement)
+
+
+class QueryProfile:
+  def __init__(self, keep_slowest=5):
+    self.queries = 0
+    self.db_time = 0.0
+    self.keep_slowest = keep_slowest
+    # min-heap of (seconds, order, statement), the slowest kept
+    self._slowest = []
+    self.fingerprints = Counter()
+
+  def record(self, statement, elapsed):
+    self.queries += 1
+    self.db_time += elapsed
+    self.fingerprints[fingerprint(statement)] += 1
+    entry = (elapsed, self.queries, statement)
+    if len(self._slowest) < self.keep_slowest:
+      heapq.heappush(self._slowest, entry)
+    elif elapsed > self._slowest[0][0]:
+      heapq.heapreplace(self._slowest, entry)
+
+  @property
+  def slowest(self):
+    """[(seconds, statement)], slowest first."""
+    return [(elapsed, statement) for elapsed, _, statement in sorted(self._slowest, reverse=True)]
+
+  @property
+  def duplicates(self):
+    """{fingerprint: count} for statements that ran more than once."""
+    return {sql: count for sql, count in self.fingerprints.items() if count > 1}
+
+  def report(self):
+    lines = [f'{self.queries} queries, {self.db_time * 1000:.1f} ms in the database']
+    for sql, count in sorted(self.duplicates.items(), key=lambda item: -item[1]):
+      lines.append(f'  repeated {count}x: {sql}')
+    for elapsed, statement in self.slowest:
+      lines.append(f'  {elapsed * 1000:.1f} ms: {_SPACE.sub(" ", statement)}')
+    return '\n'.join(lines)
+
+
+# profiles opened with profile() on this thread, outside of requests
+_local = threading.local()
+
+
+def _active_profiles():
+  profiles = list(getattr(_local, 'stack', ()))
+  if has_request_context():
+    current = g.get('query_profile')
+    if current is not None:
+      profiles.append(current)
+  return profiles
+
+
+@event.listens_for(Engine, 'before_cursor_execute')
+def _start_timer(connection, cursor, statement, parameters, context, executemany):
+  connection.info.setdefault('query_started', []).append(time.perf_counter())
+
+
+@event.listens_for(Engine, 'after_cursor_execute')
+def _stop_timer(connection, cursor, statement, parameters, context, executemany):
+  elapsed = time.perf_counter() - connection.info['query_started'].pop()
+  for profile in _active_profiles():
+    profile.record(statement, elapsed)
+
+
+@contextmanager
+def profile():
+  """Records the queries run on this thread inside the block."""
+  current = QueryProfile()
+  if not hasattr(_local, 'stack'):
+    _local.stack = []
+  stack = _local.stack
+  stack.append(current)
+  try:
+    yield current
+  finally:
+    stack.remove(current)
+
+
+@contextmanager
+def assert_max_queries(limit):
+  """Fails with the query report if the block runs more than limit queries:
+
+    with assert_max_queries(3):
+      client.get('/venues/1')
+  """
+  with profile() as current:
+    yield current
+  if current.queries > limit:
+    raise AssertionError(f'expected at most {limit} queries, got\n{current.report()}')
+
+
+def _start_request():
+  g.query_profile = QueryProfile(current_app.config['PROFILER_KEEP_SLOWEST'])
+  g.request_started = time.perf_counter()
+
+
+def _add_server_timing(response):
+  current = g.get('query_profile')
+  if current is not None:
+    # a streamed body runs its queries after this point; those are only
+    # in the budget check
+    total = (time.perf_counter() - g.request_started) * 1000
+    response.headers.add(
+      'Server-Timing',
+      f'db;dur={current.db_time * 1000:.1f};desc="{current.queries} queries", '
+      f'total;dur={total:.1f}'
+    )
+  return response
+
+
+def _check_budgets(exc):
+  current = g.get('query_profile')
+  if current is None:
+    return
+  config = current_app.config
+  over = []
+  if current.queries > config['QUERY_BUDGET']:
+    over.append(f"more than {config['QUERY_BUDGET']} queries")
+  if current.db_time * 1000 > config['DB_TIME_BUDGET_MS']:
+    over.append(f"more than {config['DB_TIME_BUDGET_MS']} ms in the database")
+  if over:
+    OVER_BUDGET.inc()
+    current_app.logger.warning('%s %s over budget (%s): %s', request.method,
+                               request.full_path, ', '.join(over), current.report())
+
+
+def init_app(app):
+  if not app.config.get('PROFILER_ENABLED', True):
+    return
+  app.before_request(_start_request)
+  app.after_request(_add_server_timing)
+  app.teardown_request(_check_budgets)
@@ -0,0 +1,320 @@
+import base64
+from datetime import datetime, timezone
+from sqlalchemy import select
+from search import search_engine
+from models import (
+  db,
+  Venue,
+  Artist,
+  ArtistGenre,
+  Show
+)
+
+#----------------------------------------------------------------------------#
+# Read queries shared by the controllers.
+#----------------------------------------------------------------------------#
+
+def _show_foreign_key(category):
+  if category == 'venue':
+    return Show.venue_id
+  elif category == 'artist':
+    return Show.artist_id
+  else:
+    raise NotImplementedError
+
+
+def venue_areas_statement():
+  return select(
+    Venue.id,
+    Venue.name,
+    Venue.city,
+    Venue.state,
+    Venue.num_upcoming_shows
+  ).order_by(Venue.id)
+
+
+def group_venue_areas(rows):
+  """venue_areas_statement() rows grouped by (city, state)."""
+  areas = {}
+  for venue_id, name, city, state, num_upcoming_shows in rows:
+    location = (city, state)
+    if location not in areas:
+      areas[location] = {
+        "city": city,
+        "state": state,
+        "venues": []
+      }
+    areas[location]['venues'].append({
+      "id": venue_id,
+      "name": name,
+      "num_upcoming_shows": num_upcoming_shows
+    })
+  return list(areas.values())
+
+
+def venue_areas():
+  """Venues grouped by (city, state) with their upcoming show counts,
+  read from the counter column maintained by counters.py."""
+  return group_venue_areas(db.session.execute(venue_areas_statement()))
+
+
+def recent_entities(model, limit=10):
+  """(id, name) of the limit newest venues or artists."""
+  return db.session.execute(
+    select(model.id, model.name).order_by(model.created_date.desc()).limit(limit)
+  ).all()
+
+
+def search_entities(model, search_term, page=1, per_page=20):
+  """One row per venue/artist whose name matches search_term, with its
+  upcoming show count read from the counter column.
+
+  Returns {"count", "data", "page", "per_page"}, data being the requested
+  page ordered by search rank.
+  """
+  criterion, rank = search_engine().match(model, search_term)
+  rows = db.session.query(
+    model.id,
+    model.name,
+    model.num_upcoming_shows
+  ).filter(
+    criterion
+  ).order_by(
+    db.desc(rank), model.id
+  ).limit(per_page).offset((page - 1) * per_page).all()
+  count = db.session.query(db.func.count(model.id)).filter(criterion).scalar()
+  return {
+    "count": count,
+    "page": page,
+    "per_page": per_page,
+    "data": [
+      {"id": item_id, "name": name, "num_upcoming_shows": num_upcoming}
+      for item_id, name, num_upcoming in rows
+    ]
+  }
+
+
+def _counterpart(category):
+  # the other side of a show, as (model, relationship on Show, category)
+  if category == 'venue':
+    return Artist, Show.artists, 'artist'
+  elif category == 'artist':
+    return Venue, Show.venues, 'venue'
+  else:
+    raise NotImplementedError
+
+
+def _shows_statement(category, item_id, upcoming, current_time):
+  key = _show_foreign_key(category)
+  model, relationship, counterpart = _counterpart(category)
+  if upcoming:
+    window = Show.start_time >= current_time
+  else:
+    window = Show.start_time < current_time
+  return select(Show).join(
+    relationship
+  ).options(
+    db.contains_eager(relationship)
+  ).where(
+    key == item_id, window
+  ).order_by(Show.start_time)
+
+
+def entity_detail_statements(model, item_id):
+  """The three independent statements behind a venue/artist page: the
+  entity joined to its genres, then its past and upcoming shows each
+  joined to the counterpart. asgi.py runs them concurrently."""
+  category = 'venue' if model is Venue else 'artist'
+  current_time = datetime.now(timezone.utc)
+  return (
+    select(model).options(db.joinedload(model.genres)).where(model.id == item_id),
+    _shows_statement(category, item_id, False, current_time),
+    _shows_statement(category, item_id, True, current_time)
+  )
+
+
+def shows_data(model, shows):
+  """The show dicts of a venue/artist page, from _shows_statement() rows."""
+  counterpart = _counterpart('venue' if model is Venue else 'artist')[2]
+  return [show.to_dictionary(counterpart) for show in shows]
+
+
+def entity_detail_data(entity, past_shows, upcoming_shows):
+  data = entity.to_dictionary()
+  data['past_shows'] = past_shows
+  data['past_shows_count'] = len(past_shows)
+  data['upcoming_shows'] = upcoming_shows
+  data['upcoming_shows_count'] = len(upcoming_shows)
+  return data
+
+
+def entity_detail(model, item_id):
+  """Venue/artist page data in three queries (entity_detail_statements()).
+
+  Returns None when there is no such entity.
+  """
+  entity_statement, past_statement, upcoming_statement = entity_detail_statements(model, item_id)
+  entity = db.session.execute(entity_statement).unique().scalars().first()
+  if entity is None:
+    return None
+  past_shows = shows_data(model, db.session.execute(past_statement).scalars())
+  upcoming_shows = shows_data(model, db.session.execute(upcoming_statement).scalars())
+  return entity_detail_data(entity, past_shows, upcoming_shows)
+
+
+def counterpart_ids(category, item_id):
+  """Ids of the artists playing a venue, or the venues an artist plays."""
+  key = _show_foreign_key(category)
+  counterpart = Show.artist_id if category == 'venue' else Show.venue_id
+  rows = db.session.query(counterpart).filter(key == item_id).distinct()
+  return [row[0] for row in rows]
+
+
+def encode_cursor(start_time, show_id):
+  raw = f'{start_time.isoformat()}|{show_id}'.encode()
+  return base64.urlsafe_b64encode(raw).decode().rstrip('=')
+
+
+def decode_cursor(cursor):
+  """(start_time, id) from an encode_cursor() value; ValueError if invalid."""
+  try:
+    raw = base64.urlsafe_b64decode(cursor + '=' * (-len(cursor) % 4)).decode()
+    start_time, show_id = raw.rsplit('|', 1)
+    return datetime.fromisoformat(start_time), int(show_id)
+  except (TypeError, UnicodeDecodeError, base64.binascii.Error) as e:
+    raise ValueError(f'invalid cursor {cursor!r}') from e
+
+
+def parse_time(value):
+  # an ISO date or date-time; naive values are taken as UTC
+  if value.endswith(('Z', 'z')):
+    value = value[:-1] + '+00:00'
+  parsed = datetime.fromisoformat(value)
+  if parsed.tzinfo is None:
+    parsed = parsed.replace(tzinfo=timezone.utc)
+  return parsed
+
+
+class ShowFilters:
+  """The /shows filters: a start_time window [start, end) plus the venue's
+  city and state and the artist's genre.
+
+  A bounded window lets PostgreSQL skip the month partitions of shows that
+  lie outside it (see partitions.py).
+  """
+
+  ARGS = ('from', 'to', 'city', 'state', 'genre')
+
+  def __init__(self, start=None, end=None, city=None, state=None, genre=None):
+    self.start = start
+    self.end = end
+    self.city = city
+    self.state = state
+    self.genre = genre
+
+  @classmethod
+  def from_args(cls, args):
+    """Filters from ?from=&to=&city=&state=&genre=; raises ValueError on a
+    bad date or an empty window."""
+    values = {name: (args.get(name) or '').strip() or None for name in cls.ARGS}
+    try:
+      start = values['from'] and parse_time(values['from'])
+      end = values['to'] and parse_time(values['to'])
+    except ValueError:
+      raise ValueError('from and to must be ISO dates or date-times')
+    if start and end and start >= end:
+      raise ValueError('from must be before to')
+    return cls(start=start, end=end, city=values['city'], state=values['state'],
+               genre=values['genre'])
+
+  def __bool__(self):
+    return any(value is not None for value in
+               (self.start, self.end, self.city, self.state, self.genre))
+
+  def apply(self, statement):
+    """statement (selecting from shows) narrowed to the filters."""
+    if self.start is not None:
+      statement = statement.where(Show.start_time >= self.start)
+    if self.end is not None:
+      statement = statement.where(Show.start_time < self.end)
+    if self.city is not None or self.state is not None:
+      venues = select(Venue.id)
+      if self.city is not None:
+        venues = venues.where(db.func.lower(Venue.city) == self.city.lower())
+      if self.state is not None:
+        venues = venues.where(Venue.state == self.state.upper())
+      statement = statement.where(Show.venue_id.in_(venues))
+    if self.genre is not None:
+      statement = statement.where(Show.artist_id.in_(
+        select(ArtistGenre.artist_id).where(ArtistGenre.category == self.genre)))
+    return statement
+
+
+class ShowPage:
+  """One keyset page of the /shows listing, ordered by (start_time, id).
+
+  Iterating runs the query and yields show dicts as rows arrive, so the
+  page can be streamed; next_cursor is set once iteration is done and
+  another page exists. fetch() materializes the page up front instead.
+  """
+
+  def __init__(self, after=None, per_page=30, upcoming=True, filters=None):
+    self.after = after
+    self.per_page = per_page
+    self.upcoming = upcoming
+    self.filters = filters or ShowFilters()
+    self.next_cursor = None
+    self.rows = None
+
+  def statement(self):
+    statement = select(
+      Show.id,
+      Show.venue_id,
+      Show.artist_id,
+      Show.start_time,
+      Venue.name,
+      Artist.name,
+      Artist.image_link
+    ).join(Artist, Artist.id == Show.artist_id).join(Venue, Venue.id == Show.venue_id)
+    if self.upcoming:
+      statement = statement.where(Show.start_time >= datetime.now(timezone.utc))
+    statement = self.filters.apply(statement)
+    if self.after is not None:
+      statement = statement.where(db.tuple_(Show.start_time, Show.id) > self.after)
+    # one extra row tells us whether there is a next page
+    return statement.order_by(Show.start_time, Show.id).limit(self.per_page + 1)
+
+  def consume(self, rows):
+    """Yields the show dicts of the statement()'s rows."""
+    for count, row in enumerate(rows):
+      show_id, venue_id, artist_id, start_time, venue_name, artist_name, artist_image_link = row
+      if count == self.per_page:
+        self.next_cursor = encode_cursor(last_start_time, last_id)
+        break
+      last_start_time, last_id = start_time, show_id
+      yield {
+        "venue_id": venue_id,
+        "artist_id": artist_id,
+        "start_time": start_time,
+        "venue_name": venue_name,
+        "artist_name": artist_name,
+        "artist_image_link": artist_image_link
+      }
+
+  def _generate(self):
+    statement = self.statement().execution_options(stream_results=True, max_row_buffer=100)
+    yield from self.consume(db.session.execute(statement))
+
+  def load(self, rows):
+    """Fills the page from rows fetched elsewhere (asgi.py)."""
+    self.rows = list(self.consume(rows))
+    return self
+
+  def fetch(self):
+    self.rows = list(self._generate())
+    return self
+
+  def __iter__(self):
+    if self.rows is not None:
+      return iter(self.rows)
+    return self._generate()
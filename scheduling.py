@@ -0,0 +1,336 @@
+from collections import defaultdict, namedtuple
+from datetime import datetime, timedelta, timezone
+from sqlalchemy import text
+import counters
+import ids
+from queries import parse_time
+from models import (
+  db,
+  SHOW_DURATION,
+  MAX_SHOW_DURATION,
+  Venue,
+  Artist,
+  Show
+)
+
+#----------------------------------------------------------------------------#
+# Show scheduling.
+#
+# A show books its venue and its artist for [start_time, end_time); two
+# shows of one venue, or of one artist, may not overlap. schedule() checks
+# a whole batch (a tour, from the API or the schedule form) and inserts it
+# in the caller's transaction, or raises without writing anything:
+#   - overlaps with stored shows come from one query joining the batch to
+#     shows on tstzrange(start_time, end_time) &&, answered per entry by the
+#     GiST indexes on (venue_id, range) and (artist_id, range);
+#   - overlaps inside the batch are found by sorting each venue's and
+#     artist's entries by start;
+#   - the transaction first takes an advisory lock per venue and artist it
+#     books, so concurrent batches for the same venue or artist check and
+#     insert one after the other.
+# The accepted shows go in with one INSERT, under ids allocated up front
+# (ids.py).
+# An exclusion constraint would enforce all of this in PostgreSQL, but
+# shows is partitioned by start_time (see partitions.py) and such a
+# constraint cannot span partitions. On other databases (SQLite in
+# development) there are no locks and the overlaps are compared in Python.
+#----------------------------------------------------------------------------#
+
+Booking = namedtuple('Booking', 'artist_id venue_id start_time end_time')
+
+FIELDS = ('artist_id', 'venue_id', 'start_time', 'duration', 'end_time')
+
+OWNERS = (('venue', Venue), ('artist', Artist))
+
+# first half of the advisory lock key, so venue and artist ids never share
+# a lock
+LOCK_SPACES = {'venue': 1, 'artist': 2}
+
+# the stored shows overlapping each entry of the batch, on its venue and on
+# its artist. The start_time bounds follow from the overlap and the
+# maximum duration; they let each probe skip the month partitions that
+# cannot hold a conflict.
+CONFLICTS = text("""
+  WITH batch AS (
+    SELECT n, venue_id, artist_id, start_time, end_time,
+           tstzrange(start_time, end_time) AS during
+    FROM unnest(CAST(:venue_ids AS integer[]), CAST(:artist_ids AS integer[]),
+                CAST(:starts AS timestamptz[]), CAST(:ends AS timestamptz[]))
+      WITH ORDINALITY AS entries(venue_id, artist_id, start_time, end_time, n)
+  )
+  SELECT batch.n, 'venue', shows.venue_id, shows.id, shows.start_time, shows.end_time
+  FROM batch JOIN shows ON shows.venue_id = batch.venue_id
+    AND tstzrange(shows.start_time, shows.end_time) && batch.during
+    AND shows.start_time < batch.end_time
+    AND shows.start_time > batch.start_time - CAST(:max_duration AS interval)
+  UNION ALL
+  SELECT batch.n, 'artist', shows.artist_id, shows.id, shows.start_time, shows.end_time
+  FROM batch JOIN shows ON shows.artist_id = batch.artist_id
+    AND tstzrange(shows.start_time, shows.end_time) && batch.during
+    AND shows.start_time < batch.end_time
+    AND shows.start_time > batch.start_time - CAST(:max_duration AS interval)
+""")
+
+
+# the batch in one statement: arrays go over as single parameters, where an
+# executemany would format every row into the SQL
+INSERT = text("""
+  INSERT INTO shows (id, venue_id, artist_id, start_time, end_time, is_past)
+  SELECT * FROM unnest(CAST(:ids AS bigint[]),
+                       CAST(:venue_ids AS integer[]), CAST(:artist_ids AS integer[]),
+                       CAST(:starts AS timestamptz[]), CAST(:ends AS timestamptz[]),
+                       CAST(:is_past AS boolean[]))
+""")
+
+
+class ScheduleError(ValueError):
+  """Entries that cannot be scheduled. errors is {index: [messages]},
+  keyed by the position of each failing entry in the batch."""
+
+  def __init__(self, errors):
+    super().__init__(f'{len(errors)} of the shows cannot be scheduled')
+    self.errors = errors
+
+
+class ScheduleConflict(ScheduleError):
+  """Entries overlapping a booked show or another entry of the batch."""
+
+
+def _postgresql():
+  return db.engine.dialect.name == 'postgresql'
+
+
+def _utc(value):
+  # SQLite gives back naive datetimes
+  if value.tzinfo is None:
+    return value.replace(tzinfo=timezone.utc)
+  return value
+
+
+def _id(value, name):
+  if value is None or value == '':
+    raise ValueError(f'{name} is required')
+  try:
+    return int(value)
+  except (TypeError, ValueError):
+    raise ValueError(f'{name} must be an integer')
+
+
+def _time(value, name):
+  if value is None or value == '':
+    raise ValueError(f'{name} is required')
+  if isinstance(value, str):
+    try:
+      return parse_time(value.strip())
+    except ValueError:
+      raise ValueError(f'{name} must be an ISO date-time')
+  # naive datetimes (e.g. from ShowForm) are UTC
+  return _utc(value)
+
+
+def booking(artist_id, venue_id, start_time, duration=None, end_time=None):
+  """A Booking from form or JSON values: ids as ints or strings, times as
+  datetimes or ISO strings (naive ones are UTC), duration in minutes. The
+  show ends at end_time, else after duration, else after SHOW_DURATION.
+  Raises ValueError."""
+  artist_id = _id(artist_id, 'artist_id')
+  venue_id = _id(venue_id, 'venue_id')
+  start_time = _time(start_time, 'start_time')
+  if end_time is not None and end_time != '':
+    end_time = _time(end_time, 'end_time')
+  elif duration is not None and duration != '':
+    try:
+      end_time = start_time + timedelta(minutes=int(duration))
+    except (TypeError, ValueError):
+      raise ValueError('duration must be a number of minutes')
+  else:
+    end_time = start_time + SHOW_DURATION
+  if end_time <= start_time:
+    raise ValueError('a show must end after it starts')
+  if end_time - start_time > MAX_SHOW_DURATION:
+    raise ValueError(f'a show lasts at most {MAX_SHOW_DURATION.total_seconds() / 3600:g} hours')
+  return Booking(artist_id, venue_id, start_time, end_time)
+
+
+def parse_bookings(entries):
+  """Bookings from a list of dicts with the keys in FIELDS; raises
+  ScheduleError naming every malformed entry."""
+  bookings, errors = [], {}
+  for index, entry in enumerate(entries):
+    try:
+      if not isinstance(entry, dict):
+        raise ValueError('expected an object')
+      bookings.append(booking(**{key: entry.get(key) for key in FIELDS}))
+    except ValueError as e:
+      errors[index] = [str(e)]
+  if errors:
+    raise ScheduleError(errors)
+  return bookings
+
+
+def parse_lines(value):
+  """[(line number, entry dict)] from the schedule form's text, one show
+  per line as 'artist_id, venue_id, start time[, duration]'; blank lines
+  are skipped."""
+  entries = []
+  for line_no, line in enumerate(value.splitlines(), start=1):
+    if not line.strip():
+      continue
+    parts = [part.strip() for part in line.split(',')]
+    entries.append((line_no, dict(zip(('artist_id', 'venue_id', 'start_time', 'duration'), parts))))
+  return entries
+
+
+def _span(start, end):
+  start, end = start.astimezone(timezone.utc), end.astimezone(timezone.utc)
+  return f'{start:%Y-%m-%d %H:%M} to {end:%Y-%m-%d %H:%M} UTC'
+
+
+def unknown_owners(bookings):
+  """{index: [messages]} for the bookings whose venue or artist does not
+  exist."""
+  errors = defaultdict(list)
+  for owner, model in OWNERS:
+    key = owner + '_id'
+    ids = {getattr(entry, key) for entry in bookings}
+    found = {item_id for item_id, in db.session.query(model.id).filter(model.id.in_(ids))}
+    for index, entry in enumerate(bookings):
+      if getattr(entry, key) not in found:
+        errors[index].append(f'no {owner} {getattr(entry, key)}')
+  return dict(errors)
+
+
+def lock(bookings):
+  """Takes advisory locks, held until the transaction ends, on the venues
+  and artists of bookings. Keys are taken in one sorted order, so batches
+  sharing venues or artists wait for each other instead of deadlocking."""
+  keys = sorted({
+    (LOCK_SPACES[owner], getattr(entry, owner + '_id'))
+    for entry in bookings for owner in LOCK_SPACES
+  })
+  if not keys or not _postgresql():
+    return
+  # unnest yields the keys in array order, so they are locked in that order
+  db.session.execute(text("""
+    SELECT pg_advisory_xact_lock(space, item_id)
+    FROM unnest(CAST(:spaces AS integer[]), CAST(:item_ids AS integer[])) AS keys(space, item_id)
+  """), {'spaces': [space for space, _ in keys], 'item_ids': [item_id for _, item_id in keys]})
+
+
+def _overlaps_within(bookings):
+  # (index, owner, the booking it overlaps) for each booking starting
+  # before another of its venue or artist has ended
+  for owner in LOCK_SPACES:
+    key = owner + '_id'
+    by_owner = defaultdict(list)
+    for index, entry in enumerate(bookings):
+      by_owner[getattr(entry, key)].append(index)
+    for indexes in by_owner.values():
+      indexes.sort(key=lambda index: bookings[index].start_time)
+      # the booking ending last among those started so far
+      latest = None
+      for index in indexes:
+        if latest is not None and bookings[index].start_time < bookings[latest].end_time:
+          yield index, owner, bookings[latest]
+        if latest is None or bookings[index].end_time > bookings[latest].end_time:
+          latest = index
+
+
+def _stored_overlaps(bookings):
+  # CONFLICTS without tstzrange: the shows of the batch's venues and
+  # artists within its time span, compared here
+  start = min(entry.start_time for entry in bookings) - MAX_SHOW_DURATION
+  end = max(entry.end_time for entry in bookings)
+  for owner in LOCK_SPACES:
+    key = owner + '_id'
+    column = getattr(Show, key)
+    stored = defaultdict(list)
+    rows = db.session.query(column, Show.id, Show.start_time, Show.end_time).filter(
+      column.in_({getattr(entry, key) for entry in bookings}),
+      Show.start_time > start, Show.start_time < end)
+    for owner_id, show_id, start_time, end_time in rows:
+      stored[owner_id].append((show_id, _utc(start_time), _utc(end_time)))
+    for index, entry in enumerate(bookings):
+      owner_id = getattr(entry, key)
+      for show_id, start_time, end_time in stored[owner_id]:
+        if start_time < entry.end_time and end_time > entry.start_time:
+          yield index + 1, owner, owner_id, show_id, start_time, end_time
+
+
+def find_conflicts(bookings):
+  """{index: [messages]} for the bookings overlapping a stored show of
+  their venue or artist, or an earlier booking of the batch."""
+  errors = defaultdict(list)
+  for index, owner, other in _overlaps_within(bookings):
+    errors[index].append(
+      f'{owner} {getattr(other, owner + "_id")} is also booked in this batch from '
+      f'{_span(other.start_time, other.end_time)}')
+  if not bookings:
+    return dict(errors)
+  if _postgresql():
+    rows = db.session.execute(CONFLICTS, {
+      'venue_ids': [entry.venue_id for entry in bookings],
+      'artist_ids': [entry.artist_id for entry in bookings],
+      'starts': [entry.start_time for entry in bookings],
+      'ends': [entry.end_time for entry in bookings],
+      'max_duration': MAX_SHOW_DURATION
+    })
+  else:
+    rows = _stored_overlaps(bookings)
+  for n, owner, owner_id, show_id, start_time, end_time in rows:
+    # numbered from 1, like WITH ORDINALITY
+    errors[n - 1].append(
+      f'{owner} {owner_id} is booked from {_span(start_time, end_time)} (show {show_id})')
+  return dict(errors)
+
+
+def insert(bookings):
+  """Inserts bookings as shows and counts them on their venues and
+  artists, without checking them. Returns the inserted rows as dicts,
+  with their ids."""
+  now = datetime.now(timezone.utc)
+  records = [{
+    'venue_id': entry.venue_id,
+    'artist_id': entry.artist_id,
+    'start_time': entry.start_time,
+    'end_time': entry.end_time,
+    'is_past': entry.start_time <= now
+  } for entry in bookings]
+  if not records:
+    return records
+  show_ids = ids.show_ids(len(records))
+  if show_ids is None:
+    # the database assigns them, one row at a time
+    for record in records:
+      record['id'], = db.session.execute(Show.__table__.insert(), record).inserted_primary_key
+  else:
+    for record, show_id in zip(records, show_ids):
+      record['id'] = show_id
+    if _postgresql():
+      db.session.execute(INSERT, {
+        'ids': show_ids,
+        'venue_ids': [record['venue_id'] for record in records],
+        'artist_ids': [record['artist_id'] for record in records],
+        'starts': [record['start_time'] for record in records],
+        'ends': [record['end_time'] for record in records],
+        'is_past': [record['is_past'] for record in records]
+      })
+    else:
+      db.session.execute(Show.__table__.insert(), records)
+  counters.count_inserted(db.session, records)
+  return records
+
+
+def schedule(bookings):
+  """Checks bookings and inserts them all, or none: raises ScheduleError
+  for unknown venues or artists and ScheduleConflict for overlaps.
+  Returns the inserted rows; the caller commits, or rolls back on an
+  error, which also releases the locks."""
+  errors = unknown_owners(bookings)
+  if errors:
+    raise ScheduleError(errors)
+  lock(bookings)
+  conflicts = find_conflicts(bookings)
+  if conflicts:
+    raise ScheduleConflict(conflicts)
+  return insert(bookings)
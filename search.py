@@ -0,0 +1,197 @@
+import threading
+from collections import defaultdict
+from flask import current_app, has_app_context
+from sqlalchemy import event
+from sqlalchemy.orm import Session, object_session
+from models import (
+  db,
+  Venue,
+  Artist
+)
+
+#----------------------------------------------------------------------------#
+# Name search.
+#
+# search_engine().match(Model, term) returns a (criterion, rank) pair of SQL
+# expressions for a case-insensitive substring match on Model.name:
+#   - TrigramSearch (PostgreSQL): ILIKE served by the pg_trgm GIN indexes on
+#     venues.name / artists.name, ranked by similarity().
+#   - NgramSearch (SQLite and other test databases): an in-process trigram
+#     index that resolves the term to a set of ids and scores up front.
+#----------------------------------------------------------------------------#
+
+SEARCHABLE_MODELS = (Venue, Artist)
+
+
+def _like_pattern(term):
+  escaped = term.replace('\\', '\\\\').replace('%', '\\%').replace('_', '\\_')
+  return f'%{escaped}%'
+
+
+class TrigramSearch:
+  name = 'trigram'
+
+  def match(self, model, term):
+    criterion = model.name.ilike(_like_pattern(term), escape='\\')
+    rank = db.func.similarity(model.name, term)
+    return criterion, rank
+
+
+def ngrams(text, n=3):
+  # pad like pg_trgm so prefixes/suffixes get their own grams
+  padded = f'  {text.lower()} '
+  return {padded[i:i + n] for i in range(len(padded) - n + 1)}
+
+
+class NgramIndex:
+  """In-process trigram index over the names of one model."""
+
+  def __init__(self, n=3):
+    self.n = n
+    self.names = {}
+    self.postings = defaultdict(set)
+    self.lock = threading.Lock()
+
+  def add(self, item_id, name):
+    with self.lock:
+      self._discard(item_id)
+      self.names[item_id] = name
+      for gram in ngrams(name, self.n):
+        self.postings[gram].add(item_id)
+
+  def remove(self, item_id):
+    with self.lock:
+      self._discard(item_id)
+
+  def _discard(self, item_id):
+    name = self.names.pop(item_id, None)
+    if name is None:
+      return
+    for gram in ngrams(name, self.n):
+      self.postings[gram].discard(item_id)
+
+  def search(self, term):
+    """Returns {id: similarity} for every name containing term."""
+    needle = term.lower()
+    # grams fully inside the term; the padded edge grams only match prefixes
+    inner = {needle[i:i + self.n] for i in range(len(needle) - self.n + 1)}
+    with self.lock:
+      if inner:
+        candidates = set.intersection(*(self.postings.get(gram, set()) for gram in inner))
+      else:
+        candidates = set(self.names)
+      names = {item_id: self.names[item_id] for item_id in candidates}
+    term_grams = ngrams(term, self.n)
+    scores = {}
+    for item_id, name in names.items():
+      if needle in name.lower():
+        name_grams = ngrams(name, self.n)
+        scores[item_id] = len(term_grams & name_grams) / len(term_grams | name_grams)
+    return scores
+
+
+class NgramSearch:
+  name = 'ngram'
+
+  def __init__(self):
+    self.indexes = {}
+    self.lock = threading.Lock()
+
+  def index_for(self, model):
+    with self.lock:
+      index = self.indexes.get(model)
+      if index is None:
+        index = NgramIndex()
+        for item_id, name in db.session.query(model.id, model.name):
+          index.add(item_id, name)
+        self.indexes[model] = index
+    return index
+
+  def apply(self, changes):
+    for model, item_id, name in changes:
+      index = self.indexes.get(model)
+      if index is None:
+        continue
+      if name is None:
+        index.remove(item_id)
+      else:
+        index.add(item_id, name)
+
+  def match(self, model, term):
+    scores = self.index_for(model).search(term)
+    criterion = model.id.in_(list(scores))
+    if scores:
+      rank = db.case(scores, value=model.id, else_=0.0)
+    else:
+      # a cast, as PostgreSQL refuses to ORDER BY a bare constant
+      rank = db.cast(db.literal(0.0), db.Float)
+    return criterion, rank
+
+
+def search_engine():
+  return current_app.extensions['search']
+
+
+def init_app(app):
+  backend = app.config.get('SEARCH_BACKEND')
+  if backend is None:
+    uri = app.config.get('SQLALCHEMY_DATABASE_URI', '')
+    backend = 'trigram' if uri.startswith('postgres') else 'ngram'
+  if backend == 'trigram':
+    app.extensions['search'] = TrigramSearch()
+  elif backend == 'ngram':
+    app.extensions['search'] = NgramSearch()
+  else:
+    raise ValueError(f'unknown SEARCH_BACKEND {backend!r}')
+
+
+#  Keep in-process n-gram indexes in sync with committed writes.
+#  ----------------------------------------------------------------
+
+def mark_changed(session, model, rows):
+  """Adds (id, name) rows of model to the in-process indexes when session
+  commits; a None name removes the id. For writes that bypass the ORM
+  hooks (Core inserts and updates)."""
+  session.info.setdefault('search_changes', []).extend(
+    (model, item_id, name) for item_id, name in rows
+  )
+
+
+def _record_change(model, target, name):
+  session = object_session(target)
+  if session is None:
+    return
+  mark_changed(session, model, [(target.id, name)])
+
+
+def _register_listeners(model):
+  @event.listens_for(model, 'after_insert')
+  def after_insert(mapper, connection, target):
+    _record_change(model, target, target.name)
+
+  @event.listens_for(model, 'after_update')
+  def after_update(mapper, connection, target):
+    _record_change(model, target, target.name)
+
+  @event.listens_for(model, 'after_delete')
+  def after_delete(mapper, connection, target):
+    _record_change(model, target, None)
+
+
+for _model in SEARCHABLE_MODELS:
+  _register_listeners(_model)
+
+
+@event.listens_for(Session, 'after_commit')
+def _apply_search_changes(session):
+  changes = session.info.pop('search_changes', None)
+  if not changes or not has_app_context():
+    return
+  engine = current_app.extensions.get('search')
+  if isinstance(engine, NgramSearch):
+    engine.apply(changes)
+
+
+@event.listens_for(Session, 'after_soft_rollback')
+def _discard_search_changes(session, previous_transaction):
+  session.info.pop('search_changes', None)
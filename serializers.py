@@ -0,0 +1,100 @@
+import json
+from datetime import datetime
+from operator import itemgetter
+
+try:
+  import orjson
+except ImportError:
+  orjson = None
+
+#----------------------------------------------------------------------------#
+# JSON serialization for the API.
+#
+# dumps() encodes with orjson when it is installed and falls back to the
+# standard library otherwise; both write datetimes as ISO 8601, so rows go
+# out with their native values and nothing is strftime'd per row.
+#
+# A Serializer is built once per resource from its field -> column mapping.
+# only() narrows it to a sparse fieldset (cached, so each distinct ?fields=
+# is compiled once), and the resulting serializer knows the columns to
+# select and turns each result row into a dict with a single itemgetter.
+# The key column (the primary key) is always selected first, whether or not
+# it was asked for, so callers can attach related data to each row.
+# Fields that need their value adjusted on the way out (such as datetimes
+# the database returns naive) name a converter, which only() carries over.
+#----------------------------------------------------------------------------#
+
+def _default(value):
+  if isinstance(value, datetime):
+    return value.isoformat()
+  raise TypeError(f'{type(value).__name__} is not JSON serializable')
+
+
+def dumps(data):
+  """data encoded as compact JSON bytes."""
+  if orjson is not None:
+    return orjson.dumps(data)
+  return json.dumps(data, separators=(',', ':'), default=_default).encode()
+
+
+class Serializer:
+  """Row-to-dict conversion for a fixed, ordered set of fields.
+
+  fields maps each field name to the column expression it is selected
+  from, or to None for fields that are filled in separately (like genres).
+  convert maps field names to a function applied to each of their values.
+  """
+
+  def __init__(self, fields, key, convert=None):
+    self.fields = dict(fields)
+    self.key = key
+    self.names = tuple(self.fields)
+    selected = [name for name, column in self.fields.items() if column is not None]
+    self.selected = tuple(selected)
+    self.columns = [key] + [self.fields[name] for name in selected]
+    if not selected:
+      self._get = lambda row: ()
+    elif len(selected) == 1:
+      # itemgetter with one index returns the item, not a tuple
+      self._get = lambda row: (row[1],)
+    else:
+      self._get = itemgetter(*range(1, len(selected) + 1))
+    self.convert = {name: function for name, function in (convert or {}).items()
+                    if name in self.fields}
+    self._converted = [(name, function) for name, function in self.convert.items()
+                       if name in selected]
+    self._narrowed = {}
+
+  def only(self, names):
+    """A serializer for a subset of fields; ValueError on unknown names."""
+    wanted = frozenset(names)
+    if not wanted:
+      return self
+    narrowed = self._narrowed.get(wanted)
+    if narrowed is None:
+      unknown = wanted.difference(self.fields)
+      if unknown:
+        raise ValueError(f"unknown field(s): {', '.join(sorted(unknown))}")
+      narrowed = Serializer(
+        ((name, self.fields[name]) for name in self.names if name in wanted), self.key,
+        self.convert
+      )
+      self._narrowed[wanted] = narrowed
+    return narrowed
+
+  def __contains__(self, name):
+    return name in self.fields
+
+  def row(self, row):
+    item = dict(zip(self.selected, self._get(row)))
+    for name, function in self._converted:
+      item[name] = function(item[name])
+    return item
+
+  def rows(self, rows):
+    selected, get = self.selected, self._get
+    items = [dict(zip(selected, get(row))) for row in rows]
+    for name, function in self._converted:
+      for item in items:
+        item[name] = function(item[name])
+    return items
@@ -0,0 +1,103 @@
+import logging
+import os
+import tempfile
+import time
+from datetime import datetime, timezone
+from jinja2 import FileSystemBytecodeCache, TemplateSyntaxError
+import formatting
+
+#----------------------------------------------------------------------------#
+# Template compilation.
+#
+# Jinja compiles a template to Python code the first time it is loaded in a
+# process, which made the first request to each page after a deploy or a
+# worker restart noticeably slower. Two things take that off the request
+# path:
+#   - a bytecode cache in TEMPLATE_BYTECODE_DIR, filled at build time by
+#     'flask templates compile', so a process loads compiled code from disk
+#     instead of parsing templates;
+#   - warm_up(), run as each worker starts (gunicorn.conf.py post_fork,
+#     asgi.py lifespan), which loads every template into the environment.
+#----------------------------------------------------------------------------#
+
+logger = logging.getLogger(__name__)
+
+
+class BytecodeCache(FileSystemBytecodeCache):
+  """FileSystemBytecodeCache that writes each file atomically, so workers
+  starting together never read one half-written, and that carries on
+  without writing when the directory is read-only (a slug compiled at
+  build time). Files are keyed by template name only, not Jinja's default
+  of name plus absolute path, so a cache compiled in a build directory
+  still matches when the app runs from another; a template whose source
+  changed is recompiled either way, as the cache checks its checksum.
+  """
+
+  def get_cache_key(self, name, filename=None):
+    return super().get_cache_key(name)
+
+  def dump_bytecode(self, bucket):
+    try:
+      fd, path = tempfile.mkstemp(dir=self.directory, prefix='.tmp-')
+    except OSError as e:
+      logger.warning('cannot write template bytecode to %s: %s', self.directory, e)
+      return
+    try:
+      with os.fdopen(fd, 'wb') as f:
+        bucket.write_bytecode(f)
+      os.replace(path, self._get_cache_filename(bucket))
+    except OSError as e:
+      logger.warning('cannot write template bytecode to %s: %s', self.directory, e)
+      try:
+        os.remove(path)
+      except OSError:
+        pass
+
+
+def template_names(app):
+  """Every page template of the app, not the static files next to them."""
+  return sorted(app.jinja_env.list_templates(extensions=['html']))
+
+
+def compile_all(app):
+  """Loads every template, which compiles it and fills the bytecode cache.
+  Returns {name: seconds}; raises TemplateSyntaxError on a broken one."""
+  timings = {}
+  for name in template_names(app):
+    started = time.perf_counter()
+    app.jinja_env.get_template(name)
+    timings[name] = time.perf_counter() - started
+  return timings
+
+
+def warm_up(app):
+  """Loads every template and the datetime filter's patterns and locale
+  data into this process. Returns the number of templates; a broken
+  template is logged, not raised, so the worker still starts and serves
+  the other pages."""
+  count = 0
+  for name in template_names(app):
+    try:
+      app.jinja_env.get_template(name)
+      count += 1
+    except TemplateSyntaxError:
+      logger.exception('cannot compile template %s', name)
+  # Babel reads its locale data on first use, not when the pattern is
+  # compiled; formatting one value loads it
+  locale = app.config.get('DATETIME_LOCALE', 'en')
+  now = datetime.now(timezone.utc)
+  for format in formatting.FORMATS:
+    formatting.format_datetime(now, format, locale)
+  return count
+
+
+def init_app(app):
+  directory = app.config.get('TEMPLATE_BYTECODE_DIR')
+  if not directory:
+    return
+  try:
+    os.makedirs(directory, exist_ok=True)
+  except OSError as e:
+    logger.warning('template bytecode cache off, cannot create %s: %s', directory, e)
+    return
+  app.jinja_env.bytecode_cache = BytecodeCache(directory)
@@ -0,0 +1,74 @@
+import os
+from datetime import datetime, timedelta, timezone
+import pytest
+import config
+from models import db, Artist, ArtistGenre, Show, Venue, VenueGenre
+
+#----------------------------------------------------------------------------#
+# Test setup.
+#
+#   TEST_DATABASE_URL=postgresql://... python -m pytest
+#
+# runs the tests against that database, which must be migrated (flask db
+# upgrade) and may be written to. Without it they run against a fresh
+# SQLite file and the PostgreSQL-only ones are skipped.
+#----------------------------------------------------------------------------#
+
+@pytest.fixture(scope='session')
+def app(tmp_path_factory):
+  url = os.environ.get('TEST_DATABASE_URL')
+  # the app reads its configuration when it is imported
+  config.SQLALCHEMY_DATABASE_URI = url or f"sqlite:///{tmp_path_factory.mktemp('db') / 'fyyur.db'}"
+  from app import app
+  app.config['TESTING'] = True
+  if url is None:
+    with app.app_context():
+      db.create_all()
+  return app
+
+
+@pytest.fixture
+def context(app):
+  with app.app_context():
+    try:
+      yield app
+    finally:
+      db.session.rollback()
+      db.session.close()
+
+
+@pytest.fixture
+def postgresql(context):
+  if db.engine.dialect.name != 'postgresql':
+    pytest.skip('needs PostgreSQL (set TEST_DATABASE_URL)')
+  return context
+
+
+@pytest.fixture(scope='session')
+def catalog(app):
+  """A few venues, artists and shows, past and upcoming, added unless
+  venue 1, artist 1 and some shows exist; skips if they still do not."""
+  with app.app_context():
+    try:
+      if (db.session.get(Venue, 1) is None or db.session.get(Artist, 1) is None
+          or Show.query.first() is None):
+        venues = [Venue(name=f'Test Venue {index}', city='San Francisco', state='CA',
+                        seeking_talent=False, genres=[VenueGenre(category='Jazz')])
+                  for index in range(3)]
+        artists = [Artist(name=f'Test Artist {index}', city='San Francisco', state='CA',
+                          seeking_venue=False, genres=[ArtistGenre(category='Rock')])
+                   for index in range(2)]
+        db.session.add_all(venues + artists)
+        db.session.commit()
+        now = datetime.now(timezone.utc)
+        db.session.add_all(
+          Show(venue_id=venues[index % 3].id, artist_id=artists[index % 2].id,
+               start_time=now + timedelta(days=index - 3))
+          for index in range(6)
+        )
+        db.session.commit()
+      if db.session.get(Venue, 1) is None or db.session.get(Artist, 1) is None:
+        pytest.skip('needs venue 1 and artist 1')
+    finally:
+      db.session.close()
+  return app
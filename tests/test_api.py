@@ -0,0 +1,17 @@
+from datetime import datetime
+
+
+def start_times(data):
+  return [datetime.fromisoformat(show['start_time']) for show in data]
+
+
+def test_show_start_times_are_utc_on_every_endpoint(catalog):
+  client = catalog.test_client()
+  shows = client.get('/api/v1/shows').get_json()['data']
+  assert shows
+  show = client.get(f"/api/v1/shows/{shows[0]['id']}").get_json()['data']
+  venue = client.get(f"/api/v1/venues/{shows[0]['venue_id']}?embed=shows").get_json()['data']
+  embedded = venue['past_shows'] + venue['upcoming_shows']
+  for start_time in start_times(shows) + start_times([show]) + start_times(embedded):
+    assert start_time.utcoffset() is not None
+  assert show['start_time'] == shows[0]['start_time']
@@ -0,0 +1,65 @@
+import threading
+import time
+import uuid
+from datetime import datetime, timedelta, timezone
+import pytest
+import counters
+from models import db, Artist, Show, Venue
+
+
+@pytest.fixture
+def starting_shows(context):
+  """A venue and an artist with three shows that start in a second, so
+  that roll_forward() only finds them due once they have."""
+  suffix = uuid.uuid4().hex[:8]
+  venue = Venue(name=f'Counter Venue {suffix}', city='San Francisco', state='CA',
+                seeking_talent=False)
+  artist = Artist(name=f'Counter Artist {suffix}', city='San Francisco', state='CA',
+                  seeking_venue=False)
+  db.session.add_all([venue, artist])
+  db.session.commit()
+  start = datetime.now(timezone.utc) + timedelta(seconds=1)
+  db.session.add_all(Show(venue_id=venue.id, artist_id=artist.id,
+                          start_time=start + timedelta(minutes=index)) for index in range(3))
+  db.session.commit()
+  ids = venue.id, artist.id
+  time.sleep(1 + (start - datetime.now(timezone.utc)).total_seconds())
+  yield ids
+  db.session.rollback()
+  Show.query.filter(Show.venue_id == ids[0]).delete(synchronize_session=False)
+  Venue.query.filter(Venue.id == ids[0]).delete(synchronize_session=False)
+  Artist.query.filter(Artist.id == ids[1]).delete(synchronize_session=False)
+  db.session.commit()
+
+
+def counts(ids):
+  db.session.expire_all()
+  venue_id, artist_id = ids
+  return [(item.num_upcoming_shows, item.num_past_shows)
+          for item in (db.session.get(Venue, venue_id), db.session.get(Artist, artist_id))]
+
+
+def test_roll_forward_moves_started_shows(starting_shows):
+  # the shows start a minute apart; only the first has started
+  assert counters.roll_forward() >= 1
+  db.session.commit()
+  assert counts(starting_shows) == [(2, 1), (2, 1)]
+
+
+def test_overlapping_roll_forwards_move_each_show_once(app, postgresql, starting_shows):
+  def second_run():
+    with app.app_context():
+      try:
+        counters.roll_forward()
+        db.session.commit()
+      finally:
+        db.session.close()
+
+  # the first run holds its rows while the second one starts
+  counters.roll_forward()
+  thread = threading.Thread(target=second_run)
+  thread.start()
+  time.sleep(0.5)
+  db.session.commit()
+  thread.join()
+  assert counts(starting_shows) == [(2, 1), (2, 1)]
@@ -0,0 +1,139 @@
+import os
+import pytest
+import ids
+from benchmarks.ids import run_processes, run_threads
+from models import db
+
+# short leases, so those the tests leave behind run out soon
+LEASE_SECONDS = 5
+
+
+def assert_unique_and_increasing(takes):
+  seen = set()
+  total = 0
+  for taken, _ in takes:
+    assert all(later > earlier for earlier, later in zip(taken, taken[1:])), \
+      "a worker's ids went down"
+    seen.update(taken)
+    total += len(taken)
+  assert len(seen) == total, f'{total - len(seen)} of {total} ids handed out twice'
+
+
+@pytest.fixture
+def use_generator(app):
+  previous = app.extensions['show_ids']
+
+  def use(generator):
+    app.extensions['show_ids'] = generator
+  yield use
+  app.extensions['show_ids'] = previous
+
+
+class StepClock:
+  """A clock that returns the given times, then keeps returning the last."""
+
+  def __init__(self, *times):
+    self.times = list(times)
+
+  def __call__(self):
+    return self.times.pop(0) if len(self.times) > 1 else self.times[0]
+
+
+#----------------------------------------------------------------------------#
+# Concurrency.
+#----------------------------------------------------------------------------#
+
+def test_sequence_ids_are_unique_across_threads(postgresql, use_generator):
+  use_generator(ids.SequenceAllocator('shows_id_seq', block_size=10))
+  takes, _ = run_threads(postgresql, threads=4, count=500, batch=25)
+  assert_unique_and_increasing(takes)
+
+
+def test_sequence_ids_are_unique_across_forked_processes(postgresql, use_generator):
+  use_generator(ids.SequenceAllocator('shows_id_seq', block_size=10))
+  takes, _ = run_processes(postgresql, processes=3, count=500, batch=25)
+  assert_unique_and_increasing(takes)
+
+
+def test_snowflake_ids_are_unique_across_threads(context, use_generator):
+  use_generator(ids.SnowflakeGenerator(lease_seconds=LEASE_SECONDS))
+  takes, _ = run_threads(context, threads=4, count=5000, batch=100)
+  assert_unique_and_increasing(takes)
+
+
+def test_snowflake_ids_are_unique_across_forked_processes(context, use_generator):
+  use_generator(ids.SnowflakeGenerator(lease_seconds=LEASE_SECONDS))
+  takes, _ = run_processes(context, processes=3, count=5000, batch=100)
+  assert_unique_and_increasing(takes)
+
+
+#----------------------------------------------------------------------------#
+# Snowflake clock and counter.
+#----------------------------------------------------------------------------#
+
+def test_snowflake_carries_on_when_the_clock_steps_back():
+  start = ids.EPOCH.timestamp() + 1000
+  generator = ids.SnowflakeGenerator(3, clock=StepClock(start, start - 5))
+  first = generator.allocate(1)
+  later = generator.allocate(3)
+  assert first[0] < later[0] < later[1] < later[2]
+  assert ids.timestamp(later[-1]) == ids.timestamp(first[0])
+
+
+def test_snowflake_borrows_the_next_millisecond_when_the_counter_runs_out():
+  start = ids.EPOCH.timestamp() + 1000
+  generator = ids.SnowflakeGenerator(3, clock=StepClock(start))
+  taken = generator.allocate(ids.MAX_COUNTER + 2)
+  assert len(set(taken)) == len(taken)
+  assert taken == sorted(taken)
+  millis = [value >> (ids.WORKER_BITS + ids.COUNTER_BITS) for value in taken]
+  assert millis[-1] == millis[0] + 1
+  assert all(value >> ids.COUNTER_BITS & ids.MAX_WORKER_ID == 3 for value in taken)
+
+
+#----------------------------------------------------------------------------#
+# Snowflake worker ids.
+#----------------------------------------------------------------------------#
+
+def test_leased_worker_ids_are_not_shared(postgresql):
+  generators = [ids.SnowflakeGenerator(lease_seconds=LEASE_SECONDS) for _ in range(3)]
+  for generator in generators:
+    generator.allocate(1)
+  assert len({generator.worker_id for generator in generators}) == 3
+
+
+def test_a_lost_lease_is_replaced(postgresql):
+  generator = ids.SnowflakeGenerator(lease_seconds=LEASE_SECONDS)
+  before = generator.allocate(1)
+  lost = generator.worker_id
+  # another process took the id after the lease ran out
+  with db.engine.begin() as connection:
+    connection.execute(db.text(
+      "UPDATE show_id_workers SET holder = 'elsewhere', expires_at = now() + interval '5 seconds' "
+      'WHERE worker_id = :worker_id'
+    ), {'worker_id': lost})
+  generator.leased_at -= LEASE_SECONDS
+  after = generator.allocate(1)
+  assert generator.worker_id != lost
+  assert after[0] > before[0]
+
+
+def test_configured_worker_id_is_refused_after_a_fork():
+  generator = ids.SnowflakeGenerator(7)
+  generator.allocate(1)
+  pid = os.fork()
+  if pid == 0:
+    try:
+      generator.allocate(1)
+    except RuntimeError:
+      os._exit(0)
+    os._exit(1)
+  _, status = os.waitpid(pid, 0)
+  assert os.WEXITSTATUS(status) == 0
+  # the process that read it goes on using it
+  assert generator.allocate(1)
+
+
+def test_worker_id_out_of_range():
+  with pytest.raises(ValueError):
+    ids.SnowflakeGenerator(ids.MAX_WORKER_ID + 1)
@@ -0,0 +1,66 @@
+import json
+import uuid
+import pytest
+import search
+from importer import run_import
+from models import db, Venue, VenueGenre
+
+
+def venue_row(name):
+  return {
+    'name': name, 'city': 'San Francisco', 'state': 'CA', 'address': '1 Market St',
+    'phone': '4155550123', 'genres': ['Jazz'], 'facebook_link': 'https://facebook.com/venue',
+    'website_link': 'https://venue.example.com', 'seeking_talent': False,
+  }
+
+
+@pytest.fixture
+def names(context):
+  names = [f'Import Venue {uuid.uuid4().hex[:8]}' for _ in range(3)]
+  yield names
+  db.session.rollback()
+  ids = db.session.query(Venue.id).filter(Venue.name.in_(names))
+  VenueGenre.query.filter(VenueGenre.venue_id.in_(ids.scalar_subquery())).delete(
+    synchronize_session=False)
+  Venue.query.filter(Venue.name.in_(names)).delete(synchronize_session=False)
+  db.session.commit()
+
+
+def test_import_rejects_lines_that_are_not_json_objects(names, tmp_path):
+  lines = [
+    json.dumps(venue_row(names[0])),
+    '{"name": "Broken',
+    json.dumps(['not', 'a', 'row']),
+    json.dumps(venue_row(names[1])),
+    '"a string"',
+    json.dumps(venue_row(names[2])),
+  ]
+  path = tmp_path / 'venues.jsonl'
+  path.write_text('\n'.join(lines) + '\n')
+
+  report = run_import('venues', str(path), batch_size=2)
+
+  assert (report.accepted, report.rejected) == (3, 3)
+  imported = {name for name, in db.session.query(Venue.name).filter(Venue.name.in_(names))}
+  assert imported == set(names)
+  rejects = [json.loads(line) for line in (tmp_path / 'venues.jsonl.rejects.jsonl').open()]
+  assert [reject['line'] for reject in rejects] == [2, 3, 5]
+  assert rejects[0]['errors']['row'][0].startswith('invalid JSON')
+  assert rejects[0]['row'] == '{"name": "Broken'
+  assert rejects[1]['errors'] == {'row': ['expected a JSON object, got list']}
+  assert rejects[2]['errors'] == {'row': ['expected a JSON object, got str']}
+
+
+def test_imported_names_are_searchable(app, names, tmp_path):
+  # an in-process index built before the import, as a running worker has
+  engine = search.NgramSearch()
+  engine.index_for(Venue)
+  previous, app.extensions['search'] = app.extensions['search'], engine
+  try:
+    path = tmp_path / 'venues.jsonl'
+    path.write_text(''.join(json.dumps(venue_row(name)) + '\n' for name in names))
+    run_import('venues', str(path))
+    for name in names:
+      assert list(engine.index_for(Venue).search(name)), name
+  finally:
+    app.extensions['search'] = previous
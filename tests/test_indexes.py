@@ -0,0 +1,55 @@
+from datetime import datetime, timezone
+import pytest
+from commands import explain
+from models import db, Show
+
+# the venue/artist page lookups and the owner column their index must lead
+# with: (owner, start_time), or (owner, during) from the booking checks. On the
+# partitioned table every partition has its own copy, named after it
+# (shows_2026_10_venue_id_start_time_idx)
+LOOKUPS = [
+  ('future shows by venue', 'venue_id_',
+   lambda now: Show.query.filter(Show.venue_id == -1, Show.start_time > now)),
+  ('past shows by venue', 'venue_id_',
+   lambda now: Show.query.filter(Show.venue_id == -1, Show.start_time < now)),
+  ('future shows by artist', 'artist_id_',
+   lambda now: Show.query.filter(Show.artist_id == -1, Show.start_time > now)),
+  ('past shows by artist', 'artist_id_',
+   lambda now: Show.query.filter(Show.artist_id == -1, Show.start_time < now)),
+]
+
+
+@pytest.fixture
+def analyzed_shows(postgresql):
+  """Shows spread over many venues and artists, analyzed, inside the test's
+  transaction: on empty or unanalyzed partitions every index costs the same
+  and the planner may as well take the
+  other owner's index."""
+  for statement in (
+    "INSERT INTO venues (id, name, seeking_talent) "
+    "SELECT -n, 'Plan Venue ' || n, false FROM generate_series(1, 100) AS n",
+    "INSERT INTO artists (id, name, seeking_venue) "
+    "SELECT -n, 'Plan Artist ' || n, false FROM generate_series(1, 100) AS n",
+    # an hour apart, from before the first partition to after the last
+    "INSERT INTO shows (venue_id, artist_id, start_time, end_time) "
+    "SELECT -(n % 100 + 1), -(n / 7 % 100 + 1), t, t + interval '1 hour' "
+    "FROM generate_series(0, 11999) AS n, "
+    "LATERAL (SELECT date_trunc('month', now()) + (n - 1000) * interval '1 hour' AS t) AS times",
+    'ANALYZE shows',
+  ):
+    db.session.execute(db.text(statement))
+  return postgresql
+
+
+@pytest.mark.parametrize('name, index, lookup', LOOKUPS, ids=[name for name, _, _ in LOOKUPS])
+def test_show_lookups_use_an_owner_index(analyzed_shows, name, index, lookup):
+  # with seq scans priced out, the planner only picks one when no index
+  # can serve the predicate
+  db.session.execute(db.text('SET LOCAL enable_seqscan = off'))
+  plan = explain(lookup(datetime.now(timezone.utc)))
+  text = '\n'.join(plan)
+  assert 'Seq Scan' not in text, text
+  index_scans = [line for line in plan if 'Index Scan' in line or 'Index Only Scan' in line]
+  assert index_scans, text
+  for line in index_scans:
+    assert index in line, text
@@ -0,0 +1,79 @@
+import json
+import os
+import metrics
+
+
+def make_registry():
+  registry = metrics.Registry()
+  counter = metrics.Counter('jobs_total', 'Jobs.', ('kind',), registry=registry)
+  histogram = metrics.Histogram('job_seconds', 'Job time.', buckets=(1.0,), registry=registry)
+  metrics.Gauge('queue_depth', 'Queue depth.', lambda: 5, registry=registry)
+  return registry, counter, histogram
+
+
+def samples(merged, name):
+  return {tuple(labels): value for labels, value in merged[name]['samples']}
+
+
+def run_worker(directory, jobs):
+  """Forks a process that counts jobs, writes its snapshot and exits."""
+  pid = os.fork()
+  if pid == 0:
+    registry, counter, histogram = make_registry()
+    for _ in range(jobs):
+      counter.labels('import').inc()
+      histogram.observe(0.5)
+    metrics.write_snapshot(str(directory), registry)
+    os._exit(0)
+  os.waitpid(pid, 0)
+
+
+def test_exited_workers_are_folded_and_deleted(tmp_path):
+  run_worker(tmp_path, 2)
+  run_worker(tmp_path, 3)
+  registry, counter, _ = make_registry()
+  counter.labels('import').inc()
+  metrics.write_snapshot(str(tmp_path), registry)
+
+  for _ in range(2):
+    merged = metrics.merge_snapshots(str(tmp_path))
+    assert samples(merged, 'jobs_total') == {('import',): 6}
+    assert samples(merged, 'job_seconds')[()][1] == 2.5
+    # only the running process's gauge
+    assert samples(merged, 'queue_depth') == {(): 5}
+
+  snapshots = sorted(name for name in os.listdir(tmp_path) if name.endswith('.json'))
+  assert snapshots == sorted([metrics.EXITED, metrics._snapshot_name[1]])
+
+
+def test_reused_pid_does_not_overwrite_the_earlier_snapshot(tmp_path):
+  # an earlier process with this pid, which has since exited
+  registry, counter, _ = make_registry()
+  counter.labels('import').inc(4)
+  with open(tmp_path / f'{os.getpid()}-1.json', 'w') as f:
+    json.dump(registry.collect(), f)
+  registry, counter, _ = make_registry()
+  counter.labels('import').inc()
+  metrics.write_snapshot(str(tmp_path), registry)
+
+  merged = metrics.merge_snapshots(str(tmp_path))
+  assert samples(merged, 'jobs_total') == {('import',): 5}
+  assert samples(merged, 'queue_depth') == {(): 5}
+  assert not (tmp_path / f'{os.getpid()}-1.json').exists()
+
+
+def test_snapshot_folded_before_a_crash_is_not_added_twice(tmp_path):
+  run_worker(tmp_path, 2)
+  [name] = [name for name in os.listdir(tmp_path) if name.endswith('.json')]
+  metrics.fold_exited(str(tmp_path))
+  # as if the process folding it had died before deleting it
+  registry, counter, _ = make_registry()
+  counter.labels('import').inc(2)
+  (tmp_path / name).write_text(json.dumps(registry.collect()))
+  state = json.loads((tmp_path / metrics.EXITED).read_text())
+  state['folded'] = [name]
+  (tmp_path / metrics.EXITED).write_text(json.dumps(state))
+
+  merged = metrics.merge_snapshots(str(tmp_path))
+  assert samples(merged, 'jobs_total') == {('import',): 2}
+  assert not (tmp_path / name).exists()
@@ -0,0 +1,26 @@
+import pytest
+from profiler import ROUTE_QUERY_BUDGETS, assert_max_queries
+
+
+@pytest.fixture
+def client(catalog):
+  # a cached page runs no queries at all
+  page_cache = catalog.extensions.get('page_cache')
+  catalog.extensions['page_cache'] = None
+  try:
+    yield catalog.test_client()
+  finally:
+    catalog.extensions['page_cache'] = page_cache
+
+
+@pytest.mark.parametrize('path, limit', ROUTE_QUERY_BUDGETS.items())
+def test_route_stays_within_query_budget(client, path, limit):
+  with assert_max_queries(limit):
+    response = client.get(path)
+  assert response.status_code == 200
+
+
+def test_route_over_budget_fails(client):
+  with pytest.raises(AssertionError, match='expected at most 0 queries'):
+    with assert_max_queries(0):
+      client.get('/venues/1')
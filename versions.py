@@ -0,0 +1,107 @@
+import hashlib
+import os
+from datetime import timezone
+from models import (
+  db,
+  utcnow,
+  Venue,
+  Artist,
+  Show
+)
+
+#----------------------------------------------------------------------------#
+# Resource versions for conditional GET.
+#
+# Every venue/artist/show row carries updated_at. Besides direct writes, it
+# is bumped when something the row's page shows changes:
+#   - counters.py updates the venue and artist of every added, moved or
+#     removed show (updated_at is onupdate, so those UPDATEs bump it);
+#   - touch() is called by the edit handlers for genre edits and for the
+#     pages that show the edited entity's name and image.
+# Versions are read with one small query: the row's updated_at for an
+# entity page, max(updated_at) over the index for a listing.
+#----------------------------------------------------------------------------#
+
+class Version:
+  """An ETag plus the Last-Modified time it was derived from."""
+
+  def __init__(self, etag, last_modified):
+    self.etag = etag
+    self.last_modified = last_modified
+
+
+def _etag(*parts):
+  raw = '|'.join(str(part) for part in parts)
+  return hashlib.sha1(raw.encode()).hexdigest()[:20]
+
+
+def _utc(value):
+  if value is not None and value.tzinfo is None:
+    return value.replace(tzinfo=timezone.utc)
+  return value
+
+
+def touch(venue_ids=(), artist_ids=()):
+  """Bumps updated_at on the given rows; the caller commits."""
+  now = utcnow()
+  for model, ids in ((Venue, venue_ids), (Artist, artist_ids)):
+    ids = set(ids)
+    if ids:
+      db.session.execute(
+        model.__table__.update().where(model.__table__.c.id.in_(ids)).values(updated_at=now)
+      )
+
+
+def entity_version(model, item_id):
+  """The version of a venue/artist page, or None if there is no such row."""
+  updated_at = db.session.query(model.updated_at).filter(model.id == item_id).scalar()
+  if updated_at is None:
+    return None
+  return Version(_etag(model.__tablename__, item_id, updated_at.isoformat()),
+                 _utc(updated_at))
+
+
+def listing_version(model):
+  """The version of a page listing every row of model.
+
+  The row count is part of it, since deleting a row does not move
+  max(updated_at).
+  """
+  updated_at, count = db.session.query(
+    db.func.max(model.updated_at), db.func.count(model.id)
+  ).one()
+  stamp = updated_at.isoformat() if updated_at is not None else ''
+  return Version(_etag(model.__tablename__, stamp, count), _utc(updated_at))
+
+
+def shows_version():
+  """The version of the /shows listing.
+
+  A page shows the venue and artist of each show, so it depends on all
+  three tables. Removing a show bumps its venue and artist, so deletes
+  move the version too.
+  """
+  latest = [
+    db.session.query(db.func.max(model.updated_at)).scalar_subquery()
+    for model in (Show, Venue, Artist)
+  ]
+  stamps = [_utc(value) for value in db.session.query(*latest).one() if value is not None]
+  last_modified = max(stamps) if stamps else None
+  stamp = last_modified.isoformat() if last_modified is not None else ''
+  return Version(_etag('shows', stamp), last_modified)
+
+
+def template_digest(app):
+  """A short hash of the templates' contents, so that deploying changed
+  templates changes every ETag while hosts running the same templates
+  agree on them."""
+  root = os.path.join(app.root_path, app.template_folder)
+  digest = hashlib.sha1()
+  for directory, dirs, files in os.walk(root):
+    dirs.sort()
+    for name in sorted(files):
+      path = os.path.join(directory, name)
+      digest.update(os.path.relpath(path, root).encode())
+      with open(path, 'rb') as f:
+        digest.update(f.read())
+  return digest.hexdigest()[:8]
@@ -0,0 +1,11 @@
+#----------------------------------------------------------------------------#
+# WSGI entry point for production servers:
+#
+#   gunicorn -c gunicorn.conf.py wsgi:app
+#
+# app.py's app.run() is the development server only.
+#----------------------------------------------------------------------------#
+
+from app import app
+
+application = app